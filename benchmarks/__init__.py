@@ -0,0 +1,8 @@
+"""Benchmarks of the hot paths of the server, every module is run from the repository root with python -m:
+
+ - benchmarks.load: concurrent games with several players each against the running app, over the game websocket.
+ - benchmarks.micro: placing mines, flood fill and serializing boards and messages.
+ - benchmarks.flood_fill: the breadth first flood fill against the recursive ones it replaced.
+ - benchmarks.sqlite_schema: spot lookups and updates of the UUID and the integer key db_spot schema, which held
+   the games before the event log of gameStore.py.
+"""
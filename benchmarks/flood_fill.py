@@ -0,0 +1,137 @@
+"""Micro-benchmark of opening a zero spot: the breadth first Game.flood_fill against the recursive flood fill that
+worked on the same arrays and against the recursive flood fill that worked on db_spot rows.
+
+Run from the repository root with:
+    python -m benchmarks.flood_fill
+"""
+import sys
+from time import perf_counter
+from statistics import median
+
+from tortoise import Tortoise, fields, run_async
+from tortoise.contrib.pydantic import pydantic_model_creator
+from tortoise.models import Model
+
+from src.minesweeper import Minesweeper, Game
+
+SIZES = [(10, 10), (30, 30), (60, 60)]
+REPEATS = 20
+
+
+class db_spot(Model):
+    """The table games were stored in before the event log of gameStore.py, one row per spot."""
+    id = fields.IntField(pk=True)
+    code = fields.SmallIntField()
+    col = fields.SmallIntField()
+    row = fields.SmallIntField()
+    opened = fields.BooleanField(default=False)
+    mine = fields.BooleanField()
+    n_mines = fields.SmallIntField()
+    flagged = fields.BooleanField(default=False)
+
+    class Meta:
+        unique_together = (("code", "col", "row"),)
+
+
+spot_pydantic = pydantic_model_creator(db_spot, exclude_readonly=True, name="spot_pydantic")
+
+
+def make_game(n_cols: int, n_rows: int) -> Game:
+    ms = Minesweeper(n_cols, n_rows, n_rows // 2, n_cols // 2)
+    ms.place_mines(max(1, n_cols * n_rows // 12))
+    return Game.from_minesweeper(1, ms)
+
+
+def recursive_fill(game: Game, col: int, row: int) -> list:
+    """The flood fill Game.open used before, a depth first recursion over the arrays."""
+    opened = []
+
+    def open_zeros(col: int, row: int):
+        if game.n_mines[col, row] != 0:
+            game.opened[col, row] = True
+            opened.append((col, row))
+        elif not game.opened[col, row] and not game.flagged[col, row]:
+            game.opened[col, row] = True
+            opened.append((col, row))
+            for nb in [(col-1, row-1), (col, row-1), (col+1, row-1), (col-1, row),
+                       (col+1, row), (col-1, row+1), (col, row+1), (col+1, row+1)]:
+                if game.in_bounds(*nb) and not game.opened[nb] and not game.flagged[nb]:
+                    open_zeros(*nb)
+
+    open_zeros(col, row)
+    return opened
+
+
+async def database_fill(code: int, col: int, row: int, size: tuple) -> list:
+    """The flood fill field.open used before, a depth first recursion with one query per spot."""
+    opened = []
+
+    async def update_opened(col: int, row: int):
+        await db_spot.filter(code=code, col=col, row=row).update(opened=True)
+        spot = await spot_pydantic.from_queryset_single(db_spot.get(code=code, col=col, row=row))
+        return spot.dict()
+
+    async def open_zeros(spot: dict):
+        col, row = spot["col"], spot["row"]
+        n_cols, n_rows = size
+        if spot["n_mines"] != 0:
+            opened.append(await update_opened(col, row))
+        elif spot["opened"] == False and spot["flagged"] == False:
+            opened.append(await update_opened(col, row))
+            for nb in [(col-1, row-1), (col, row-1), (col+1, row-1), (col-1, row),
+                       (col+1, row), (col-1, row+1), (col, row+1), (col+1, row+1)]:
+                if 0 <= nb[0] < n_rows and 0 <= nb[1] < n_cols:
+                    nb = await spot_pydantic.from_queryset_single(db_spot.get(code=code, col=nb[0], row=nb[1]))
+                    nb = nb.dict()
+                    if nb["opened"] == False and nb["flagged"] == False:
+                        await open_zeros(nb)
+
+    spot = await spot_pydantic.from_queryset_single(db_spot.get(code=code, col=col, row=row))
+    await open_zeros(spot.dict())
+    return opened
+
+
+def time_in_memory(fill, game: Game, col: int, row: int) -> tuple:
+    times = []
+    for _ in range(REPEATS):
+        game.opened[:] = False
+        start = perf_counter()
+        n_opened = len(fill(col, row))
+        times.append(perf_counter() - start)
+    return median(times), n_opened
+
+
+async def time_database(game: Game, col: int, row: int) -> tuple:
+    await Tortoise.init(db_url="sqlite://:memory:", modules={"models": [__name__]})
+    await Tortoise.generate_schemas()
+    await db_spot.bulk_create([
+        db_spot(code=game.code, col=c, row=r, mine=bool(game.mines[c, r]), n_mines=int(game.n_mines[c, r]))
+        for c in range(game.n_rows) for r in range(game.n_cols)])
+    start = perf_counter()
+    n_opened = len(await database_fill(game.code, col, row, (game.n_cols, game.n_rows)))
+    elapsed = perf_counter() - start
+    await Tortoise.close_connections()
+    return elapsed, n_opened
+
+
+def main():
+    sys.setrecursionlimit(100_000)
+    print(f"{'board':>8} {'opened':>7} {'bfs [ms]':>10} {'recursive [ms]':>15} {'database [ms]':>14}")
+    for n_cols, n_rows in SIZES:
+        game = make_game(n_cols, n_rows)
+        col, row = n_rows // 2, n_cols // 2
+        bfs, n_opened = time_in_memory(game.flood_fill, game, col, row)
+        recursive, _ = time_in_memory(lambda c, r: recursive_fill(game, c, r), game, col, row)
+        game.opened[:] = False
+        database = [None]
+
+        async def run():
+            database[0] = (await time_database(game, col, row))[0]
+        run_async(run())
+        game.events.clear()
+        print(f"{n_cols}x{n_rows:<5} {n_opened:>7} {bfs * 1e3:>10.3f} {recursive * 1e3:>15.3f} "
+              f"{database[0] * 1e3:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
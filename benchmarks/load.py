@@ -0,0 +1,221 @@
+"""Load test of the websocket game loop: starts the app of main.py on a local port with an empty database and plays
+N concurrent games with M players each over /ws/game/{code}.
+
+Every player keeps the board up to date from the compact protocol messages and plays its own share of the spots, so
+players of the same game do not undo each other: it opens safe spots, flags mines and chords numbers whose mines are
+all flagged. The latency of an action is the time from sending it until the player received the change it caused.
+At the end the p50/p99 latency per action, the throughput and the number of database queries per action
+(from the metrics of the app, see src/models/metrics.py) are printed.
+
+With --spectators every game is also watched over /ws/watch/{code}, to see what watching costs the players.
+
+Run from the repository root with:
+    python -m benchmarks.load --games 20 --players 4 --actions 50 --spectators 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+from collections import defaultdict
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from urllib.request import Request, urlopen
+
+import websockets
+
+from src.minesweeper.geometry import geometry
+from src.models.protocol import unpack_board
+
+TIMEOUT = 10
+WEIGHTS = {"open": 5, "flag": 3, "chord": 2}
+
+
+def count_queries() -> int:
+    """Returns the number of database queries the app made so far, from its metrics."""
+    from src.models.metrics import metrics
+
+    return sum(count for _, _, count in metrics.queries.series.values())
+
+
+class Player:
+    """One simulated player of a game."""
+
+    def __init__(self, index: int, n_players: int, n_actions: int):
+        self.index = index
+        self.n_players = n_players
+        self.n_actions = n_actions
+        self.board = None
+        self.over = False
+        self.changed = asyncio.Condition()
+        self.latencies = defaultdict(list)
+        self.timeouts = 0
+
+    async def receive(self, ws):
+        async for text in ws:
+            message = json.loads(text)
+            if "board" in message:
+                board = unpack_board(message["board"])
+                self.n_cols = message["board"]["n_cols"]
+                self.neighbors = geometry(self.n_cols, message["board"]["n_rows"]).neighbors
+                self.board = {name: array.ravel().tolist() for name, array in board.items()}
+            if self.board is not None:
+                for i in message.get("opened", []):
+                    self.board["opened"][i] = True
+                for i in message.get("flagged", []):
+                    self.board["flagged"][i] = True
+                for i in message.get("unflagged", []):
+                    self.board["flagged"][i] = False
+            if "status" in message:
+                self.over = True
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def wait_for(self, predicate):
+        async with self.changed:
+            await asyncio.wait_for(self.changed.wait_for(lambda: self.over or predicate()), TIMEOUT)
+
+    def choose(self):
+        """Picks the next action, its flat index and the condition that shows the server applied it."""
+        mines, opened, flagged, numbers = (self.board[name] for name in ("mines", "opened", "flagged", "numbers"))
+        own = range(self.index, len(mines), self.n_players)
+        choices = {
+            "open": [i for i in own if not mines[i] and not opened[i] and not flagged[i]],
+            "flag": [i for i in own if mines[i] and not flagged[i]],
+            "chord": [i for i in own if opened[i] and numbers[i] and
+                      all(flagged[nb] for nb in self.neighbors[i] if mines[nb]) and
+                      any(not opened[nb] and not mines[nb] for nb in self.neighbors[i])]
+        }
+        actions = [action for action in WEIGHTS if choices[action]]
+        if not actions:
+            return None
+        action = random.choices(actions, [WEIGHTS[action] for action in actions])[0]
+        index = random.choice(choices[action])
+        if action == "open":
+            return action, index, lambda: opened[index]
+        if action == "flag":
+            return action, index, lambda: flagged[index]
+        return action, index, lambda: all(opened[nb] for nb in self.neighbors[index] if not mines[nb])
+
+    async def play(self, url: str, start: bool):
+        async with websockets.connect(url, max_size=None) as ws:
+            receiver = asyncio.create_task(self.receive(ws))
+            if start:
+                await ws.send(json.dumps({"intent": "open", "col": 8, "row": 8}))
+            async with self.changed:
+                await asyncio.wait_for(self.changed.wait_for(lambda: self.board is not None), TIMEOUT)
+            for _ in range(self.n_actions):
+                choice = None if self.over else self.choose()
+                if choice is None:
+                    break
+                action, index, applied = choice
+                col, row = divmod(index, self.n_cols)
+                message = {"intent": "open", "col": col, "row": row}
+                if action == "flag":
+                    message["intent"] = "flag"
+                elif action == "chord":
+                    message["double_click"] = True
+                sent = perf_counter()
+                await ws.send(json.dumps(message))
+                try:
+                    await self.wait_for(applied)
+                    self.latencies[action].append(perf_counter() - sent)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+            receiver.cancel()
+
+
+async def watch(url: str, received: list, done: asyncio.Event):
+    """A spectator, counts the messages it gets until done is set."""
+    async with websockets.connect(url, max_size=None) as ws:
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(ws.recv(), 0.1)
+                received[0] += 1
+            except asyncio.TimeoutError:
+                pass
+
+
+def create_game(port: int, code: int):
+    data = json.dumps({"code": code, "n_cols": 30, "n_rows": 16, "solvable": False, "n_mines": 99}).encode()
+    request = Request(f"http://127.0.0.1:{port}/create", data=data, headers={"content-type": "application/json"})
+    return json.loads(urlopen(request).read())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(times: list, p: float) -> float:
+    return sorted(times)[min(len(times) - 1, int(len(times) * p))]
+
+
+async def run(n_games: int, n_players: int, n_actions: int, n_spectators: int):
+    import uvicorn
+    from main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws="websockets"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    codes = random.sample(range(1, 30000), n_games)
+    for code in codes:
+        await asyncio.get_running_loop().run_in_executor(None, create_game, port, code)
+    spectated, done = [0], asyncio.Event()
+    spectators = [asyncio.create_task(watch(f"ws://127.0.0.1:{port}/ws/watch/{code}", spectated, done))
+                  for code in codes for _ in range(n_spectators)]
+    # every spectator gets the board first
+    while spectated[0] < len(spectators):
+        await asyncio.sleep(0.05)
+    spectated[0] = 0
+    queries = count_queries()
+
+    players = [[Player(i, n_players, n_actions) for i in range(n_players)] for _ in codes]
+    start = perf_counter()
+    await asyncio.gather(*[player.play(f"ws://127.0.0.1:{port}/ws/game/{code}?protocol=compact", i == 0)
+                           for code, game in zip(codes, players) for i, player in enumerate(game)])
+    elapsed = perf_counter() - start
+    n_queries = count_queries() - queries
+    done.set()
+    await asyncio.gather(*spectators)
+
+    server.should_exit = True
+    await serving
+
+    latencies = defaultdict(list)
+    for player in (player for game in players for player in game):
+        for action, times in player.latencies.items():
+            latencies[action] += times
+    n_done = sum(len(times) for times in latencies.values())
+    print(f"{n_games} games x {n_players} players and {n_spectators} spectators, up to {n_actions} actions per player")
+    print(f"{'action':<8}{'count':>8}{'p50 [ms]':>10}{'p99 [ms]':>10}")
+    for action, times in sorted(latencies.items()):
+        print(f"{action:<8}{len(times):>8}{median(times) * 1e3:>10.2f}{percentile(times, 0.99) * 1e3:>10.2f}")
+    print(f"throughput: {n_done / elapsed:.0f} actions/s over {elapsed:.2f} s")
+    print(f"database queries per action: {n_queries / max(n_done, 1):.2f}")
+    print(f"timeouts: {sum(player.timeouts for game in players for player in game)}")
+    if n_spectators:
+        print(f"messages per spectator: {spectated[0] / (n_games * n_spectators):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--actions", type=int, default=50)
+    parser.add_argument("--spectators", type=int, default=0, help="spectators per game")
+    args = parser.parse_args()
+    with TemporaryDirectory() as directory:
+        # the app opens the database when main is imported
+        os.environ["DATABASE"] = os.path.join(directory, "minesweeper.sql")
+        asyncio.run(run(args.games, args.players, args.actions, args.spectators))
+
+
+if __name__ == "__main__":
+    main()
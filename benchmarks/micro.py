@@ -0,0 +1,75 @@
+"""Micro-benchmarks of the hot paths of a move: placing the mines of a new board, opening a zero with the flood fill
+and serializing the board and the opened spots in both protocols, and of hints: building them for a board and
+asking again for the same version.
+
+Run from the repository root with:
+    python -m benchmarks.micro
+"""
+from statistics import median
+from time import perf_counter
+
+from src.minesweeper import Minesweeper, Game
+from src.minesweeper.hints import HintEngine
+from src.models.protocol import pack_board
+from src.models.socketManager import serialize
+
+SIZES = [(9, 9, 10), (30, 16, 99), (60, 60, 600)]
+REPEATS = 50
+
+
+def timed(function, setup=None) -> float:
+    """Returns the median time of function in ms, setup runs untimed before every call."""
+    times = []
+    for _ in range(REPEATS):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return median(times) * 1e3
+
+
+def largest_zero(game: Game) -> tuple:
+    """Returns the zero spot whose flood fill opens the most spots, so every size measures a large fill."""
+    best, best_size = (0, 0), -1
+    for col, row in zip(*((game.n_mines == 0) & ~game.mines).nonzero()):
+        if game.opened[col, row]:
+            continue
+        size = len(game.flood_fill(col, row))
+        if size > best_size:
+            best, best_size = (int(col), int(row)), size
+    game.opened[:] = False
+    return best
+
+
+def main():
+    print(f"{'board':>10} {'place_mines':>12} {'flood fill':>11} {'field json':>11} {'board compact':>14} "
+          f"{'opened json':>12} {'opened compact':>15} {'hint build':>11} {'hint cached':>12}   [ms]")
+    for n_cols, n_rows, n_mines in SIZES:
+        ms = Minesweeper(n_cols, n_rows, n_rows // 2, n_cols // 2)
+        place = timed(lambda: ms.place_mines(n_mines))
+
+        game = Game.from_minesweeper(1, ms)
+        col, row = largest_zero(game)
+        opened = []
+
+        def reset():
+            game.opened[:] = False
+            game.events.clear()
+
+        fill = timed(lambda: opened.append(game.flood_fill(col, row)), reset)
+        indices = opened[-1]
+        field = timed(lambda: serialize({"field": game.field()}))
+        board = timed(lambda: serialize({"board": pack_board(game)}))
+        opened_json = timed(lambda: serialize({"opened": game.spots(indices)}))
+        # the message GameActor.compact_message makes for a batch with a single open
+        opened_compact = timed(lambda: serialize({"opened": indices.tolist()}))
+        build = timed(lambda: HintEngine(game).hint())
+        engine = HintEngine(game)
+        cached = timed(engine.hint)
+        print(f"{n_cols}x{n_rows:<7} {place:>12.3f} {fill:>11.3f} {field:>11.3f} {board:>14.3f} "
+              f"{opened_json:>12.3f} {opened_compact:>15.3f} {build:>11.3f} {cached:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
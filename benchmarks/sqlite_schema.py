@@ -0,0 +1,114 @@
+"""Benchmark of spot lookups and updates with 1,000 games stored, for the first db_spot schema (UUID keys, no index,
+default journal) against the second one (integer keys, unique index on (code, col, row), WAL and synchronous=NORMAL).
+Both were replaced by the snapshots and the event log of gameStore.py.
+
+The queries are the ones the app makes: a spot by code, col and row, all spots of a game, and the batched updates of
+the write-behind flush. Both databases are files in a temporary directory, so journaling and syncing are measured too.
+
+Run from the repository root with:
+    python -m benchmarks.sqlite_schema
+"""
+import os
+import random
+import sqlite3
+import uuid
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from src.models.migrations import MINESWEEPER_TABLE, PRAGMAS, SPOT_TABLE
+
+N_GAMES = 1000
+N_COLS, N_ROWS = 16, 16
+REPEATS = 500
+
+OLD_SCHEMA = [
+    """CREATE TABLE "db_minesweeper" ("id" CHAR(36) NOT NULL PRIMARY KEY, "code" SMALLINT NOT NULL UNIQUE,
+    "n_cols" SMALLINT NOT NULL, "n_rows" SMALLINT NOT NULL, "solvable" INT NOT NULL, "n_mines" SMALLINT NOT NULL)""",
+    """CREATE TABLE "db_spot" ("id" CHAR(36) NOT NULL PRIMARY KEY, "code" SMALLINT NOT NULL, "col" SMALLINT NOT NULL,
+    "row" SMALLINT NOT NULL, "opened" INT NOT NULL, "mine" INT NOT NULL, "n_mines" SMALLINT NOT NULL,
+    "flagged" INT NOT NULL)"""
+]
+
+
+def fill(db: sqlite3.Connection, uuid_keys: bool):
+    spots = []
+    for code in range(N_GAMES):
+        for col in range(N_ROWS):
+            for row in range(N_COLS):
+                spot = (code, col, row, 0, random.random() < 0.15, random.randint(0, 8), 0)
+                spots.append((str(uuid.uuid4()),) + spot if uuid_keys else spot)
+    if uuid_keys:
+        db.executemany('INSERT INTO db_spot VALUES (?, ?, ?, ?, ?, ?, ?, ?)', spots)
+    else:
+        db.executemany('INSERT INTO db_spot ("code", "col", "row", "opened", "mine", "n_mines", "flagged") '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?)', spots)
+    db.commit()
+
+
+def timed(db: sqlite3.Connection, query: str, make_args, commit: bool = False) -> list:
+    times = []
+    for _ in range(REPEATS):
+        args = make_args()
+        start = perf_counter()
+        db.execute(query, args).fetchall()
+        if commit:
+            db.commit()
+        times.append((perf_counter() - start) * 1000)
+    return times
+
+
+def spot_args():
+    return random.randrange(N_GAMES), random.randrange(N_ROWS), random.randrange(N_COLS)
+
+
+def run(path: str, schema: list, pragmas: dict, uuid_keys: bool) -> dict:
+    db = sqlite3.connect(path)
+    for pragma, value in pragmas.items():
+        db.execute(f"PRAGMA {pragma}={value}")
+    for create in schema:
+        db.execute(create)
+    fill(db, uuid_keys)
+    ids = [pk for pk, in db.execute("SELECT id FROM db_spot")]
+
+    def batch_args():
+        # the flush updates up to a few hundred spots of one game by their keys
+        code = random.randrange(N_GAMES)
+        return ids[code * N_COLS * N_ROWS:(code + 1) * N_COLS * N_ROWS][:random.randint(1, 200)]
+
+    results = {
+        "spot lookup": timed(db, 'SELECT * FROM db_spot WHERE code=? AND col=? AND row=?', spot_args),
+        "game load": timed(db, 'SELECT id, col, row, mine, n_mines, opened, flagged FROM db_spot WHERE code=?',
+                           lambda: (random.randrange(N_GAMES),)),
+        "spot update": timed(db, 'UPDATE db_spot SET opened=1 WHERE code=? AND col=? AND row=?', spot_args, True),
+    }
+    batch = []
+    for _ in range(REPEATS):
+        args = batch_args()
+        start = perf_counter()
+        db.execute(f'UPDATE db_spot SET opened=1 WHERE id IN ({",".join("?" * len(args))})', args)
+        db.commit()
+        batch.append((perf_counter() - start) * 1000)
+    results["batch update"] = batch
+    db.close()
+    return results
+
+
+def percentile(times: list, p: float) -> float:
+    return sorted(times)[min(len(times) - 1, int(len(times) * p))]
+
+
+def main():
+    print(f"{N_GAMES} games of {N_COLS}x{N_ROWS} spots, {REPEATS} queries each, times in ms (p50 / p99)")
+    with TemporaryDirectory() as directory:
+        old = run(os.path.join(directory, "old.sql"), OLD_SCHEMA, {}, True)
+        new = run(os.path.join(directory, "new.sql"), [MINESWEEPER_TABLE, SPOT_TABLE], PRAGMAS, False)
+    print(f"{'query':<14}{'old schema':>22}{'new schema':>22}")
+    for query in old:
+        print(f"{query:<14}"
+              f"{median(old[query]):>12.3f} / {percentile(old[query], 0.99):<7.3f}"
+              f"{median(new[query]):>12.3f} / {percentile(new[query], 0.99):<7.3f}")
+
+
+if __name__ == "__main__":
+    main()
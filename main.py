@@ -4,12 +4,19 @@ from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-from src.routers import field, general, websockets
+from src.routers import field, general, metrics, websockets
+from src.models.gameStore import store
+from src.models.boardPool import boards
+from src.models.eventBus import bus
+from src.models.lifecycle import lifecycle
+from src.models.metrics import metrics as app_metrics
+from src.models.migrations import db_url, migrate
 
 app = FastAPI()
 app.include_router(general.router)
 app.include_router(field.router)
 app.include_router(websockets.router)
+app.include_router(metrics.router)
 
 templates = Jinja2Templates(directory="src/templates")
 
@@ -26,8 +33,23 @@ def main_page(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+@app.on_event("startup")
+async def start_background():
+    lifecycle.start()
+    app_metrics.instrument_database()
+
+
+@app.on_event("shutdown")
+async def flush_games():
+    await lifecycle.close()
+    await store.close()
+    boards.close()
+    await bus.close()
+
+
+migrate()
 register_tortoise(app,
-                  db_url="sqlite://database/minesweeper.sql",
+                  db_url=db_url(),
                   modules={"models": ["src.models.db"]},
                   generate_schemas=True,
                   add_exception_handlers=True)
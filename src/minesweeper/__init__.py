@@ -1,2 +1,3 @@
 from .minesweeper import Minesweeper
 from .spot import Spot
+from .game import Game
@@ -0,0 +1,410 @@
+from collections import deque
+from typing import Optional
+
+from numpy import arange, array, concatenate, empty, intp, ones, stack, unique, zeros, ndarray
+
+from .geometry import OFFSETS, TABLE_SPOTS, geometry
+
+# the kinds of the actions in the event log of a game
+OPEN, CHORD, FLAG = 0, 1, 2
+# the number of recent changes every game keeps to bring reconnecting players up to date
+HISTORY = 256
+# the side of the square tiles a board is split into, for viewports
+TILE = 32
+# rings of the flood fill with at least this many zeros are opened with numpy instead of spot by spot, see reveal
+RING_SPOTS = 32
+# the column and row offsets of the neighbors of a spot plus one, for the numpy rings of the flood fill
+OFFSET_COLS, OFFSET_ROWS = array(OFFSETS).T + 1
+
+
+def tiles_in(n_cols: int, n_rows: int, col: int, row: int, width: int, height: int) -> list:
+    """Returns the tiles that overlap a rectangle of a board, see Game.tile_of.
+
+    Args:
+        n_cols (int): The number of columns of the board
+        n_rows (int): The number of rows of the board
+        col (int): The first column of the rectangle
+        row (int): The first row of the rectangle
+        width (int): The number of rows the rectangle spans, like n_cols of a board
+        height (int): The number of columns the rectangle spans, like n_rows of a board
+
+    Returns:
+        list[int]: The ids of the tiles, empty if the rectangle is outside of the board
+    """
+    tile_rows = -(-n_cols // TILE)
+    c0, c1 = max(col, 0) // TILE, min(col + height, n_rows)
+    r0, r1 = max(row, 0) // TILE, min(row + width, n_cols)
+    if c1 <= 0 or r1 <= 0:
+        return []
+    return [c * tile_rows + r for c in range(c0, (c1 - 1) // TILE + 1) for r in range(r0, (r1 - 1) // TILE + 1)]
+
+
+class Game:
+    """The in-memory state of a running minesweeper game.
+
+    The state is held in numpy arrays indexed [col, row] just like Minesweeper.field, so every array has the shape
+    (n_rows, n_cols). All game logic runs on these arrays, the database is only written to afterwards: every action
+    that changes the game is recorded as an event, see gameStore.py.
+
+    Attributes:
+     - code [int]: The code that identifies the game.
+     - mines [ndarray[bool]]: True where a spot holds a mine.
+     - n_mines [ndarray[int]]: The number of neighboring mines of every spot.
+     - opened [ndarray[bool]]: True where a spot was opened by the players.
+     - flagged [ndarray[bool]]: True where a spot is flagged.
+     - game_id [int | None]: The id of the db_minesweeper row of the board, it tells apart the boards a code had.
+     - seq [int]: The number of actions that changed the game since its board was made, the version of the game.
+     - events [list[Tuple[int, int, int]]]: The actions (kind, col, row) that were not persisted yet, one per seq.
+     - history [deque[Tuple[int, ndarray[int]]]]: The kind of each of the last HISTORY actions and the flat indices
+       of the spots it changed.
+     - safe_left [int]: The number of spots without a mine that are not opened yet.
+     - flags [int]: The number of flagged spots.
+    The counters are counted once when the game is made and kept up to date by open_spots and flag.
+    """
+
+    def __init__(self, code: int, mines: ndarray, n_mines: ndarray, opened: ndarray = None, flagged: ndarray = None):
+        self.code = code
+        self.mines = mines.astype(bool)
+        self.n_mines = n_mines.astype("int16")
+        self.opened = zeros(self.mines.shape, dtype=bool) if opened is None else opened.astype(bool)
+        self.flagged = zeros(self.mines.shape, dtype=bool) if flagged is None else flagged.astype(bool)
+        self.n_rows, self.n_cols = self.mines.shape
+        self.game_id: Optional[int] = None
+        self.seq = 0
+        self.events: list = []
+        self.history: deque = deque(maxlen=HISTORY)
+        self.total_mines = int(self.mines.sum())
+        self.safe_left = int((~self.mines & ~self.opened).sum())
+        self.flags = int(self.flagged.sum())
+
+    @classmethod
+    def from_minesweeper(cls, code: int, ms):
+        """Makes a new game out of a Minesweeper board that already has its mines placed.
+
+        Args:
+            code (int): The code of the game
+            ms (Minesweeper): The board with the mines placed
+
+        Returns:
+            Game: The game with all spots closed and unflagged
+        """
+        return cls(code, ms.mines, ms.neighbor_mines)
+
+    def flat_index(self, col: int, row: int) -> int:
+        return col * self.n_cols + row
+
+    def tile_of(self, indices: ndarray) -> ndarray:
+        """Returns the tile of every flat index. Tiles are TILE x TILE squares numbered like the spots, tile_rows
+        tiles per column."""
+        cols, rows = divmod(indices, self.n_cols)
+        return cols // TILE * -(-self.n_cols // TILE) + rows // TILE
+
+    @property
+    def n_tiles(self) -> int:
+        return -(-self.n_rows // TILE) * -(-self.n_cols // TILE)
+
+    def tile_bounds(self, tile: int) -> tuple:
+        """Returns the columns [c0, c1) and rows [r0, r1) of a tile as (c0, c1, r0, r1)."""
+        c, r = divmod(tile, -(-self.n_cols // TILE))
+        return c * TILE, min((c + 1) * TILE, self.n_rows), r * TILE, min((r + 1) * TILE, self.n_cols)
+
+    def in_bounds(self, col: int, row: int) -> bool:
+        return 0 <= col < self.n_rows and 0 <= row < self.n_cols
+
+    def spot(self, col: int, row: int) -> dict:
+        """Returns a spot as a dictionary, the shape the json protocol sends spots in.
+
+        Args:
+            col (int): The column of the spot
+            row (int): The row of the spot
+
+        Returns:
+            dict: The spot with code, col, row, opened, mine, n_mines and flagged
+        """
+        return {
+            "code": self.code,
+            "col": col,
+            "row": row,
+            "opened": bool(self.opened[col, row]),
+            "mine": bool(self.mines[col, row]),
+            "n_mines": int(self.n_mines[col, row]),
+            "flagged": bool(self.flagged[col, row])
+        }
+
+    def field(self) -> list:
+        """Returns every spot of the game, ordered by flat index.
+
+        Returns:
+            list[dict]: The spots as dictionaries, see spot
+        """
+        return [self.spot(col, row) for col in range(self.n_rows) for row in range(self.n_cols)]
+
+    def won(self) -> bool:
+        """Returns True if every spot without a mine is opened."""
+        return self.safe_left == 0
+
+    def counters(self) -> dict:
+        """Returns the counters that are sent to the players along with every change.
+
+        Returns:
+            dict: safe_left, flags and mines_left, the number of mines minus the number of flags
+        """
+        return {"safe_left": self.safe_left, "flags": self.flags, "mines_left": self.total_mines - self.flags}
+
+    def flood_fill(self, col: int, row: int) -> ndarray:
+        """Opens a spot and, if it has no neighboring mines, every spot that is connected to it over other zeros.
+        Flagged and already opened spots are never opened.
+
+        Args:
+            col (int): The column of the spot to open
+            row (int): The row of the spot to open
+
+        Returns:
+            ndarray[int]: The flat indices of all spots that were opened
+        """
+        return self.reveal(array([self.flat_index(col, row)]))
+
+    def reveal(self, seeds: ndarray) -> ndarray:
+        """Opens every closed spot of seeds and every spot that is connected to one of them over zeros, ring by ring
+        in a breadth first search from the seeds, so any number of seeds is filled in a single pass.
+
+        Every spot is looked at once per neighboring zero, the cost grows with the number of opened spots and not with
+        the size of the board. Small rings, like the ones of narrow corridors between numbers, are opened spot by spot
+        in python, large rings, like the ones of the first move on a giant board, with one numpy step per ring.
+
+        Args:
+            seeds (ndarray[int]): The flat indices of the spots to open, none of them may hold a mine
+
+        Returns:
+            ndarray[int]: The flat indices of all spots that were opened, in ascending order
+        """
+        # flat views, so opening a spot in them opens it in the arrays of the game
+        opened, flagged = self.opened.reshape(-1), self.flagged.reshape(-1)
+        n_mines, mines = self.n_mines.reshape(-1), self.mines.reshape(-1)
+        seeds = unique(seeds)
+        seeds = seeds[~opened[seeds] & ~flagged[seeds]]
+        opened[seeds] = True
+        found = [seeds]
+        ring = seeds[(n_mines[seeds] == 0) & ~mines[seeds]]
+        slots = None
+        while len(ring):
+            if len(ring) < RING_SPOTS:
+                ring = self._open_ring_small(ring.tolist(), found)
+            else:
+                if slots is None:
+                    slots = empty(len(opened), dtype=intp)
+                new = self._open_ring(ring, slots)
+                found.append(new)
+                ring = new[(n_mines[new] == 0) & ~mines[new]]
+        revealed = concatenate(found)
+        revealed.sort()
+        # only spots without a mine spread, so everything revealed is safe
+        self.safe_left -= len(revealed)
+        return revealed
+
+    def _open_ring(self, ring: ndarray, slots: ndarray) -> ndarray:
+        """Opens the closed neighbors of a ring of zeros with numpy and returns their flat indices. slots is scratch
+        space with one entry per spot, the neighbors of the ring are deduplicated in it."""
+        opened, flagged = self.opened.reshape(-1), self.flagged.reshape(-1)
+        cols, rows = divmod(ring, self.n_cols)
+        # whether each spot of the ring has a column or row before it, itself and after it, indexed by offset + 1
+        has_col = stack((cols > 0, ones(len(ring), dtype=bool), cols < self.n_rows - 1), axis=1)
+        has_row = stack((rows > 0, ones(len(ring), dtype=bool), rows < self.n_cols - 1), axis=1)
+        inside = has_col[:, OFFSET_COLS] & has_row[:, OFFSET_ROWS]
+        neighbors = (ring[:, None] + (OFFSET_COLS - 1) * self.n_cols + (OFFSET_ROWS - 1))[inside]
+        # most neighbors were opened by the ring before, they are dropped before the duplicates are
+        new = neighbors[~opened[neighbors] & ~flagged[neighbors]]
+        opened[new] = True
+        # every spot keeps the position it was written to last, so exactly one of its copies is kept
+        positions = arange(len(new))
+        slots[new] = positions
+        return new[slots[new] == positions]
+
+    def _open_ring_small(self, ring: list, found: list) -> ndarray:
+        """Opens the closed neighbors of a small ring of zeros spot by spot and appends their flat indices to found.
+        Goes on with the next rings as long as they stay small.
+
+        Returns:
+            ndarray[int]: The zeros of the first ring that is too large, empty if the fill is done
+        """
+        n_cols, n_rows = self.n_cols, self.n_rows
+        # memoryviews read and write single spots of the arrays many times faster than indexing them
+        opened, flagged = memoryview(self.opened.reshape(-1)), memoryview(self.flagged.reshape(-1))
+        n_mines, mines = memoryview(self.n_mines.reshape(-1)), memoryview(self.mines.reshape(-1))
+        # boards up to TABLE_SPOTS spots read the neighbors from the shared geometry, larger ones have no tables
+        table = geometry(n_cols, n_rows).neighbors if n_cols * n_rows <= TABLE_SPOTS else None
+        inner = [dc * n_cols + dr for dc, dr in OFFSETS]
+        new = []
+        while ring and len(ring) < RING_SPOTS:
+            next_ring = []
+            for i in ring:
+                if table is not None:
+                    neighbors = table[i]
+                else:
+                    col, row = divmod(i, n_cols)
+                    if 0 < col < n_rows - 1 and 0 < row < n_cols - 1:
+                        neighbors = [i + d for d in inner]
+                    else:
+                        neighbors = [(col + dc) * n_cols + row + dr for dc, dr in OFFSETS
+                                     if 0 <= col + dc < n_rows and 0 <= row + dr < n_cols]
+                for j in neighbors:
+                    if not opened[j] and not flagged[j]:
+                        opened[j] = True
+                        new.append(j)
+                        if n_mines[j] == 0 and not mines[j]:
+                            next_ring.append(j)
+            ring = next_ring
+        found.append(array(new, dtype=intp))
+        return array(ring, dtype=intp)
+
+    def record(self, kind: int, col: int, row: int, changed: ndarray):
+        """Appends an action that changed the game to its events and the spots it changed to its history."""
+        self.seq += 1
+        self.events.append((kind, col, row))
+        self.history.append((kind, changed))
+
+    def changes_since(self, version: int) -> Optional[tuple]:
+        """Returns what changed after a version of the game, from its history.
+
+        Args:
+            version (int): The seq the game had
+
+        Returns:
+            Tuple[ndarray[int], list[int], list[int]] | None: The flat indices of the spots that were opened, flagged
+            and unflagged since, or None if the history does not reach back to the version
+        """
+        if not 0 <= self.seq - version <= len(self.history):
+            return None
+        changes = list(self.history)[len(self.history) - (self.seq - version):]
+        opened = [changed for kind, changed in changes if kind != FLAG]
+        # a spot that was flagged and unflagged again counts as unchanged
+        toggled = {}
+        for kind, changed in changes:
+            if kind == FLAG:
+                toggled[int(changed[0])] = not toggled.get(int(changed[0]), False)
+        flagged = [i for i, odd in sorted(toggled.items()) if odd and self.flagged.ravel()[i]]
+        unflagged = [i for i, odd in sorted(toggled.items()) if odd and not self.flagged.ravel()[i]]
+        return (concatenate(opened) if opened else zeros(0, dtype=int)), flagged, unflagged
+
+    def replay(self, events: list):
+        """Applies actions of the event log again, to rebuild a game from a snapshot. The replayed actions are
+        already persisted, so they are not kept in events, but they count towards seq.
+
+        Args:
+            events (List[Tuple[int, int, int]]): The actions (kind, col, row) in the order they were made
+        """
+        for kind, col, row in events:
+            if kind == OPEN:
+                self.open_spots(col, row)
+            elif kind == CHORD:
+                self.chord_spots(col, row)
+            else:
+                self.flag(col, row)
+        self.events.clear()
+
+    def open_spots(self, col: int, row: int) -> tuple:
+        """Opens a spot and every spot that is opened along with it, because it neighbors a zero.
+
+        Args:
+            col (int): The column of the spot to open
+            row (int): The row of the spot to open
+
+        Returns:
+            Tuple[str, ndarray[int]]: "lost", "won" or "playing" and the flat indices of the opened spots
+        """
+        if self.mines[col, row] and not self.flagged[col, row]:
+            return "lost", zeros(0, dtype=int)
+        opened = self.flood_fill(col, row)
+        if len(opened):
+            self.record(OPEN, col, row, opened)
+        return ("won" if self.won() else "playing"), opened
+
+    def chord_spots(self, col: int, row: int) -> tuple:
+        """Opens every closed neighbor of an opened number that has as many flags around it as it has mines, together
+        with every spot that is opened along with them. The neighbors come from the shared geometry of the board size.
+
+        Args:
+            col (int): The column of the opened number
+            row (int): The row of the opened number
+
+        Returns:
+            Tuple[str, ndarray[int]]: "lost", "won" or "playing" and the flat indices of the opened spots
+        """
+        if not self.opened[col, row] or self.n_mines[col, row] == 0:
+            return "playing", zeros(0, dtype=int)
+        neighbors = geometry(self.n_cols, self.n_rows).neighbors_of(self.flat_index(col, row))
+        flagged = self.flagged.ravel()[neighbors]
+        if flagged.sum() != self.n_mines[col, row]:
+            return "playing", zeros(0, dtype=int)
+        closed = neighbors[~flagged & ~self.opened.ravel()[neighbors]]
+        if self.mines.ravel()[closed].any():
+            return "lost", zeros(0, dtype=int)
+        opened = self.reveal(closed)
+        if len(opened):
+            self.record(CHORD, col, row, opened)
+        return ("won" if self.won() else "playing"), opened
+
+    def spots(self, indices: ndarray) -> list:
+        """Returns the spots at flat indices as dictionaries, see spot."""
+        return [self.spot(*divmod(i, self.n_cols)) for i in indices.tolist()]
+
+    def open(self, col: int, row: int):
+        """Opens a spot like open_spots does.
+
+        Args:
+            col (int): The column of the spot to open
+            row (int): The row of the spot to open
+
+        Returns:
+            list[dict] | dict: The list of opened spots, or a status dictionary if the game is lost or won
+        """
+        return self.open_response(*self.open_spots(col, row))
+
+    def chord(self, col: int, row: int):
+        """Opens the neighbors of a spot like chord_spots does.
+
+        Args:
+            col (int): The column of the opened number
+            row (int): The row of the opened number
+
+        Returns:
+            list[dict] | dict: The list of opened spots, or a status dictionary if the game is lost or won
+        """
+        return self.open_response(*self.chord_spots(col, row))
+
+    def open_response(self, status: str, opened: ndarray):
+        """Turns the result of open_spots into the response of the open route.
+
+        Args:
+            status (str): "lost", "won" or "playing"
+            opened (ndarray[int]): The flat indices of the opened spots
+
+        Returns:
+            list[dict] | dict: The list of opened spots, or a status dictionary if the game is lost or won
+        """
+        if status == "lost":
+            # TODO define better return value for frontend
+            return {"game_status": "lost"}
+        if status == "won":
+            return {"status": "You Won!"}
+        return self.spots(opened)
+
+    def flag(self, col: int, row: int) -> dict:
+        """Toggles the flag on a spot that is not opened yet.
+
+        Args:
+            col (int): The column of the spot
+            row (int): The row of the spot
+
+        Returns:
+            dict: "success" if the flag was set, "remove" if it was removed, or a status if the spot is opened
+        """
+        if self.opened[col, row]:
+            # TODO define better return value for frontend
+            return {"status": "Spot is already opened"}
+        self.flagged[col, row] = not self.flagged[col, row]
+        self.flags += 1 if self.flagged[col, row] else -1
+        self.record(FLAG, col, row, array([self.flat_index(col, row)]))
+        if self.flagged[col, row]:
+            return {"success": True, "col": col, "row": row}
+        return {"remove": True, "col": col, "row": row}
@@ -0,0 +1,118 @@
+"""The geometry of a board: which spots neighbor which. It only depends on the size of a board, so it is computed
+once per size and shared by every game, solver and hint engine of that size, see geometry.
+
+Spots are addressed by their flat index col * n_cols + row, like everywhere else.
+"""
+from functools import cached_property, lru_cache
+from typing import List, Optional
+
+from numpy import arange, array, full, intp, ndarray, zeros
+
+# the offsets of the eight neighbors of a spot, as (col, row)
+OFFSETS = [(dc, dr) for dc in (-1, 0, 1) for dr in (-1, 0, 1) if (dc, dr) != (0, 0)]
+# the largest board neighbors_of looks up in the table, the table of a board of 64x64 spots takes 256 kB. Larger
+# boards are played tile by tile, only single spots are chorded on them and a table would take 64 MB per million spots
+TABLE_SPOTS = 64 * 64
+
+
+class Geometry:
+    """The neighbor tables of a board size. They are built the first time they are used and must not be changed.
+
+     - table [ndarray[int]]: The flat indices of the neighbors of every spot, shape (n_spots, 8). The neighbors of
+       a spot come first, the rest of its row is -1, so table[i, :counts[i]] are the neighbors of spot i.
+     - counts [ndarray[int8]]: The number of neighbors of every spot, 8 inside the board and 5 or 3 on its border.
+     - neighbors [List[List[int]]]: The table as lists, for the loops of Solver and HintEngine over sets of ints.
+    """
+
+    def __init__(self, n_cols: int, n_rows: int) -> None:
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        self.n_spots = n_cols * n_rows
+
+    @cached_property
+    def table(self) -> ndarray:
+        # numpy indexes with intp, a table of another type would be converted on every lookup
+        index = full((self.n_rows + 2, self.n_cols + 2), -1, dtype=intp)
+        index[1:-1, 1:-1] = arange(self.n_spots).reshape(self.n_rows, self.n_cols)
+        table = zeros((self.n_spots, len(OFFSETS)), dtype=intp)
+        for k, (dc, dr) in enumerate(OFFSETS):
+            table[:, k] = index[1+dc:self.n_rows+1+dc, 1+dr:self.n_cols+1+dr].ravel()
+        # a stable sort on "is padding" moves the neighbors to the front and keeps them in the order of OFFSETS
+        table[:] = table[arange(self.n_spots)[:, None], (table < 0).argsort(axis=1, kind="stable")]
+        return table
+
+    @cached_property
+    def counts(self) -> ndarray:
+        return (self.table >= 0).sum(axis=1).astype("int8")
+
+    @cached_property
+    def count_list(self) -> List[int]:
+        return self.counts.tolist()
+
+    @cached_property
+    def neighbors(self) -> List[List[int]]:
+        return [nbs[:count] for nbs, count in zip(self.table.tolist(), self.count_list)]
+
+    def neighbors_of(self, index: int) -> ndarray:
+        """Returns the flat indices of the neighbors of a spot, in the same order as in table. On boards up to
+        TABLE_SPOTS spots they are a view into table, on larger boards they are worked out from the spot alone."""
+        if self.n_spots <= TABLE_SPOTS:
+            return self.table[index, :self.count_list[index]]
+        col, row = divmod(index, self.n_cols)
+        return array([(col + dc) * self.n_cols + row + dr for dc, dr in OFFSETS
+                      if 0 <= col + dc < self.n_rows and 0 <= row + dr < self.n_cols], dtype=intp)
+
+
+@lru_cache(maxsize=32)
+def geometry(n_cols: int, n_rows: int) -> Geometry:
+    """Returns the shared Geometry of a board size. The 32 sizes used last are kept. The tables of a board of
+    TABLE_SPOTS spots take less than 2 MB, the neighbors lists included.
+
+    Args:
+        n_cols (int): The number of columns of the board
+        n_rows (int): The number of rows of the board
+
+    Returns:
+        Geometry: The neighbor tables of every board of that size
+    """
+    return Geometry(n_cols, n_rows)
+
+
+def count_neighbors(mask: ndarray) -> ndarray:
+    """Counts for every spot how many of its up to eight neighbors are True in mask, with a shifted sum over a
+    zero padded copy of the mask.
+
+    Args:
+        mask (ndarray[bool]): The 2d mask to count, usually the mines of a board
+
+    Returns:
+        ndarray[int8]: The number of True neighbors of every spot, the spot itself not included
+    """
+    padded = zeros((mask.shape[0] + 2, mask.shape[1] + 2), dtype="int8")
+    padded[1:-1, 1:-1] = mask
+    # sum up the three columns first and then the three rows of that, which gives the sum of the 3x3 square
+    cols = padded[:-2] + padded[1:-1] + padded[2:]
+    square = cols[:, :-2] + cols[:, 1:-1] + cols[:, 2:]
+    return square - padded[1:-1, 1:-1]
+
+
+def dilate(mask: ndarray, out: Optional[ndarray] = None) -> ndarray:
+    """Grows a 2d boolean mask by one spot in every direction, diagonals included.
+
+    Args:
+        mask (ndarray[bool]): The mask to grow
+        out (ndarray[bool], optional): The array to write the grown mask to, a new one if left out. Must not be mask
+
+    Returns:
+        ndarray[bool]: The mask that is also True next to every True spot of mask, out if it was given
+    """
+    if out is None:
+        out = mask.copy()
+    else:
+        out[:] = mask
+    # with overlapping operands numpy reads the values from before the update, so each line grows by one both ways
+    out[1:, :] |= out[:-1, :]
+    out[:-1, :] |= out[1:, :]
+    out[:, 1:] |= out[:, :-1]
+    out[:, :-1] |= out[:, 1:]
+    return out
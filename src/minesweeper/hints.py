@@ -0,0 +1,412 @@
+from math import lgamma
+from typing import Dict, List, NamedTuple, Optional, Set
+from weakref import WeakKeyDictionary, ref
+
+from numpy import arange, array, clip, convolve, exp, flatnonzero, inf, isfinite, ndarray, zeros
+
+from .game import Game
+from .geometry import dilate, geometry
+
+
+def log_comb(n: int, k: int) -> float:
+    """Returns the logarithm of n choose k, -inf if it is zero."""
+    if not 0 <= k <= n:
+        return -inf
+    return lgamma(n + 1) - lgamma(k + 1) - lgamma(n - k + 1)
+
+
+class Component(NamedTuple):
+    """A group of closed spots next to opened numbers that shares no constraint with the other groups, and its
+    mine placements.
+
+    Attributes:
+     - spots [List[int]]: The flat indices of the closed spots.
+     - constraints [List[int]]: The flat indices of the opened numbers next to them.
+     - counts [ndarray[float] | None]: The number of placements with k mines, by k. None if the component was too
+       large to enumerate.
+     - mine_counts [ndarray[float] | None]: How often every spot holds a mine in the placements with k mines, shaped
+       (k, spot).
+     - safe [List[int]]: The spots that are safe in every placement.
+     - mines [List[int]]: The spots that are mines in every placement.
+    """
+    spots: List[int]
+    constraints: List[int]
+    counts: Optional[ndarray]
+    mine_counts: Optional[ndarray]
+    safe: List[int]
+    mines: List[int]
+
+
+class TooLarge(Exception):
+    """Raised when a component has too many states to be enumerated."""
+
+
+class HintEngine:
+    """Mine probabilities of the closed spots of a game, from what the players see: the opened spots and their
+    numbers. Flags are only the guesses of the players, they are not used.
+
+    The constraints are modeled like in Solver: every opened number with closed neighbors needs its number of mines
+    among them. They are kept up to date from the spots each change opened (see Game.changes_since) and the single
+    spot rule of Solver takes the spots they decide out of them, which cuts long walls of numbers into short pieces.
+    The closed spots that are left next to constraints are grouped into components that share no constraint. Every
+    component is enumerated once, its placements counted by the number of mines, and kept until a change reaches one
+    of its constraints, so a move only enumerates the components around it again.
+
+    The counts of the components are combined with the ways to place the rest of the mines on the spots no number
+    constrains, so the probabilities are exact. Frontiers too large for that are weighted as if their components
+    were independent, see independent, and components too large to enumerate are estimated, see estimate. The hint of
+    a version of the game is cached, so asking again before the next change costs nothing.
+
+    The engine only holds a weak reference to its game, so the engine of a game in engines does not keep the game
+    alive after it was evicted or deleted.
+    """
+
+    def __init__(self, game: Game, max_states: int = 2000, max_combine: int = 10 ** 7):
+        self._game = ref(game)
+        self.nbrs = geometry(game.n_cols, game.n_rows).neighbors
+        self.numbers = game.n_mines.ravel()
+        self.max_states = max_states
+        self.max_combine = max_combine
+        # the undecided closed neighbors of every opened number that has some, and how many mines they hold
+        self.unknown: Dict[int, Set[int]] = {}
+        self.need: Dict[int, int] = {}
+        # the closed spots the numbers decide
+        self.safe: Set[int] = set()
+        self.mines: Set[int] = set()
+        self.components: Dict[int, Component] = {}
+        self.component_of: Dict[int, int] = {}
+        self.next_id = 0
+        self.seq: Optional[int] = None
+        self.cached: Optional[dict] = None
+        self.enumerated = 0
+
+    @property
+    def game(self) -> Game:
+        return self._game()
+
+    def hint(self) -> dict:
+        """Returns the hint for the current version of the game.
+
+        Returns:
+            dict: The flat indices of the closed spots next to opened numbers with their mine probabilities, the safe
+            spots and the mines among them, and the probability of every other closed spot, see protocol.py
+        """
+        if self.cached is not None and self.seq == self.game.seq:
+            return self.cached
+        changes = None if self.seq is None else self.game.changes_since(self.seq)
+        if changes is None:
+            self.rebuild()
+        else:
+            self.update(changes[0])
+        self.seq = self.game.seq
+        self.cached = self.probabilities()
+        return self.cached
+
+    def rebuild(self):
+        """Makes the constraints and components of the whole board."""
+        opened = self.game.opened
+        for kept in (self.unknown, self.need, self.safe, self.mines, self.components, self.component_of):
+            kept.clear()
+        changed = set()
+        for c in flatnonzero(opened & (self.game.n_mines > 0) & dilate(~opened)).tolist():
+            self.add_constraint(c, changed)
+        self.deduce(changed)
+        self.regroup(changed)
+
+    def update(self, opened: ndarray):
+        """Takes the spots that were opened since the last hint into the constraints and groups the constraints
+        they changed again."""
+        changed = set()
+        for spot in opened.tolist():
+            self.safe.discard(spot)
+            for c in self.nbrs[spot]:
+                if c in self.unknown and spot in self.unknown[c]:
+                    self.remove(c, spot, changed)
+            if self.numbers[spot]:
+                self.add_constraint(spot, changed)
+        self.deduce(changed)
+        self.regroup(changed)
+
+    def add_constraint(self, c: int, changed: Set[int]):
+        is_opened = self.game.opened.ravel()
+        closed = {nb for nb in self.nbrs[c] if not is_opened[nb] and nb not in self.safe and nb not in self.mines}
+        if closed:
+            self.unknown[c] = closed
+            self.need[c] = int(self.numbers[c]) - sum(nb in self.mines for nb in self.nbrs[c])
+            changed.add(c)
+
+    def remove(self, c: int, spot: int, changed: Set[int]):
+        closed = self.unknown[c]
+        closed.discard(spot)
+        changed.add(c)
+        if not closed:
+            del self.unknown[c], self.need[c]
+
+    def deduce(self, changed: Set[int]):
+        """Applies the single spot rule of Solver to the changed constraints until it decides no more spots: a
+        number that needs no more mines makes its spots safe, one that needs as many mines as it has spots makes
+        them mines."""
+        work = set(changed)
+        while work:
+            c = work.pop()
+            if c not in self.unknown:
+                continue
+            closed, need = self.unknown[c], self.need[c]
+            if need != 0 and need != len(closed):
+                continue
+            decided = self.mines if need else self.safe
+            for spot in list(closed):
+                decided.add(spot)
+                for nb in self.nbrs[spot]:
+                    if nb in self.unknown and spot in self.unknown[nb]:
+                        if need:
+                            self.need[nb] -= 1
+                        self.remove(nb, spot, changed)
+                        work.add(nb)
+
+    def drop(self, component_id: int) -> List[int]:
+        """Forgets a component and returns its constraints."""
+        component = self.components.pop(component_id)
+        for c in component.constraints:
+            del self.component_of[c]
+        return component.constraints
+
+    def regroup(self, changed: Set[int]):
+        """Groups the changed constraints, and those of every component they reach, into new components."""
+        loose = set()
+        for c in changed:
+            if c in self.component_of:
+                loose.update(self.drop(self.component_of[c]))
+            loose.add(c)
+
+        seen = set()
+        for start in loose:
+            if start in seen or start not in self.unknown:
+                continue
+            seen.add(start)
+            constraints, spots, stack, in_component = [start], [], [start], set()
+            while stack:
+                constraint = stack.pop()
+                for spot in self.unknown[constraint] - in_component:
+                    in_component.add(spot)
+                    spots.append(spot)
+                    for nb in self.nbrs[spot]:
+                        if nb in self.unknown and nb not in seen:
+                            # a new constraint can join a component that did not change
+                            if nb in self.component_of:
+                                self.drop(self.component_of[nb])
+                            seen.add(nb)
+                            constraints.append(nb)
+                            stack.append(nb)
+            self.add(spots, constraints)
+
+    def add(self, spots: List[int], constraints: List[int]):
+        try:
+            component = Component(spots, constraints, *self.enumerate_component(spots, constraints))
+            self.enumerated += 1
+        except TooLarge:
+            component = Component(spots, constraints, None, None, [], [])
+        component_id = self.next_id
+        self.next_id += 1
+        self.components[component_id] = component
+        for c in constraints:
+            self.component_of[c] = component_id
+
+    def enumerate_component(self, spots: List[int], constraints: List[int]) -> tuple:
+        """Counts every mine placement of a component that satisfies its constraints. Unlike
+        Solver.enumerate_component the placements are not tried one by one: the spots are decided in order and the
+        partial placements are merged by what their constraints still need, so a long wall of numbers does not take
+        exponentially many steps. A forward pass counts the ways to reach every state, a backward pass the ways to
+        complete it, and the two give how often every spot holds a mine.
+
+        Raises:
+            TooLarge: If a step has more than max_states states
+
+        Returns:
+            Tuple[ndarray[float], ndarray[float], List[int], List[int]]: The number of placements with k mines, by k,
+            how often every spot holds a mine in them, by k and spot, and the spots that are safe and the spots that
+            are mines in all of them
+        """
+        n = len(spots)
+        index = {spot: i for i, spot in enumerate(spots)}
+        of_spot = [[] for _ in spots]
+        for k, constraint in enumerate(constraints):
+            for spot in self.unknown[constraint]:
+                of_spot[index[spot]].append(k)
+        left = [len(self.unknown[c]) for c in constraints]
+
+        # forward[i]: the ways to place mines on the first i spots, by the state they leave and their mines
+        forward = [{tuple(self.need[c] for c in constraints): zeros(n + 1)}]
+        forward[0][next(iter(forward[0]))][0] = 1
+        # steps[i]: the transitions (state, is_mine, next state) of spot i
+        steps = []
+        for i in range(n):
+            for k in of_spot[i]:
+                left[k] -= 1
+            layer, transitions = {}, []
+            for state, ways in forward[i].items():
+                for is_mine in (0, 1):
+                    after = list(state)
+                    for k in of_spot[i]:
+                        after[k] -= is_mine
+                    if any(after[k] < 0 or after[k] > left[k] for k in of_spot[i]):
+                        continue
+                    after = tuple(after)
+                    if after not in layer:
+                        layer[after] = zeros(n + 1)
+                    if is_mine:
+                        layer[after][1:] += ways[:-1]
+                    else:
+                        layer[after] += ways
+                    transitions.append((state, is_mine, after))
+            if len(layer) > self.max_states:
+                raise TooLarge()
+            forward.append(layer)
+            steps.append(transitions)
+
+        # every constraint is met once all spots are decided, the only state left needs no more mines
+        done = tuple(0 for _ in constraints)
+        counts = forward[n].get(done, zeros(n + 1))
+        backward = {done: zeros(n + 1)}
+        backward[done][0] = 1
+        mine_counts = zeros((n + 1, n))
+        safe, mines = [], []
+        for i in range(n - 1, -1, -1):
+            earlier, into = {}, {}
+            can_be = [False, False]
+            for state, is_mine, after in steps[i]:
+                completions = backward.get(after)
+                if completions is None:
+                    continue
+                can_be[is_mine] = True
+                if state not in earlier:
+                    earlier[state] = zeros(n + 1)
+                if is_mine:
+                    earlier[state][1:] += completions[:-1]
+                    into[after] = into.get(after, 0) + forward[i][state]
+                else:
+                    earlier[state] += completions
+            # a mine at spot i, the ways before it times the ways after it
+            for after, ways in into.items():
+                mine_counts[1:, i] += convolve(ways[:i + 1], backward[after][:n - i])[:n]
+            if not can_be[1]:
+                safe.append(spots[i])
+            elif not can_be[0]:
+                mines.append(spots[i])
+            backward = earlier
+        return counts, mine_counts, safe, mines
+
+    def probabilities(self) -> dict:
+        """Combines the components into the mine probability of every closed spot next to an opened number."""
+        game = self.game
+        # only spots without a mine are ever opened
+        closed = game.safe_left + game.total_mines - len(self.safe) - len(self.mines)
+        components = list(self.components.values())
+        exact = [component for component in components if component.counts is not None]
+        estimates = [self.estimate(component) for component in components if component.counts is None]
+        n_other = closed - sum(len(component.spots) for component in components)
+        # the components that were too large count with the mines they are estimated to hold
+        mines_left = game.total_mines - len(self.mines) - int(round(sum(p.sum() for p in estimates)))
+
+        length = sum(len(component.counts) for component in exact)
+        combined = self.combine(exact, n_other, mines_left) if len(exact) * length ** 2 <= self.max_combine else None
+        weights, other = combined or self.independent(exact, n_other, mines_left)
+
+        spots = sorted(self.safe) + sorted(self.mines)
+        probabilities = [0.0] * len(self.safe) + [1.0] * len(self.mines)
+        safe, mines = list(self.safe), list(self.mines)
+        estimates, weights = iter(estimates), iter(weights)
+        for component in components:
+            if component.counts is None:
+                p = next(estimates)
+            else:
+                p = next(weights) @ (component.mine_counts / clip(component.counts, 1e-300, None)[:, None])
+                p[[component.spots.index(spot) for spot in component.safe]] = 0
+                p[[component.spots.index(spot) for spot in component.mines]] = 1
+                safe += component.safe
+                mines += component.mines
+            spots += component.spots
+            probabilities += p.round(3).tolist()
+        return {"spots": spots, "probabilities": probabilities, "safe": sorted(safe), "mines": sorted(mines),
+                "other": round(other, 3) if n_other > 0 else None}
+
+    def combine(self, components: List[Component], n_other: int, mines_left: int) -> Optional[tuple]:
+        """Weights the mines of every component by the placements of all the others and of the spots no number
+        constrains, so that all of them together hold the mines that are left.
+
+        Returns:
+            Tuple[List[ndarray[float]], float] | None: The probability of every component holding k mines, by k, and
+            the mine probability of the other spots. None if no placement fits the mines that are left
+        """
+        scaled = [component.counts / max(component.counts.max(), 1) for component in components]
+        # prefix[i] and suffix[i] are the placements of the components before and from i on, by their mines
+        prefix, suffix = [array([1.0])], [array([1.0])]
+        for counts in scaled:
+            prefix.append(convolve(prefix[-1], counts))
+        for counts in reversed(scaled):
+            suffix.append(convolve(suffix[-1], counts))
+        suffix.reverse()
+        total = prefix[-1]
+
+        # the ways to place the rest of the mines on the other spots, by the mines of all components
+        in_components = arange(len(total))
+        log_ways = array([log_comb(n_other, mines_left - k) for k in in_components])
+        if not isfinite(log_ways).any():
+            return None
+        ways = exp(log_ways - log_ways[isfinite(log_ways)].max())
+        norm = total @ ways
+        if norm <= 0:
+            return None
+
+        weights = []
+        for i, counts in enumerate(scaled):
+            others = convolve(prefix[i], suffix[i + 1])
+            weights.append(counts * array([others @ ways[k:k + len(others)] for k in range(len(counts))]) / norm)
+        other = ((total * ways) @ (mines_left - in_components)) / norm / n_other if n_other > 0 else 0.0
+        return weights, float(clip(other, 0, 1))
+
+    def independent(self, components: List[Component], n_other: int, mines_left: int) -> tuple:
+        """Weights the mines of every component by the odds of a mine in the spots no number constrains, as if the
+        components were independent of each other, for frontiers too large to combine."""
+        closed = n_other + sum(len(component.spots) for component in components)
+        density = mines_left / max(closed, 1)
+        for _ in range(3):
+            odds = min(max(density, 1e-6), 1 - 1e-6) / (1 - min(max(density, 1e-6), 1 - 1e-6))
+            weights = [self.weights(component, odds, mines_left) for component in components]
+            if n_other <= 0:
+                break
+            expected = sum(w @ arange(len(w)) for w in weights)
+            density = float(clip((mines_left - expected) / n_other, 0, 1))
+        return weights, density
+
+    def weights(self, component: Component, odds: float, mines_left: int) -> ndarray:
+        """Returns the probability of the component holding k mines, by k."""
+        k = arange(len(component.counts))
+        w = component.counts * odds ** (k - len(component.spots) / 2)
+        # placements with more mines than the game has left are impossible
+        w[max(mines_left, 0) + 1:] = 0
+        total = w.sum()
+        return w / total if total > 0 else w
+
+    def estimate(self, component: Component) -> ndarray:
+        """Returns the mine probabilities of a component that was too large to enumerate: for every spot the highest
+        share of mines among the closed spots of its numbers."""
+        share = zeros(len(component.spots))
+        index = {spot: i for i, spot in enumerate(component.spots)}
+        for c in component.constraints:
+            closed = self.unknown[c]
+            for spot in closed:
+                share[index[spot]] = max(share[index[spot]], self.need[c] / len(closed))
+        return share
+
+
+# the engine of every game, dropped together with the game
+engines: "WeakKeyDictionary[Game, HintEngine]" = WeakKeyDictionary()
+
+
+def hint(game: Game) -> dict:
+    """Returns the hint for the current version of a game, see HintEngine.hint."""
+    engine = engines.get(game)
+    if engine is None:
+        engine = engines[game] = HintEngine(game)
+    return engine.hint()
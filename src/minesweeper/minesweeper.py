@@ -1,18 +1,119 @@
-from numpy.random import choice
-from numpy import ravel
-from numpy import array
+from typing import Optional
+
+from numpy.random import PCG64, default_rng
+from numpy import array, iinfo, uint64, zeros, flatnonzero
 
 from .spot import Spot
+from .solver import Solver
+from .geometry import count_neighbors, dilate
+
+# the bits of Minesweeper.flip
+FLIP_COLS, FLIP_ROWS = 1, 2
+
+
+def new_seed() -> int:
+    """Returns a random seed for a board, small enough for a signed 64 bit database column."""
+    return int(default_rng().integers(2**63 - 1))
+
+
+def flip_mines(mines, flip: int):
+    """Mirrors a board along the axes set in flip, see FLIP_COLS and FLIP_ROWS."""
+    if flip & FLIP_COLS:
+        mines = mines[::-1]
+    if flip & FLIP_ROWS:
+        mines = mines[:, ::-1]
+    return mines
 
 
 class Minesweeper:
-    def __init__(self, n_cols: int, n_rows: int, start_col: int, start_row: int):
-        self.field = [[Spot(col, row) for row in range(n_cols)]
-                      for col in range(n_rows)]
+    """A minesweeper board.
+
+    solvable is True if the board can be solved without guessing from the start spot, None as long as nobody checked.
+
+    The board is held in numpy arrays indexed [col, row], so they have the shape (n_rows, n_cols):
+     - mines [ndarray[bool]]: True where a spot holds a mine.
+     - neighbor_mines [ndarray[int8]]: The number of mines in the neighboring spots of every spot.
+    The field attribute gives the same board as a list of lists of Spot objects.
+
+    The mines placed by place_mines only depend on the size, the number of mines, the start spot and the seed, so a
+    board is stored as these and rebuilt with from_seed:
+     - seed [int | None]: The seed of the mines, None if they were placed somewhere else, see from_mines.
+     - seed_start [Tuple[int, int]]: The start spot the mines were placed around.
+     - flip [int]: The axes the board was mirrored along after placing the mines, see flip_mines.
+    """
+
+    def __init__(self, n_cols: int, n_rows: int, start_col: int, start_row: int, seed: Optional[int] = None):
         self.n_cols = n_cols
         self.n_rows = n_rows
         self.n_spots = n_cols * n_rows
         self.start_pos = (start_col, start_row)
+        self.n_mines = 0
+        self.solvable = None
+        self.mines = zeros((n_rows, n_cols), dtype=bool)
+        self.neighbor_mines = zeros((n_rows, n_cols), dtype="int8")
+        self.seed = new_seed() if seed is None else seed
+        self.seed_start = self.start_pos
+        self.flip = 0
+
+    @classmethod
+    def from_mines(cls, mines, start_col: int, start_row: int):
+        """Makes a board out of mines that were placed somewhere else.
+
+        Args:
+            mines (ndarray[bool]): The mines indexed [col, row]
+            start_col (int): The column of the first spot the player opens
+            start_row (int): The row of the first spot the player opens
+
+        Returns:
+            Minesweeper: The board with the neighbor counts filled in
+        """
+        ms = cls(mines.shape[1], mines.shape[0], start_col, start_row)
+        ms.seed = None
+        ms.mines = mines.astype(bool)
+        ms.n_mines = int(ms.mines.sum())
+        ms.neighbor_mines = count_neighbors(ms.mines)
+        return ms
+
+    @classmethod
+    def from_seed(cls, n_cols: int, n_rows: int, start_col: int, start_row: int, n_mines: int, seed: int,
+                  flip: int = 0):
+        """Rebuilds a board from its seed.
+
+        Args:
+            n_cols (int): The number of columns
+            n_rows (int): The number of rows
+            start_col (int): The column of the spot the mines were placed around, seed_start
+            start_row (int): The row of the spot the mines were placed around, seed_start
+            n_mines (int): The number of mines
+            seed (int): The seed of the board
+            flip (int): The axes the board was mirrored along
+
+        Returns:
+            Minesweeper: The board with the same mines as the one the seed was taken from
+        """
+        ms = cls(n_cols, n_rows, start_col, start_row, seed)
+        ms.place_mines(n_mines)
+        if flip:
+            ms.mines = flip_mines(ms.mines, flip).copy()
+            ms.neighbor_mines = count_neighbors(ms.mines)
+            ms.flip = flip
+        return ms
+
+    @property
+    def field(self):
+        """The board as a list of lists of Spot objects, built from the arrays every time it is accessed.
+
+        Returns:
+            List[List[Spot]]: The spots indexed [col][row]
+        """
+        field = [[Spot(col, row) for row in range(self.n_cols)]
+                 for col in range(self.n_rows)]
+        for col, row in zip(*self.mines.nonzero()):
+            field[col][row].setMine()
+        for col, col_spots in enumerate(self.neighbor_mines.tolist()):
+            for row, n_mines in enumerate(col_spots):
+                field[col][row].setN_mines(n_mines)
+        return field
 
     def __str__(self) -> str:
         _str = "["
@@ -26,97 +127,102 @@ class Minesweeper:
 
     def place_mines(self, mines_to_place=None):
         """Makes a consistent minesweeper field that you can't lose in, on the first try. 1 of 6 spots in the field are mines.
+        The mines are the spots with the smallest random priorities drawn from the seed. The priorities are the raw
+        64 bit numbers of the PCG64 bit generator, whose stream numpy keeps stable across versions (NEP 19). The methods
+        of Generator, like random, have no such promise, so they must not be used here: a stored seed has to give the
+        same board after an upgrade of numpy.
         """
-
-        def cut_three_by_three(field, col, row):
-            """Cuts a three by three field out of self.field around the center coordinates col and row.
-
-            Args:
-                col (int): The index of the col of the center spot of which to cut around
-                row (int): The index of the row of the center spot of which to cut around
-
-            Returns:
-                List[List]: The list of lists with the 3 by three cutout.
-            """
-            sliced = []
-            sliced += field[:col-1]
-            sliced += [field[col-1][:row-1] + field[col-1][row+2:]]
-            sliced += [field[col][:row-1] + field[col][row+2:]]
-            sliced += [field[col+1][:row-1] + field[col+1][row+2:]]
-            sliced += field[col+2:]
-            return sliced
-
-        def flatten(field):
-            """Converts a 2d array to a 1d array
-
-            Args:
-                field (List[List]): The 2d array that will be converted to a 1d array
-
-            Returns:
-                List: The 1d array made from the sub-lists of the 2d array
-            """
-            flat = []
-            for col in field:
-                flat += col
-            return flat
-
         if mines_to_place in [None, 0, self.n_spots]:
             mines_to_place = round(self.n_spots/6)
         self.n_mines = mines_to_place
 
-        mine_spots = choice(ravel(self.field), mines_to_place, replace=False)
-
-        # cuts out the start spot and all neighboring squares to ensure that there is no mine there, which in turn
+        # leaves out the start spot and all neighboring squares to ensure that there is no mine there, which in turn
         # ensures the start spot to be a 0 to make a start possible.
-        field_for_mines = cut_three_by_three(self.field, *self.start_pos)
-
-        mine_spots = choice(flatten(field_for_mines),
-                            mines_to_place, replace=False)
-
-        for mine in mine_spots:
-            col, row = mine.get_col_row()
-            self.field[col][row].mine = True
-            neighbors = [
-                (col-1, row-1), (col, row-1), (col+1, row-1),
-                (col-1, row),                 (col+1, row),
-                (col-1, row+1), (col, row+1), (col+1, row+1)
-            ]
-            for n in neighbors:
-                if 0 <= n[0] < self.n_rows and 0 <= n[1] < self.n_cols:
-                    if self.field[n[0]][n[1]].mine == True:
-                        continue
-
-                    self.field[n[0]][n[1]].n_mines += 1
-                    self.field[n[0]][n[1]].orig_n_mines += 1
+        col, row = self.start_pos
+        free = zeros((self.n_rows, self.n_cols), dtype=bool)
+        free[max(col-1, 0):col+2, max(row-1, 0):row+2] = True
+
+        priorities = PCG64(self.seed).random_raw(self.n_spots)
+        priorities[free.ravel()] = iinfo(uint64).max
+        mine_spots = priorities.argpartition(mines_to_place - 1)[:mines_to_place] if mines_to_place else []
+
+        self.mines = zeros((self.n_rows, self.n_cols), dtype=bool)
+        self.mines.ravel()[mine_spots] = True
+        self.seed_start = self.start_pos
+        self.flip = 0
+        self.neighbor_mines = count_neighbors(self.mines)
 
     def reset_field(self):
         """Resets every Spot's number of mines and whether or not it is a mine
         """
-        for row in self.field:
-            for spot in row:
-                spot.n_mines = 0
-                spot.orig_n_mines = 0
-                spot.mine = False
+        self.mines[:] = False
+        self.neighbor_mines[:] = 0
 
-    def test_solver(self):
+    def test_solver(self) -> bool:
         """Used to test wether or not a board is solvable purely by logic.
-        The solver treats Minesweeper as a constraint satisfaction problem with depth first search to open all fields that have no mines as neighbors
+        The solver treats Minesweeper as a constraint satisfaction problem: it opens the start spot and then only
+        opens spots that the numbers prove to be safe, see Solver.
+
+        Returns:
+            bool: True if every spot without a mine can be opened without guessing, also stored in self.solvable
         """
-        moves = []
-        spots_to_probe = []
+        self.solvable = Solver(self.mines, self.neighbor_mines).solve(*self.start_pos)
+        return self.solvable
+
+    def place_solvable_mines(self, mines_to_place=None, max_tries: int = 100) -> bool:
+        """Places mines until the board is solvable purely by logic.
+
+        Args:
+            mines_to_place (int, optional): The number of mines, see place_mines
+            max_tries (int): The number of boards to try before giving up
+
+        Returns:
+            bool: True if a solvable board was found, False if the last tried board is left in place
+        """
+        for _ in range(max_tries):
+            self.seed = new_seed()
+            self.place_mines(mines_to_place)
+            if self.test_solver():
+                return True
+        return False
+
+    def solvable_starts(self, max_regions: int = 8):
+        """Finds the spots the board can be solved from without guessing. Opening any zero opens its whole area of
+        connected zeros, so the solver only has to run once per area, for at most max_regions of the largest areas.
+
+        Args:
+            max_regions (int): The number of zero areas to try
+
+        Returns:
+            ndarray[bool]: True for every spot the board can be solved from
+        """
+        zero = ~self.mines & (self.neighbor_mines == 0)
+        starts = zeros(zero.shape, dtype=bool)
+        regions = []
+        left = zero.copy()
+        while left.any():
+            region = zeros(zero.shape, dtype=bool)
+            region.ravel()[flatnonzero(left)[0]] = True
+            while True:
+                grown = dilate(region) & zero
+                if not (grown != region).any():
+                    break
+                region = grown
+            left &= ~region
+            regions.append(region)
+        regions.sort(key=lambda region: -region.sum())
+        for region in regions[:max_regions]:
+            col, row = divmod(int(flatnonzero(region)[0]), self.n_cols)
+            if Solver(self.mines, self.neighbor_mines).solve(col, row):
+                starts |= region
+        return starts
 
     def get_spots(self):
-        spots = []
-        for row in self.field:
-            for spot in row:
-                spots.append(spot.get_col_row())
-        return spots
+        return [(col, row) for col in range(self.n_rows) for row in range(self.n_cols)]
 
 
 if __name__ == "__main__":
     ms = Minesweeper(5, 5, 1, 1)
     ms.place_mines()
     print(ms)
-    for row in ms.field:
-        for spot in row:
-            print(spot.mine)
+    print(ms.mines)
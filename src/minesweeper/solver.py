@@ -0,0 +1,228 @@
+from numpy import ndarray
+
+from .geometry import geometry
+
+UNKNOWN, SAFE, MINE = 0, 1, 2
+
+
+class Solver:
+    """Plays a board from its start spot with logic alone, the way a player that never guesses would.
+
+    Every opened spot with a number is a constraint: the set of the flat indices of its closed neighbors has to
+    contain exactly `need` mines. Constraints are solved with three rules, cheapest first:
+     - single spot: a constraint with no mines left is all safe, one with as many mines as spots is all mines.
+     - subset: if the spots of one constraint are a subset of another's, the difference holds the difference of mines.
+     - enumeration: small connected groups of frontier spots are tried with every consistent mine placement, spots
+       that are safe (or a mine) in all of them are decided.
+    The board is solvable if every safe spot gets opened.
+    """
+
+    def __init__(self, mines: ndarray, neighbor_mines: ndarray, max_enumeration: int = 20):
+        self.n_rows, self.n_cols = mines.shape
+        self.mines = mines.ravel().tolist()
+        self.counts = neighbor_mines.ravel().tolist()
+        self.nbrs = geometry(self.n_cols, self.n_rows).neighbors
+        self.max_enumeration = max_enumeration
+        self.state = [UNKNOWN] * len(self.mines)
+        self.safe_left = len(self.mines) - sum(self.mines)
+        self.mines_left = sum(self.mines)
+        # the constraints of opened numbers that still have closed neighbors
+        self.unknown = {}
+        self.need = {}
+        self.work = set()
+
+    def reveal(self, spot: int):
+        """Opens a safe spot, every spot around it if it is a zero, and adds the constraints of the opened numbers."""
+        state, nbrs, counts, unknown, work = self.state, self.nbrs, self.counts, self.unknown, self.work
+        stack = [spot]
+        while stack:
+            spot = stack.pop()
+            if state[spot] != UNKNOWN:
+                continue
+            if self.mines[spot]:
+                raise ValueError(f"The solver opened the mine at {divmod(spot, self.n_cols)}")
+            state[spot] = SAFE
+            self.safe_left -= 1
+            closed, need = [], counts[spot]
+            for nb in nbrs[spot]:
+                nb_state = state[nb]
+                if nb_state == UNKNOWN:
+                    closed.append(nb)
+                elif nb_state == MINE:
+                    need -= 1
+                elif nb in unknown:
+                    self._remove(nb, spot)
+            if counts[spot] == 0:
+                stack.extend(closed)
+            elif closed:
+                unknown[spot], self.need[spot] = set(closed), need
+                work.add(spot)
+
+    def mark_mine(self, spot: int):
+        if self.state[spot] != UNKNOWN:
+            return
+        if not self.mines[spot]:
+            raise ValueError(f"The solver marked the safe spot at {divmod(spot, self.n_cols)} as a mine")
+        self.state[spot] = MINE
+        self.mines_left -= 1
+        for nb in self.nbrs[spot]:
+            if nb in self.unknown:
+                self.need[nb] -= 1
+                self._remove(nb, spot)
+
+    def _remove(self, constraint: int, spot: int):
+        closed = self.unknown[constraint]
+        closed.discard(spot)
+        if closed:
+            self.work.add(constraint)
+        else:
+            del self.unknown[constraint], self.need[constraint]
+
+    def apply(self, safe, mines):
+        """Opens every spot in safe and marks every spot in mines.
+
+        Args:
+            safe (Iterable[int]): The flat indices of spots that are proven to be safe
+            mines (Iterable[int]): The flat indices of spots that are proven to be mines
+        """
+        for spot in list(mines):
+            self.mark_mine(spot)
+        for spot in list(safe):
+            self.reveal(spot)
+
+    def single_spot_rule(self):
+        while self.work:
+            constraint = self.work.pop()
+            if constraint not in self.unknown:
+                continue
+            if self.need[constraint] == 0:
+                self.apply(self.unknown[constraint], ())
+            elif self.need[constraint] == len(self.unknown[constraint]):
+                self.apply((), self.unknown[constraint])
+
+    def subset_rule(self) -> bool:
+        """Returns True if comparing overlapping constraints decided at least one spot."""
+        unknown, need, nbrs = self.unknown, self.need, self.nbrs
+        safe, mines = set(), set()
+        for a, closed_a in unknown.items():
+            # every constraint that shares a spot with a is an opened neighbor of one of its spots
+            others = {b for spot in closed_a for b in nbrs[spot] if b in unknown and b != a}
+            for b in others:
+                closed_b = unknown[b]
+                if len(closed_a) >= len(closed_b) or not closed_a <= closed_b:
+                    continue
+                diff_mines = need[b] - need[a]
+                if diff_mines == 0:
+                    safe |= closed_b - closed_a
+                elif diff_mines == len(closed_b) - len(closed_a):
+                    mines |= closed_b - closed_a
+        self.apply(safe, mines)
+        return bool(safe or mines)
+
+    def components(self) -> list:
+        """Groups the closed spots next to opened numbers into components that share constraints.
+
+        Returns:
+            List[Tuple[List[int], List[int]]]: The spots and constraints of every component
+        """
+        seen, components = set(), []
+        for start in self.unknown:
+            if start in seen:
+                continue
+            seen.add(start)
+            constraints, spots, stack = [start], [], [start]
+            in_component = set()
+            while stack:
+                constraint = stack.pop()
+                for spot in self.unknown[constraint] - in_component:
+                    in_component.add(spot)
+                    spots.append(spot)
+                    for nb in self.nbrs[spot]:
+                        if nb in self.unknown and nb not in seen:
+                            seen.add(nb)
+                            constraints.append(nb)
+                            stack.append(nb)
+            components.append((spots, constraints))
+        return components
+
+    def enumerate_component(self, spots: list, constraints: list) -> tuple:
+        """Tries every mine placement of a component that satisfies its constraints.
+
+        Args:
+            spots (List[int]): The closed spots of the component, neighboring spots close to each other
+            constraints (List[int]): The opened numbers that constrain the spots
+
+        Returns:
+            Tuple[List[int], List[int]]: The spots that are safe and the spots that are mines in every placement
+        """
+        index = {spot: i for i, spot in enumerate(spots)}
+        need = [self.need[c] for c in constraints]
+        left = [len(self.unknown[c]) for c in constraints]
+        of_spot = [[] for _ in spots]
+        for k, constraint in enumerate(constraints):
+            for spot in self.unknown[constraint]:
+                of_spot[index[spot]].append(k)
+
+        mine_counts = [0] * len(spots)
+        assignment = [False] * len(spots)
+        n_solutions = 0
+
+        def place(i: int, placed: int):
+            nonlocal n_solutions
+            if i == len(spots):
+                n_solutions += 1
+                for j, is_mine in enumerate(assignment):
+                    mine_counts[j] += is_mine
+                return
+            for is_mine in (False, True):
+                if is_mine and placed == self.mines_left:
+                    continue
+                ok = True
+                for k in of_spot[i]:
+                    left[k] -= 1
+                    need[k] -= is_mine
+                    if need[k] < 0 or need[k] > left[k]:
+                        ok = False
+                if ok:
+                    assignment[i] = is_mine
+                    place(i + 1, placed + is_mine)
+                for k in of_spot[i]:
+                    left[k] += 1
+                    need[k] += is_mine
+
+        place(0, 0)
+        safe = [spot for spot, count in zip(spots, mine_counts) if count == 0]
+        mines = [spot for spot, count in zip(spots, mine_counts) if count == n_solutions]
+        return safe, mines
+
+    def enumeration_rule(self) -> bool:
+        """Returns True if enumerating the small components decided at least one spot."""
+        for spots, constraints in self.components():
+            if len(spots) > self.max_enumeration:
+                continue
+            safe, mines = self.enumerate_component(spots, constraints)
+            if safe or mines:
+                self.apply(safe, mines)
+                return True
+        return False
+
+    def solve(self, start_col: int, start_row: int) -> bool:
+        """Plays the board from the start spot.
+
+        Args:
+            start_col (int): The column of the first spot to open
+            start_row (int): The row of the first spot to open
+
+        Returns:
+            bool: True if every safe spot could be opened without guessing
+        """
+        self.reveal(start_col * self.n_cols + start_row)
+        while self.safe_left > 0:
+            self.single_spot_rule()
+            if self.safe_left == 0:
+                break
+            if self.mines_left == 0:
+                return True
+            if not self.subset_rule() and not self.enumeration_rule():
+                return False
+        return True
@@ -0,0 +1,215 @@
+import asyncio
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Deque, Dict, Optional, Tuple
+from traceback import print_exc
+
+from numpy import ndarray
+
+from ..minesweeper import Minesweeper
+from ..minesweeper.minesweeper import FLIP_COLS, FLIP_ROWS, flip_mines
+
+# the largest number of columns and rows of a board the solver is run on, it is too slow for bigger ones
+MAX_SOLVABLE_SIDE = 60
+
+
+def generate_board(n_cols: int, n_rows: int, n_mines: int, start_col: int, start_row: int, max_tries: int):
+    """Makes a board that is solvable without guessing. Runs in the worker processes of a BoardPool.
+
+    Returns:
+        Tuple[ndarray, ndarray, int] | None: The mines, the spots the board can be solved from and the seed of the
+        board, None if no solvable board was found in max_tries tries
+    """
+    ms = Minesweeper(n_cols, n_rows, start_col, start_row)
+    if not ms.place_solvable_mines(n_mines, max_tries):
+        return None
+    return ms.mines, ms.solvable_starts(), ms.seed
+
+
+def check_board(mines: ndarray, start_col: int, start_row: int) -> bool:
+    """Tests whether a board is solvable without guessing. Runs in the worker processes of a BoardPool."""
+    return Minesweeper.from_mines(mines, start_col, start_row).test_solver()
+
+
+class BoardPool:
+    """Keeps boards that are solvable without guessing ready, so the first move of a game does not have to wait for
+    boards to be generated and rejected.
+
+    Boards are pooled by (n_cols, n_rows, n_mines). Next to its mines every board holds the spots it can be solved
+    from and its seed, and it can be flipped along both axes, so one board serves many different start spots. Boards
+    are made in a ProcessPoolExecutor and the pool of a size is topped up after every board that is taken from it. The
+    sizes that were used least recently are evicted once there are more than max_sizes of them.
+
+    Attributes:
+     - hits [int]: The number of requests that were served from the pool.
+     - misses [int]: The number of requests that had to wait for a new board.
+     - evictions [int]: The number of board sizes that were dropped from the pool.
+    """
+
+    def __init__(self, max_workers: int = 2, boards_per_size: int = 4, max_sizes: int = 32, max_tries: int = 200):
+        self.max_workers = max_workers
+        self.boards_per_size = boards_per_size
+        self.max_sizes = max_sizes
+        self.max_tries = max_tries
+        self.boards: "OrderedDict[Tuple[int, int, int], Deque[Tuple[ndarray, ndarray, int]]]" = OrderedDict()
+        self.pending: Dict[Tuple[int, int, int], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers)
+        return self._executor
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "sizes": len(self.boards),
+            "boards": sum(len(boards) for boards in self.boards.values()),
+            "pending": sum(self.pending.values())
+        }
+
+    def _size(self, key: Tuple[int, int, int]) -> Deque:
+        if key in self.boards:
+            self.boards.move_to_end(key)
+        else:
+            self.boards[key] = deque()
+            while len(self.boards) > self.max_sizes:
+                self.boards.popitem(last=False)
+                self.evictions += 1
+        return self.boards[key]
+
+    def warm(self, n_cols: int, n_rows: int, n_mines: int):
+        """Starts making boards of a size in the background until the pool of that size is full.
+
+        Args:
+            n_cols (int): The number of columns
+            n_rows (int): The number of rows
+            n_mines (int): The number of mines
+        """
+        key = (n_cols, n_rows, n_mines)
+        missing = self.boards_per_size - len(self._size(key)) - self.pending.get(key, 0)
+        loop = asyncio.get_running_loop()
+        for _ in range(missing):
+            self.pending[key] = self.pending.get(key, 0) + 1
+            future = loop.run_in_executor(self.executor, generate_board, n_cols, n_rows, n_mines,
+                                          n_rows // 2, n_cols // 2, self.max_tries)
+            future.add_done_callback(lambda future, key=key: self._add(key, future))
+
+    def _add(self, key: Tuple[int, int, int], future: asyncio.Future):
+        self.pending[key] -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print("Exception occured while generating a board of size", key)
+            print(future.exception())
+            return
+        if future.result() is not None and key in self.boards:
+            self.boards[key].append(future.result())
+
+    def _take(self, key: Tuple[int, int, int], start_col: int, start_row: int) -> Optional[Minesweeper]:
+        """Removes a pooled board that can be solved from the start spot and returns it, flipped so that the start
+        spot lines up."""
+        boards = self.boards.get(key, ())
+        for i, (mines, starts, seed) in enumerate(boards):
+            n_rows, n_cols = mines.shape
+            for flip in (0, FLIP_COLS, FLIP_ROWS, FLIP_COLS | FLIP_ROWS):
+                col = n_rows - 1 - start_col if flip & FLIP_COLS else start_col
+                row = n_cols - 1 - start_row if flip & FLIP_ROWS else start_row
+                if starts[col, row]:
+                    del boards[i]
+                    ms = Minesweeper.from_mines(flip_mines(mines, flip), start_col, start_row)
+                    # pooled boards are made around the middle spot, see warm
+                    ms.seed, ms.seed_start, ms.flip = seed, (n_rows // 2, n_cols // 2), flip
+                    return ms
+        return None
+
+    async def solvable_board(self, n_cols: int, n_rows: int, n_mines: int, start_col: int,
+                             start_row: int) -> Minesweeper:
+        """Returns a board that is solvable without guessing from the start spot, from the pool if possible.
+
+        Args:
+            n_cols (int): The number of columns
+            n_rows (int): The number of rows
+            n_mines (int): The number of mines
+            start_col (int): The column of the first spot the player opens
+            start_row (int): The row of the first spot the player opens
+
+        Returns:
+            Minesweeper: The board, if no solvable board could be found ms.solvable is left unchecked
+        """
+        key = (n_cols, n_rows, n_mines)
+        ms = self._take(key, start_col, start_row)
+        if ms is not None:
+            self.hits += 1
+            ms.solvable = True
+        else:
+            self.misses += 1
+            board = await asyncio.get_running_loop().run_in_executor(
+                self.executor, generate_board, n_cols, n_rows, n_mines, start_col, start_row, self.max_tries)
+            if board is not None:
+                ms = Minesweeper.from_mines(board[0], start_col, start_row)
+                ms.seed = board[2]
+                ms.solvable = True
+            else:
+                ms = Minesweeper(n_cols, n_rows, start_col, start_row)
+                ms.place_mines(n_mines)
+        self.warm(n_cols, n_rows, n_mines)
+        return ms
+
+    async def make_board(self, n_cols: int, n_rows: int, start_col: int, start_row: int, n_mines: int,
+                         solvable: bool) -> Minesweeper:
+        """Places the mines of a new board. Boards that have to be solvable without guessing come from the pool.
+
+        Args:
+            n_cols (int): The number of columns
+            n_rows (int): The number of rows
+            start_col (int): The column of the first spot the player opens
+            start_row (int): The row of the first spot the player opens
+            n_mines (int): The number of mines
+            solvable (bool): True to get a board that can be solved purely by logic
+
+        Returns:
+            Minesweeper: The board, ms.solvable is only checked yet if solvable was requested
+        """
+        if solvable:
+            return await self.solvable_board(n_cols, n_rows, n_mines, start_col, start_row)
+        ms = Minesweeper(n_cols, n_rows, start_col, start_row)
+        ms.place_mines(n_mines)
+        return ms
+
+    async def is_solvable(self, ms: Minesweeper) -> bool:
+        """Runs Minesweeper.test_solver for a board in the worker processes.
+
+        Args:
+            ms (Minesweeper): The board with its mines placed
+
+        Returns:
+            bool: True if the board is solvable without guessing, False for boards too big for the solver
+        """
+        if max(ms.n_cols, ms.n_rows) > MAX_SOLVABLE_SIDE:
+            return False
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, check_board, ms.mines, *ms.start_pos)
+        except Exception as e:
+            print("Exception occured while checking a board")
+            print(e)
+            print_exc()
+            return False
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+boards = BoardPool(max_workers=int(os.environ.get("BOARD_WORKERS", 2)),
+                   boards_per_size=int(os.environ.get("BOARDS_PER_SIZE", 4)),
+                   max_sizes=int(os.environ.get("BOARD_SIZES", 32)))
@@ -1,3 +1,5 @@
+from time import time
+
 from tortoise.models import Model
 from tortoise import fields
 from tortoise.contrib.pydantic import pydantic_model_creator
@@ -7,44 +9,82 @@ class db_minesweeper(Model):
     """The Database model for a minesweeper game.
 
     Attributes / fields:
-     - id [UUIDField] : Is the primary key for identifying a game.
+     - id [IntField] : Is the primary key for identifying a game.
      - code [IntField] : The Code players need to enter to join a game.
      - n_cols [SmallIntField]: The number of columns
      - n_rows [SmallIntField]: The number of rows
      - solvable [BooleanField]: True if the board is solvable only with logic
-     - start_col [SmallIntField]: The players start column.
-     - start_row [SmallIntField]: The players start row.
-     - n_mines [SmallIntField]: The total number of mines in the game.
+     - n_mines [IntField]: The total number of mines in the game.
+     - last_active [IntField]: Unix time of the last change, boards that are inactive for too long are removed.
+    The board, once the first move placed its mines, and the snapshot of the game, see gameStore.py:
+     - seed [BigIntField]: The seed the mines were placed with, see Minesweeper.from_seed.
+     - start_col [SmallIntField]: The column the mines were placed around.
+     - start_row [SmallIntField]: The row the mines were placed around.
+     - flip [SmallIntField]: The axes the board was mirrored along, see Minesweeper.flip.
+     - mines [BinaryField]: Bitmap of the mines (numpy.packbits of the flat board), only for boards without a seed.
+     - seq [IntField]: The number of events the snapshot includes.
+     - opened [BinaryField]: Bitmap of the opened spots.
+     - flagged [BinaryField]: Bitmap of the flagged spots.
     """
-    id = fields.UUIDField(pk=True)
+    id = fields.IntField(pk=True)
     code = fields.SmallIntField(unique=True)  # the code to enter the same game
     n_cols = fields.SmallIntField()
     n_rows = fields.SmallIntField()
     solvable = fields.BooleanField()
-    n_mines = fields.SmallIntField()
+    n_mines = fields.IntField()
+    last_active = fields.IntField(default=lambda: int(time()), index=True)
+    seed = fields.BigIntField(null=True)
+    start_col = fields.SmallIntField(null=True)
+    start_row = fields.SmallIntField(null=True)
+    flip = fields.SmallIntField(default=0)
+    mines = fields.BinaryField(null=True)
+    seq = fields.IntField(default=0)
+    opened = fields.BinaryField(null=True)
+    flagged = fields.BinaryField(null=True)
+
+    class PydanticMeta:
+        exclude = ("last_active", "seed", "start_col", "start_row", "flip", "mines", "seq", "opened", "flagged")
 
 
-class db_spot(Model):
-    """The database model for a single spot of a minesweeper board. Each Spot is tied to a single board with the foreignKey field of db_minesweeper.
+class db_event(Model):
+    """The database model for an action that changed a game. Events are only ever appended, the game is its snapshot
+    in db_minesweeper with every later event applied in the order of seq.
 
     Attributes/Fields:
-     - id [UUIDField]: The primary key for each spot.
-     - code [SmallIntField]: The Code of the minesweeper board a spot belongs to.
-     - col [SmallIntField]: Holds the column of the spot in its minesweeper board 16bit signed integer.
-     - row [SmallIntField]: Holds the row of the spot in its minesweeper board. 16bit signed integer.
-     - opened [BooleanField]: True if the players already opened the spot or not, default:False
-     - mine [BooleanField]: True if the spot contains a mine false if it does not.
-     - n_mines [SmallIntField]: Contains the number of neighboring mines. 16bit signed integer.
-     - flagged [BooleanField]: Whether or not the field is flagged, default: False
+     - id [IntField]: The primary key.
+     - game_id [IntField]: The id of the db_minesweeper row of the game. Codes are reused by later games, ids never.
+     - seq [IntField]: The number of the event in its game, counted from 1.
+     - kind [SmallIntField]: OPEN, CHORD or FLAG of minesweeper/game.py.
+     - col [SmallIntField]: The column of the spot the action was made on.
+     - row [SmallIntField]: The row of the spot the action was made on.
     """
-    id = fields.UUIDField(pk=True)
-    code = fields.SmallIntField()
+    id = fields.IntField(pk=True)
+    game_id = fields.IntField()
+    seq = fields.IntField()
+    kind = fields.SmallIntField()
     col = fields.SmallIntField()
     row = fields.SmallIntField()
-    opened = fields.BooleanField(default=False)
-    mine = fields.BooleanField()
-    n_mines = fields.SmallIntField()
-    flagged = fields.BooleanField(default=False)
+
+    class Meta:
+        # the events of a game are read in order of seq, starting after its snapshot
+        unique_together = (("game_id", "seq"),)
+
+
+class db_archive(Model):
+    """The database model for a board that was archived because nobody played it for too long.
+
+    Attributes/Fields:
+     - id [IntField]: The primary key.
+     - code [SmallIntField]: The code the game had.
+     - n_mines [IntField]: The total number of mines in the game.
+     - board [TextField]: The board packed as json, see protocol.pack_board.
+     - archived [IntField]: Unix time of archiving.
+    """
+    id = fields.IntField(pk=True)
+    code = fields.SmallIntField(index=True)
+    n_mines = fields.IntField()
+    board = fields.TextField()
+    archived = fields.IntField(default=lambda: int(time()))
 
 
 minesweeper_pydantic = pydantic_model_creator(
@@ -53,5 +93,3 @@ minesweeperIn_pydantic = pydantic_model_creator(
     db_minesweeper, name="minesweeperIn_pydantic", exclude_readonly=True, exclude=("id"))
 msInWs_pydantic = pydantic_model_creator(
     db_minesweeper, name="msInWs_pydantic", exclude=("id", "code"))
-spot_pydantic = pydantic_model_creator(
-    db_spot, exclude_readonly=True, name="spot_pydantic")
@@ -0,0 +1,314 @@
+"""The game-event bus that connects the WebsocketManagers of the same game across processes and hosts.
+
+Every WebsocketManager subscribes to the code of its game under a node id. The first node that subscribes to a code
+owns the game: only its GameActor applies intents and only its GameStore holds the game. Other nodes forward the
+intents of their players to the owner and deliver the broadcasts of the owner to their own connections. When the
+owner unsubscribes the next node takes over and loads the game from the database.
+
+Events are dictionaries that can be sent as json:
+ - {"type": "broadcast", "json": [text, ...] | None, "compact": text | None}, the serialized messages of a broadcast.
+ - {"type": "intent", "origin": node, "conn": conn, "name": name, "data": data}, an intent for the owner.
+ - {"type": "direct", "to": node, "conn": conn, "text": text}, a message to a single connection of another node.
+
+There are two backends:
+ - LocalBus: delivers events between the nodes of one process. It is used when the server runs in a single process.
+ - SocketBus: connects to one or more brokers over TCP, the broker is started with `python -m src.models.eventBus`.
+   Games are sharded over the brokers by code, so every broker only carries the events of its share of the games.
+
+The backend is chosen with the GAME_BUS environment variable: "local" (the default) or a comma separated list of
+broker addresses like "tcp://127.0.0.1:8765,tcp://10.0.0.2:8765". Connections should be routed to workers by code
+where possible (for example with a hash on the path in the load balancer), so most players of a game are on the
+owning node and the bus only carries the events of the rest.
+"""
+import argparse
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from uuid import uuid4
+from traceback import print_exc
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+Handler = Callable[[dict], None]
+
+# the node id of this process
+NODE = uuid4().hex
+
+
+class EventBus(ABC):
+    """The interface of the bus backends."""
+
+    @abstractmethod
+    async def subscribe(self, code: int, node: str, handler: Handler):
+        """Starts delivering the events of a game to a node.
+
+        Args:
+            code (int): The code of the game
+            node (str): The id of the subscribing node
+            handler (Callable[[dict], None]): Called with every event that another node publishes for the code
+        """
+
+    @abstractmethod
+    async def unsubscribe(self, code: int, node: str):
+        """Stops delivering the events of a game to a node."""
+
+    @abstractmethod
+    def publish(self, code: int, node: str, event: dict):
+        """Sends an event to every other node that subscribed to the code, without waiting for them.
+
+        Args:
+            code (int): The code of the game
+            node (str): The id of the publishing node, it does not get the event itself
+            event (dict): The event
+        """
+
+    @abstractmethod
+    def owner(self, code: int) -> Optional[str]:
+        """Returns the id of the node that owns the game, None if no node subscribed to the code."""
+
+    def shared(self, code: int) -> bool:
+        """Returns False if events of the code can not reach any other node, so they need not be published."""
+        return True
+
+    async def close(self):
+        pass
+
+
+class LocalBus(EventBus):
+    """Delivers events between the nodes of a single process."""
+
+    def __init__(self) -> None:
+        # the subscribers of every code in the order they subscribed, the first one owns the game
+        self.subscribers: Dict[int, Dict[str, Handler]] = {}
+
+    async def subscribe(self, code: int, node: str, handler: Handler):
+        self.subscribers.setdefault(code, {})[node] = handler
+
+    async def unsubscribe(self, code: int, node: str):
+        subscribers = self.subscribers.get(code, {})
+        subscribers.pop(node, None)
+        if not subscribers:
+            self.subscribers.pop(code, None)
+
+    def publish(self, code: int, node: str, event: dict):
+        for other, handler in list(self.subscribers.get(code, {}).items()):
+            if other != node:
+                handler(event)
+
+    def owner(self, code: int) -> Optional[str]:
+        return next(iter(self.subscribers.get(code, {})), None)
+
+    def shared(self, code: int) -> bool:
+        return len(self.subscribers.get(code, {})) > 1
+
+
+def write_frame(writer: asyncio.StreamWriter, message: dict):
+    body = json.dumps(message, separators=(",", ":")).encode()
+    writer.write(len(body).to_bytes(4, "big") + body)
+
+
+async def read_frames(reader: asyncio.StreamReader) -> AsyncIterator[dict]:
+    """Yields the messages of a stream until it ends. Frames that are no valid json are skipped."""
+    while True:
+        try:
+            header = await reader.readexactly(4)
+            body = await reader.readexactly(int.from_bytes(header, "big"))
+        except asyncio.IncompleteReadError:
+            return
+        try:
+            yield json.loads(body)
+        except ValueError:
+            print("Skipped a frame of the event bus that is no valid json")
+
+
+class Broker:
+    """Forwards events between the SocketBus clients that subscribed to the same code.
+
+    Every message is a json object prefixed with its length as a 4 byte big-endian integer, so events of any size,
+    like the json broadcast of a first move on a big board, fit. Clients send {"op": "hello", "node"},
+    {"op": "sub", "code"}, {"op": "unsub", "code"} and {"op": "pub", "code", "event"}. The broker sends
+    {"op": "event", "code", "event"} and {"op": "owner", "code", "node"} to every subscriber whenever the owner of a
+    code changes.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: Dict[int, Dict[str, asyncio.StreamWriter]] = {}
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host: str, port: int):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        node, codes = None, set()
+        try:
+            async for message in read_frames(reader):
+                try:
+                    op = message["op"]
+                    if op == "hello":
+                        node = message["node"]
+                    elif op == "sub":
+                        codes.add(message["code"])
+                        self.subscribers.setdefault(message["code"], {})[node] = writer
+                        self.announce_owner(message["code"])
+                    elif op == "unsub":
+                        codes.discard(message["code"])
+                        self.remove(message["code"], node)
+                    elif op == "pub":
+                        event = {"op": "event", "code": message["code"], "event": message["event"]}
+                        for other, other_writer in list(self.subscribers.get(message["code"], {}).items()):
+                            if other != node:
+                                write_frame(other_writer, event)
+                except (KeyError, TypeError):
+                    print("Skipped a malformed message of the event bus")
+        except ConnectionError:
+            pass
+        finally:
+            for code in codes:
+                self.remove(code, node)
+            writer.close()
+
+    def remove(self, code: int, node: str):
+        subscribers = self.subscribers.get(code, {})
+        was_owner = next(iter(subscribers), None) == node
+        subscribers.pop(node, None)
+        if not subscribers:
+            self.subscribers.pop(code, None)
+        elif was_owner:
+            self.announce_owner(code)
+
+    def announce_owner(self, code: int):
+        subscribers = self.subscribers[code]
+        message = {"op": "owner", "code": code, "node": next(iter(subscribers))}
+        for writer in subscribers.values():
+            write_frame(writer, message)
+
+
+class SocketBus(EventBus):
+    """Connects to Brokers over TCP, one connection per broker. The games are sharded over the brokers by code.
+
+    When the connection to a broker ends it is opened again and the codes of that broker are subscribed again, events
+    published in the meantime are lost.
+    """
+
+    # seconds to wait between two attempts to reconnect to a broker
+    RECONNECT_DELAY = 0.5
+
+    def __init__(self, addresses: List[Tuple[str, int]]) -> None:
+        self.addresses = addresses
+        self.node: Optional[str] = None
+        self.connections: Dict[int, Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+        self.readers: Dict[int, asyncio.Task] = {}
+        self.handlers: Dict[int, Dict[str, Handler]] = {}
+        self.owners: Dict[int, str] = {}
+        self.subscribed: Dict[int, asyncio.Event] = {}
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    def shard(self, code: int) -> int:
+        return code % len(self.addresses)
+
+    async def _writer(self, code: int, node: str) -> asyncio.StreamWriter:
+        shard = self.shard(code)
+        self.node = node
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if shard not in self.connections:
+                await self._connect(shard)
+        return self.connections[shard][1]
+
+    async def _connect(self, shard: int):
+        reader, writer = await asyncio.open_connection(*self.addresses[shard])
+        write_frame(writer, {"op": "hello", "node": self.node})
+        self.connections[shard] = (reader, writer)
+        self.readers[shard] = asyncio.create_task(self._read(shard, reader))
+
+    async def _read(self, shard: int, reader: asyncio.StreamReader):
+        try:
+            async for message in read_frames(reader):
+                try:
+                    code = message["code"]
+                    if message["op"] == "owner":
+                        self.owners[code] = message["node"]
+                        if code in self.subscribed:
+                            self.subscribed[code].set()
+                    elif message["op"] == "event":
+                        for handler in list(self.handlers.get(code, {}).values()):
+                            handler(message["event"])
+                except Exception as e:
+                    print("Exception occured while reading from the event broker")
+                    print(e)
+                    print_exc()
+        except ConnectionError:
+            pass
+        await self._reconnect(shard)
+
+    async def _reconnect(self, shard: int):
+        """Opens the connection to a broker again and subscribes the codes of its shard again."""
+        connection = self.connections.pop(shard, None)
+        if connection is not None:
+            connection[1].close()
+        while True:
+            try:
+                async with self._connect_lock:
+                    await self._connect(shard)
+                break
+            except OSError:
+                await asyncio.sleep(self.RECONNECT_DELAY)
+        for code, handlers in self.handlers.items():
+            if handlers and self.shard(code) == shard:
+                write_frame(self.connections[shard][1], {"op": "sub", "code": code})
+
+    async def subscribe(self, code: int, node: str, handler: Handler):
+        self.handlers.setdefault(code, {})[node] = handler
+        self.subscribed[code] = asyncio.Event()
+        write_frame(await self._writer(code, node), {"op": "sub", "code": code})
+        # the broker answers with the owner of the game
+        await self.subscribed[code].wait()
+
+    async def unsubscribe(self, code: int, node: str):
+        self.handlers.get(code, {}).pop(node, None)
+        self.subscribed.pop(code, None)
+        self.owners.pop(code, None)
+        write_frame(await self._writer(code, node), {"op": "unsub", "code": code})
+
+    def publish(self, code: int, node: str, event: dict):
+        connection = self.connections.get(self.shard(code))
+        if connection is not None:
+            write_frame(connection[1], {"op": "pub", "code": code, "event": event})
+
+    def owner(self, code: int) -> Optional[str]:
+        return self.owners.get(code)
+
+    async def close(self):
+        for task in self.readers.values():
+            task.cancel()
+        for _, writer in self.connections.values():
+            writer.close()
+        self.connections.clear()
+        self.readers.clear()
+
+
+def make_bus(config: str) -> EventBus:
+    """Makes the bus backend for a GAME_BUS setting, see the module docstring."""
+    if config == "local":
+        return LocalBus()
+    addresses = []
+    for address in config.split(","):
+        host, port = address.strip().replace("tcp://", "").rsplit(":", 1)
+        addresses.append((host, int(port)))
+    return SocketBus(addresses)
+
+
+bus = make_bus(os.environ.get("GAME_BUS", "local"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a broker of the game-event bus.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(Broker().serve(args.host, args.port))
@@ -0,0 +1,321 @@
+import asyncio
+from time import perf_counter
+from traceback import print_exc
+from typing import Optional
+
+from fastapi import WebSocket
+from numpy import concatenate, zeros
+from pydantic import ValidationError
+from tortoise.exceptions import DoesNotExist
+
+from ..minesweeper import Game
+from ..minesweeper.hints import hint
+from .db import db_minesweeper, minesweeper_pydantic, msInWs_pydantic
+from .socketManager import WebsocketManager
+from .gameStore import store
+from .boardPool import boards
+from .lifecycle import create_game
+from .metrics import action, metrics
+from .protocol import pack_board, pack_tile, split_tiles, tiled
+from ..minesweeper.game import TILE
+
+
+# the intents the actor applies, everything else is measured as "unknown", so clients can not add metric series
+INTENTS = ("open", "flag", "hint", "join", "tiles", "restart")
+
+
+def intent_name(data: dict) -> str:
+    """Returns the name an intent is measured under, chording is measured apart from opening."""
+    intent = data.get("intent")
+    if intent == "open" and data.get("double_click", False):
+        return "chord"
+    return intent if intent in INTENTS else "unknown"
+
+
+def board_message(game: Optional[Game], n_cols: int, n_rows: int, n_mines: int, compact: bool) -> dict:
+    """Makes the first message a player gets, with the board, counters and version if the first move was made.
+    Tiled boards are sent tile by tile, see protocol.py."""
+    message = {"n_cols": n_cols, "n_rows": n_rows, "n_mines": n_mines}
+    if tiled(n_cols, n_rows):
+        message["tile"] = TILE
+    if game is None:
+        return message
+    if tiled(n_cols, n_rows):
+        return {**game.counters(), **version(game), **message}
+    board = {"board": pack_board(game)} if compact else {"field": game.field()}
+    return {**board, **game.counters(), **version(game), **message}
+
+
+def version(game: Game) -> dict:
+    """Returns the version players keep to resync with after reconnecting, see resync_messages."""
+    return {"game_id": game.game_id, "version": game.seq}
+
+
+def resync_messages(game: Optional[Game], game_id: Optional[int], seq: Optional[int], compact: bool) -> Optional[list]:
+    """Makes the messages that bring a reconnecting player from its last version of the game to the current one.
+
+    Args:
+        game (Game | None): The game, None before the first move
+        game_id (int | None): The game_id of the version the player has
+        seq (int | None): The version the player has
+        compact (bool): True for the compact protocol
+
+    Returns:
+        list[dict] | None: The messages with the changes since that version, or None if the player needs the whole
+        board: because it has no version, a version of another board of the code, or one older than the history
+    """
+    if game is None or game_id is None or seq is None or game_id != game.game_id:
+        return None
+    if tiled(game.n_cols, game.n_rows):
+        # the tiles come again with the viewport
+        return None
+    changes = game.changes_since(seq)
+    if changes is None:
+        return None
+    opened, flagged, unflagged = changes
+    if compact:
+        message = {"opened": opened.tolist()}
+        if flagged:
+            message["flagged"] = flagged
+        if unflagged:
+            message["unflagged"] = unflagged
+        messages = [message]
+    else:
+        messages = [{"opened": game.spots(opened)}] if len(opened) else []
+        for i in flagged + unflagged:
+            col, row = divmod(i, game.n_cols)
+            messages.append({"flagged": {("success" if i in flagged else "remove"): True, "col": col, "row": row}})
+        messages = messages or [{"opened": []}]
+    messages[-1].update({**game.counters(), **version(game)})
+    return messages
+
+
+class GameActor:
+    """Applies the intents of all players of one game, one after the other, in a single task.
+
+    The websocket route only submits intents. The actor waits tick seconds after the first intent of a batch, takes
+    every intent that came in until then and applies them in the order they arrived. All changes of a batch go out
+    together: json connections get consecutive opens merged into one "opened" message, compact connections get a
+    single message with every opened spot and the net flag changes, see protocol.py. The last message of a batch carries
+    the counters and the version of the game, see Game.counters and Game.seq.
+    """
+
+    def __init__(self, code: int, manager: WebsocketManager, tick: float = 0.005):
+        self.code = code
+        self.manager = manager
+        self.tick = tick
+        self.intents: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, websocket: WebSocket, name: str, data: dict):
+        """Queues an intent of a player.
+
+        Args:
+            websocket (WebSocket): The connection the intent came from, errors are sent back to it
+            name (str): The name of the player
+            data (dict): The intent as it was received
+        """
+        self.intents.put_nowait((websocket, name, data, perf_counter()))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Applies the intents that are still queued and stops the actor."""
+        if self._task is not None:
+            await self.intents.join()
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            batch = [await self.intents.get()]
+            await asyncio.sleep(self.tick)
+            while not self.intents.empty():
+                batch.append(self.intents.get_nowait())
+            try:
+                await self.apply([(websocket, name, data) for websocket, name, data, _ in batch])
+            except Exception as e:
+                print("Exception occured while applying intents in gameActor.py")
+                print(e)
+                print_exc()
+            done = perf_counter()
+            for _, _, data, received in batch:
+                metrics.intents.observe(done - received, intent_name(data))
+                self.intents.task_done()
+
+    async def apply(self, batch: list):
+        """Applies a batch of intents and broadcasts their changes. An intent that fails is answered with an error, the
+        changes of the others are broadcast anyway.
+
+        Args:
+            batch (List[Tuple[WebSocket, str, dict]]): The intents in the order they arrived
+        """
+        messages, opened, flags, hints = [], [], set(), []
+        game: Optional[Game] = None
+        status, initial_flags = "playing", None
+        for websocket, name, data in batch:
+            try:
+                intent = data.get("intent")
+                # the queries of the intent are counted for it
+                action.set(intent_name(data))
+                if intent == "restart":
+                    await self.restart(websocket, data)
+                    continue
+                if intent == "join":
+                    await self.send_board(websocket, data.get("compact", False), data.get("game_id"),
+                                          data.get("version"))
+                    continue
+                if intent == "tiles":
+                    await self.send_tiles(websocket, data["tiles"])
+                    continue
+                if intent == "hint":
+                    # answered after the changes of the batch went out
+                    hints.append(websocket)
+                    continue
+                if intent not in ("open", "flag") or status != "playing":
+                    continue
+                col, row = int(data["col"]), int(data["row"])
+
+                game = await store.get(self.code)
+                if game is None and intent == "flag":
+                    self.manager.send(websocket, {"error": "Can't set a flag on the first Move"})
+                    continue
+                if game is None:
+                    try:
+                        game = await self.first_move(col, row)
+                    except DoesNotExist:
+                        self.manager.send(websocket, {"error": "The Game you requested does not exist"})
+                        continue
+                if not game.in_bounds(col, row):
+                    self.manager.send(websocket, {"error": f"The spot {col}-{row} does not exist"})
+                    continue
+                if initial_flags is None:
+                    initial_flags = game.flagged.copy()
+
+                if intent == "open":
+                    if data.get("double_click", False):
+                        status, spots = game.chord_spots(col, row)
+                    else:
+                        status, spots = game.open_spots(col, row)
+                    opened.append(spots)
+                    if status == "playing":
+                        # the spots are only turned into dictionaries in publish, if a json connection gets them
+                        if messages and "opened" in messages[-1] and isinstance(messages[-1]["opened"], list):
+                            messages[-1]["opened"].append(spots)
+                        else:
+                            messages.append({"opened": [spots]})
+                    else:
+                        message = {"opened": game.open_response(status, spots)}
+                        if status == "lost":
+                            message["message"] = f"{name} threw the game"
+                        messages.append(message)
+                else:
+                    result = game.flag(col, row)
+                    if "status" not in result:
+                        flags.add(game.flat_index(col, row))
+                    messages.append({"flagged": result})
+            except Exception as e:
+                # the intents before it were applied, so their changes still go out
+                print("Exception occured while applying an intent in gameActor.py")
+                print(e)
+                print_exc()
+                self.manager.send(websocket, {"error": "Your action could not be applied"})
+
+        if game is not None and messages:
+            await self.publish(game, messages, status, opened, flags, initial_flags)
+        for websocket in hints:
+            await self.send_hint(websocket)
+
+    async def publish(self, game: Game, messages: list, status: str, opened: list, flags: set, initial_flags):
+        """Broadcasts the changes of a batch in both protocols. The json messages hold the opened spots as arrays of
+        flat indices, they are only turned into dictionaries if a connection uses the json protocol, which tiled boards
+        never have."""
+        store.changed(game)
+        compact = self.compact_message(game, status, opened, flags, initial_flags)
+        if "message" in messages[-1]:
+            compact["message"] = messages[-1]["message"]
+        if tiled(game.n_cols, game.n_rows) or not self.manager.wants_json:
+            messages = [{}]
+        for message in messages:
+            if isinstance(message.get("opened"), list):
+                message["opened"] = game.spots(concatenate(message["opened"]))
+        messages[-1].update({**game.counters(), **version(game)})
+        compact.update({**game.counters(), **version(game)})
+        rest, tiles = split_tiles(game, compact) if tiled(game.n_cols, game.n_rows) else (None, None)
+        compact["opened"] = compact["opened"].tolist()
+        await self.manager.broadcast_many(messages, compact, tiles, rest)
+        if status != "playing":
+            await store.delete(self.code)
+
+    def compact_message(self, game: Game, status: str, opened: list, flags: set, initial_flags) -> dict:
+        """Combines the changes of a batch into one message of the compact protocol. The opened spots stay an array of
+        flat indices, so tiled boards split them without converting them back and forth, see split_tiles."""
+        message = {"opened": concatenate(opened) if opened else zeros(0, dtype=int)}
+        flagged = [i for i in sorted(flags) if game.flagged.ravel()[i] and not initial_flags.ravel()[i]]
+        unflagged = [i for i in sorted(flags) if not game.flagged.ravel()[i] and initial_flags.ravel()[i]]
+        if flagged:
+            message["flagged"] = flagged
+        if unflagged:
+            message["unflagged"] = unflagged
+        if status != "playing":
+            message["status"] = status
+        return message
+
+    async def first_move(self, col: int, row: int) -> Game:
+        """Places the mines of the game around the first opened spot and sends the board to every player."""
+        ms = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=self.code))
+        ms = ms.dict()
+        board = await boards.make_board(ms["n_cols"], ms["n_rows"], col, row, ms["n_mines"], ms["solvable"])
+        game = store.create(self.code, board, ms["id"])
+        if tiled(game.n_cols, game.n_rows):
+            # every tile is serialized once, connections only get the ones in their viewport
+            header = board_message(game, game.n_cols, game.n_rows, ms["n_mines"], True)
+            tiles = {tile: pack_tile(game, tile) for tile in range(game.n_tiles)}
+            await self.manager.broadcast_many([header], header, tiles, header)
+        else:
+            await self.manager.broadcast({"field": game.field(), **version(game)},
+                                         {"board": pack_board(game), **version(game)})
+        return game
+
+    async def send_board(self, websocket: WebSocket, compact: bool, game_id: Optional[int] = None,
+                         seq: Optional[int] = None):
+        """Sends the board, or the changes since the version it has, to a player that joined on another node."""
+        ms = await db_minesweeper.get_or_none(code=self.code)
+        if ms is None:
+            self.manager.send(websocket, {"error": "The Game you requested does not exist"})
+            return
+        game = await store.get(self.code)
+        messages = resync_messages(game, game_id, seq, compact)
+        for message in messages or [board_message(game, ms.n_cols, ms.n_rows, ms.n_mines, compact)]:
+            self.manager.send(websocket, message)
+
+    async def send_hint(self, websocket: WebSocket):
+        """Sends the mine probabilities of the game to a player, see hints.py."""
+        game = await store.get(self.code)
+        if game is None:
+            self.manager.send(websocket, {"error": "There are no hints before the first move"})
+        elif tiled(game.n_cols, game.n_rows):
+            self.manager.send(websocket, {"error": "Boards of this size have no hints"})
+        else:
+            self.manager.send(websocket, {"hint": hint(game), **version(game)})
+
+    async def send_tiles(self, websocket: WebSocket, tiles: list):
+        """Sends the tiles a player added to its viewport, nothing before the first move."""
+        game = await store.get(self.code)
+        if game is None:
+            return
+        for tile in tiles:
+            if 0 <= tile < game.n_tiles:
+                self.manager.send(websocket, pack_tile(game, tile))
+
+    async def restart(self, websocket: WebSocket, data: dict):
+        """Makes a new game under the code of this one, with the same checks as the create route."""
+        try:
+            settings = msInWs_pydantic(solvable=data.get("solvable", False),
+                                       **{key: data.get(key) for key in ("n_cols", "n_rows", "n_mines")}).dict()
+        except ValidationError:
+            self.manager.send(websocket, {"error": "A new game needs n_cols, n_rows and n_mines"})
+            return
+        result = await create_game({**settings, "code": self.code})
+        if "error" in result:
+            self.manager.send(websocket, result)
@@ -0,0 +1,250 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+from time import time
+from traceback import print_exc
+
+from tortoise.exceptions import IntegrityError
+from numpy import frombuffer, packbits, unpackbits, ndarray, zeros
+
+from ..minesweeper import Game, Minesweeper
+from ..minesweeper.geometry import count_neighbors
+from .db import db_minesweeper, db_event
+from .boardPool import boards
+from .metrics import action
+
+
+def pack(mask: ndarray) -> bytes:
+    return packbits(mask.ravel()).tobytes()
+
+
+def unpack(data: bytes, n_cols: int, n_rows: int) -> ndarray:
+    return unpackbits(frombuffer(data, dtype="uint8"), count=n_cols * n_rows).astype(bool).reshape(n_rows, n_cols)
+
+
+class GameStore:
+    """Holds the in-memory Game of every running board, keyed by the game code.
+
+    The Game is the authoritative state: opening and flagging only touch its arrays. A game is persisted as a snapshot
+    on its db_minesweeper row and the append-only log of the actions that changed it since, in db_event. The snapshot
+    holds the seed of the board, which the mines are placed again from, and bitmaps of the opened and flagged spots.
+    New events are appended in batches by a background task that runs at most once every flush_interval seconds. Once
+    snapshot_every events were appended after the snapshot, the snapshot is overwritten with the current state, so
+    loading a game only replays a short tail of the log. Older events stay in the log, a game can be replayed from its
+    first move.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, batch_size: int = 500, snapshot_every: int = 200) -> None:
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.games: Dict[int, Game] = {}
+        # the number of events of every game that are in the log but not in its snapshot
+        self.since_snapshot: Dict[int, int] = {}
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._inserts: Dict[int, asyncio.Task] = {}
+
+    async def get(self, code: int) -> Optional[Game]:
+        """Returns the Game for a code, loading it from the database if it is not in memory yet, see load.
+
+        Args:
+            code (int): The code of the game
+
+        Returns:
+            Game | None: The game, or None if no board was made for the code yet
+        """
+        game = self.games.get(code)
+        if game is not None:
+            return game
+
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if code in self.games:
+                return self.games[code]
+            game, n_events = await self.load(code)
+            if game is not None:
+                self.games[code], self.since_snapshot[code] = game, n_events
+            return game
+
+    async def load(self, code: int) -> Tuple[Optional[Game], int]:
+        """Reads a game from the database without keeping it in memory. A loaded game is its snapshot with the events
+        after it replayed.
+
+        Args:
+            code (int): The code of the game
+
+        Returns:
+            Tuple[Game | None, int]: The game, or None if no board was made for the code yet, and the number of events
+            that were replayed
+        """
+        ms = await db_minesweeper.get_or_none(code=code)
+        if ms is None or ms.opened is None:
+            return None, 0
+        events = await (db_event.filter(game_id=ms.id, seq__gt=ms.seq).order_by("seq")
+                        .values_list("kind", "col", "row"))
+
+        if ms.seed is not None:
+            board = Minesweeper.from_seed(ms.n_cols, ms.n_rows, ms.start_col, ms.start_row, ms.n_mines, ms.seed,
+                                          ms.flip)
+            mines, n_mines = board.mines, board.neighbor_mines
+        else:
+            mines = unpack(ms.mines, ms.n_cols, ms.n_rows)
+            n_mines = count_neighbors(mines)
+        game = Game(code, mines, n_mines, unpack(ms.opened, ms.n_cols, ms.n_rows),
+                    unpack(ms.flagged, ms.n_cols, ms.n_rows))
+        game.game_id, game.seq = ms.id, ms.seq
+        game.replay(events)
+        return game, len(events)
+
+    def create(self, code: int, ms: Minesweeper, game_id: Optional[int] = None) -> Game:
+        """Makes the Game for a board with placed mines. The board is written to the database in the background, so
+        the game can be played right away.
+
+        Args:
+            code (int): The code of the game
+            ms (Minesweeper): The board with the mines placed
+            game_id (int): The id of the db_minesweeper row of the game
+
+        Returns:
+            Game: The new game
+        """
+        game = Game.from_minesweeper(code, ms)
+        game.game_id = game_id
+        self.games[code], self.since_snapshot[code] = game, 0
+        self._inserts[code] = asyncio.create_task(self._insert(game, ms))
+        return game
+
+    async def _insert(self, game: Game, ms: Minesweeper):
+        """Writes the seed of the new board as the first snapshot of a game, and whether the board is solvable without
+        guessing. Boards that were not checked yet are checked in the board pool. Boards without a seed store their
+        mines instead."""
+        action.set("insert")
+        closed = pack(zeros(game.mines.shape, dtype=bool))
+        start_col, start_row = ms.seed_start
+        try:
+            await db_minesweeper.filter(code=game.code).update(
+                seed=ms.seed, start_col=start_col, start_row=start_row, flip=ms.flip,
+                mines=pack(game.mines) if ms.seed is None else None, seq=0, opened=closed, flagged=closed)
+            solvable = ms.solvable if ms.solvable is not None else await boards.is_solvable(ms)
+            await db_minesweeper.filter(code=game.code).update(solvable=solvable)
+        except Exception as e:
+            print("Exception occured while inserting game", game.code, "into the database")
+            print(e)
+            print_exc()
+
+    async def delete(self, code: int):
+        """Removes a game from memory and deletes its board and events from the database.
+
+        Args:
+            code (int): The code of the game
+        """
+        self.games.pop(code, None)
+        self.since_snapshot.pop(code, None)
+        insert = self._inserts.pop(code, None)
+        if insert is not None:
+            await insert
+        game_ids = await db_minesweeper.filter(code=code).values_list("id", flat=True)
+        await db_event.filter(game_id__in=game_ids).delete()
+        await db_minesweeper.filter(code=code).delete()
+
+    def changed(self, game: Game):
+        """Schedules the changes of a game to be written to the database.
+
+        Args:
+            game (Game): The game that changed
+        """
+        if len(game.events) == 0:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        action.set("flush")
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Appends the new events of every game to the log, with one bulk insert per batch."""
+        for code, game in list(self.games.items()):
+            # a game that was deleted or replaced while an earlier one was written is not written anymore
+            if self.games.get(code) is game:
+                await self._write(code, game)
+        if any(len(game.events) != 0 for game in self.games.values()):
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _write(self, code: int, game: Game, snapshot: bool = False):
+        """Appends the new events of a game to the log and overwrites its snapshot if snapshot_every events were
+        appended since the last one, or if snapshot is True."""
+        insert = self._inserts.get(code)
+        if insert is not None:
+            if not insert.done():
+                return
+            del self._inserts[code]
+        events, game.events = game.events, []
+        first = game.seq - len(events) + 1
+        resync = False
+        try:
+            for start in range(0, len(events), self.batch_size):
+                await db_event.bulk_create([
+                    db_event(game_id=game.game_id, seq=first + i, kind=kind, col=col, row=row)
+                    for i, (kind, col, row) in enumerate(events[start:start + self.batch_size], start)])
+        except IntegrityError as e:
+            # the log already has events with these seqs, so it does not match the game anymore. Trying again
+            # would fail forever, a snapshot of the current state takes the place of the events instead
+            print("Exception occured while writing game", code, "to the database, writing a snapshot instead")
+            print(e)
+            resync = True
+        except Exception as e:
+            print("Exception occured while writing game", code, "to the database")
+            print(e)
+            print_exc()
+            game.events[:0] = events
+            return
+        since = self.since_snapshot.get(code, 0) + len(events)
+        self.since_snapshot[code] = since
+        try:
+            if resync or since >= self.snapshot_every or (snapshot and since > 0):
+                # the arrays may already hold events that are not appended yet, their seq is not above the one of
+                # the snapshot, so they are skipped when the game is loaded
+                await db_minesweeper.filter(id=game.game_id).update(seq=game.seq, opened=pack(game.opened),
+                                                                    flagged=pack(game.flagged), last_active=int(time()))
+                self.since_snapshot[code] = 0
+            elif events:
+                await db_minesweeper.filter(id=game.game_id).update(last_active=int(time()))
+        except Exception as e:
+            print("Exception occured while writing the snapshot of game", code, "to the database")
+            print(e)
+            print_exc()
+
+    async def evict(self, code: int) -> bool:
+        """Writes the outstanding events and a snapshot of a game to the database and removes it from memory. The game
+        is loaded again by the next get.
+
+        Args:
+            code (int): The code of the game
+
+        Returns:
+            bool: False if the changes could not be written, the game is kept in memory then
+        """
+        insert = self._inserts.get(code)
+        if insert is not None:
+            await insert
+        game = self.games.get(code)
+        if game is not None:
+            await self._write(code, game, snapshot=True)
+            if len(game.events) != 0:
+                return False
+        self.games.pop(code, None)
+        self.since_snapshot.pop(code, None)
+        return True
+
+    async def close(self):
+        """Waits for the pending inserts and writes the outstanding events and a snapshot of every game to the
+        database, so the games are quick to load after a restart."""
+        await asyncio.gather(*self._inserts.values())
+        for code, game in list(self.games.items()):
+            await self._write(code, game, snapshot=True)
+
+
+store = GameStore()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+from time import monotonic, time
+from traceback import print_exc
+from typing import TYPE_CHECKING, Dict, Optional
+
+from tortoise.exceptions import IntegrityError
+
+from .db import db_archive, db_minesweeper
+from .boardPool import MAX_SOLVABLE_SIDE, boards
+from .socketManager import WebsocketManager
+from .gameStore import store
+from .protocol import pack_board
+
+if TYPE_CHECKING:
+    from .gameActor import GameActor
+
+# the largest number of columns and rows, boards above 64x64 are played tile by tile, see protocol.py
+MAX_SIDE = int(os.environ.get("MAX_BOARD_SIDE", 1000))
+
+
+class GameLifecycle:
+    """Keeps the memory and the database of a long running server bounded.
+
+    The WebsocketManagers and GameActors of every game on this node are registered here. A background task sweeps
+    every sweep_interval seconds:
+     - Games without connections that had no activity for idle_ttl seconds are written to the database and dropped
+       from memory together with their manager and actor. They are loaded again when somebody joins.
+     - Boards whose last_active in the database is older than board_ttl seconds are archived to db_archive or deleted,
+       depending on stale_policy ("archive" or "delete"). Their events are deleted in both cases.
+    At most max_games boards can exist at the same time, new games are rejected above that.
+    """
+
+    def __init__(self, idle_ttl: float = 600, board_ttl: float = 24 * 3600, sweep_interval: float = 60,
+                 max_games: int = 1000, stale_policy: str = "archive") -> None:
+        self.idle_ttl = idle_ttl
+        self.board_ttl = board_ttl
+        self.sweep_interval = sweep_interval
+        self.max_games = max_games
+        self.stale_policy = stale_policy
+        self.managers: Dict[str, WebsocketManager] = {}
+        self.actors: Dict[str, "GameActor"] = {}
+        self.last_active: Dict[int, float] = {}
+        self.evicted = 0
+        self.archived = 0
+        self.deleted = 0
+        self.rejected = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def touch(self, code: int):
+        """Marks a game as active."""
+        self.last_active[code] = monotonic()
+
+    def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def admit(self) -> bool:
+        """Returns True if another game can be made, counts the rejection otherwise."""
+        if await db_minesweeper.all().count() < self.max_games:
+            return True
+        self.rejected += 1
+        return False
+
+    def gauges(self) -> dict:
+        return {
+            "games": len(store.games),
+            "managers": len(self.managers),
+            "actors": len(self.actors),
+            "connections": sum(len(manager.active_connections) for manager in self.managers.values()),
+            "spectators": sum(len(manager.spectators) for manager in self.managers.values()),
+            "evicted": self.evicted,
+            "archived": self.archived,
+            "deleted": self.deleted,
+            "rejected": self.rejected
+        }
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print("Exception occured while sweeping games in lifecycle.py")
+                print(e)
+                print_exc()
+
+    async def sweep(self):
+        """Evicts the idle games from memory and removes the stale boards from the database."""
+        now = monotonic()
+        for code in set(store.games) | {int(code) for code in self.managers}:
+            manager = self.managers.get(str(code))
+            if manager is not None and (manager.active_connections or manager.spectators):
+                continue
+            if now - self.last_active.setdefault(code, now) >= self.idle_ttl:
+                await self.evict(code)
+
+        cutoff = int(time() - self.board_ttl)
+        for code in await db_minesweeper.filter(last_active__lt=cutoff).values_list("code", flat=True):
+            manager = self.managers.get(str(code))
+            if manager is None or not (manager.active_connections or manager.spectators):
+                await self.remove_board(code)
+
+    async def release(self, code: int) -> Optional[WebsocketManager]:
+        """Unregisters the manager and the actor of a game and applies the intents that are still queued.
+
+        Returns:
+            WebsocketManager | None: The manager, it is still subscribed to the bus
+        """
+        # unregisters first, so connections that come in meanwhile get a new manager
+        manager = self.managers.pop(str(code), None)
+        actor = self.actors.pop(str(code), None)
+        if actor is not None:
+            await actor.close()
+        return manager
+
+    async def evict(self, code: int):
+        """Drops a game from memory, its manager and actor included. A game whose changes could not be written stays
+        in memory with its manager, the next sweep tries again."""
+        manager = await self.release(code)
+        in_memory = code in store.games
+        # the state is written before the game is given up on the bus, so the next owner loads all of it
+        evicted = await store.evict(code)
+        if not evicted:
+            if manager is not None:
+                self.managers.setdefault(str(code), manager)
+            return
+        await self.unsubscribe(code, manager)
+        self.last_active.pop(code, None)
+        if in_memory:
+            self.evicted += 1
+
+    async def unsubscribe(self, code: int, manager: Optional[WebsocketManager]):
+        """Gives up a game on the bus after release. Subscriptions are keyed by node, so if somebody joined meanwhile
+        and a new manager of this node subscribed, the old manager must not unsubscribe, that would end the
+        subscription of the new one."""
+        if manager is not None and str(code) not in self.managers:
+            await manager.unsubscribe()
+
+    async def remove_board(self, code: int):
+        """Archives or deletes a stale board, depending on stale_policy. Boards without a first move have nothing to
+        archive, they are deleted. A game in memory is archived from there, any other is read from the database
+        without loading it."""
+        manager = await self.release(code)
+        game = None
+        if self.stale_policy == "archive":
+            game = store.games.get(code) or (await store.load(code))[0]
+        if game is not None:
+            await db_archive.create(code=code, n_mines=game.total_mines, board=json.dumps(pack_board(game)))
+            self.archived += 1
+        else:
+            self.deleted += 1
+        await store.delete(code)
+        await self.unsubscribe(code, manager)
+        self.last_active.pop(code, None)
+
+    async def close(self):
+        """Stops the sweeper and applies the intents that are still queued."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        while self.actors:
+            await self.actors.popitem()[1].close()
+
+
+lifecycle = GameLifecycle(max_games=int(os.environ.get("MAX_GAMES", 1000)),
+                          stale_policy=os.environ.get("STALE_BOARDS", "archive"))
+
+
+def settings_error(msIn: dict) -> Optional[dict]:
+    """Checks the size and the number of mines of a new game.
+
+    Args:
+        msIn (dict): n_cols, n_rows, solvable and n_mines of the game
+
+    Returns:
+        dict[str, str] | None: error with specific information, None if the settings are fine
+    """
+    if msIn["n_cols"] <= 5:
+        return {"error": "Number of colums is too small"}
+    elif msIn["n_cols"] > MAX_SIDE:
+        return {"error": f"Number of columns must be at or below {MAX_SIDE}"}
+    elif msIn["n_rows"] <= 5:
+        return {"error": "Number of rows is too small"}
+    elif msIn["n_rows"] > MAX_SIDE:
+        return {"error": f"Number of rows must be at or below {MAX_SIDE}"}
+    elif msIn["solvable"] and max(msIn["n_cols"], msIn["n_rows"]) > MAX_SOLVABLE_SIDE:
+        return {"error": f"Solvable boards must be at or below {MAX_SOLVABLE_SIDE}x{MAX_SOLVABLE_SIDE}"}
+    elif msIn["n_mines"] < 1:
+        return {"error": "Number of mines too small"}
+    elif msIn["n_mines"] >= msIn["n_rows"]*msIn["n_cols"] - 9:
+        return {"error": "Number of mines too big"}
+    return None
+
+
+async def create_game(msIn: dict) -> dict:
+    """Checks the settings of a new game and stores its db_minesweeper row. Used by the create route and by the
+    restart intent of gameActor.py.
+
+    Args:
+        msIn (dict): code, n_cols, n_rows, solvable and n_mines of the game
+
+    Returns:
+        dict[str, str]: either error with specific information or succes with "Game successfully created"
+    """
+    error = settings_error(msIn)
+    if error is not None:
+        return error
+    elif await db_minesweeper.exists(code=msIn["code"]):
+        return {"error": "A game with this code is already running"}
+    elif not await lifecycle.admit():
+        return {"error": "Too many games are running, try again later"}
+    else:
+        try:
+            await db_minesweeper.create(**msIn)
+        except IntegrityError:
+            # another request made a game with the code in the meantime
+            return {"error": "A game with this code is already running"}
+        if msIn["solvable"]:
+            boards.warm(msIn["n_cols"], msIn["n_rows"], msIn["n_mines"])
+        return {"success": "Game successfully created"}
@@ -0,0 +1,175 @@
+"""Instrumentation of the hot paths, exposed in the Prometheus text format on /metrics.
+
+ - minesweeper_intent_seconds{intent}: the time from receiving an intent until its changes are broadcast.
+ - minesweeper_db_queries_total{action} and minesweeper_db_query_seconds{action}: the database queries of every action.
+   The action is taken from a context variable, so queries are counted for the intent whose task made them. Queries of
+   background tasks count as "flush" or "insert", all others as "other".
+ - minesweeper_broadcast_seconds and minesweeper_broadcast_queue_depth: how long putting a broadcast into the queues of
+   all connections takes and the longest queue it found.
+
+A sampling profiler can be started and stopped at runtime, see Profiler.
+"""
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+
+action: ContextVar = ContextVar("action", default="other")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def escape(value: str) -> str:
+    """Escapes a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label value."""
+
+    def __init__(self, name: str, description: str, label: Optional[str] = None, buckets: Tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        # per label value: the count of every bucket, the sum and the count
+        self.series: Dict[str, list] = {}
+
+    def observe(self, value: float, label: str = ""):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series[label] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label, (counts, total, count) in sorted(self.series.items()):
+            labels = f'{self.label}="{escape(label)}",' if self.label else ""
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {count}')
+            labels = f'{{{labels[:-1]}}}' if labels else ""
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Metrics:
+    """The metrics of this process."""
+
+    def __init__(self) -> None:
+        self.intents = Histogram("minesweeper_intent_seconds", "Time from receiving an intent until it is broadcast.",
+                                 "intent")
+        self.queries = Histogram("minesweeper_db_query_seconds", "Duration of database queries.", "action",
+                                 QUERY_BUCKETS)
+        self.broadcasts = Histogram("minesweeper_broadcast_seconds", "Time to queue a broadcast for all connections.")
+        self.queue_depth = Histogram("minesweeper_broadcast_queue_depth",
+                                     "Longest send queue of a game at a broadcast.", buckets=DEPTH_BUCKETS)
+        self._instrumented = False
+
+    @contextmanager
+    def intent(self, name: str):
+        """Measures an intent and counts the queries made meanwhile for it."""
+        token = action.set(name)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.intents.observe(perf_counter() - start, name)
+            action.reset(token)
+
+    def instrument_database(self):
+        """Wraps the query methods of the tortoise sqlite client to time every query."""
+        if self._instrumented:
+            return
+        self._instrumented = True
+        from tortoise.backends.sqlite import client
+
+        def timed(method):
+            async def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    self.queries.observe(perf_counter() - start, action.get())
+            return wrapper
+
+        for cls in (client.SqliteClient, client.SqliteTransactionWrapper):
+            for name in ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script"):
+                if name in vars(cls):
+                    setattr(cls, name, timed(vars(cls)[name]))
+
+    def render(self, gauges: Dict[str, int]) -> str:
+        """Returns every metric in the Prometheus text format.
+
+        Args:
+            gauges (Dict[str, int]): Further values to expose as gauges, by name
+        """
+        lines = []
+        for histogram in (self.intents, self.queries, self.broadcasts, self.queue_depth):
+            lines += histogram.render()
+        lines += ["# HELP minesweeper_db_queries_total Number of database queries.",
+                  "# TYPE minesweeper_db_queries_total counter"]
+        for label, (_, _, count) in sorted(self.queries.series.items()):
+            lines.append(f'minesweeper_db_queries_total{{action="{escape(label)}"}} {count}')
+        for name, value in gauges.items():
+            lines += [f"# TYPE minesweeper_{name} gauge", f"minesweeper_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """A sampling profiler for the event loop thread that can be switched on and off at runtime.
+
+    A daemon thread takes the stack of the profiled thread every interval seconds and counts how often every stack
+    was seen. The result is in the collapsed format of flame graph tools: one line per stack, the frames separated
+    by semicolons and followed by the number of samples.
+    """
+
+    def __init__(self) -> None:
+        self.samples: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.005):
+        if self.running:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        target = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, args=(target, interval), daemon=True)
+        self._thread.start()
+
+    def _sample(self, target: int, interval: float):
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        """Stops sampling and returns the collapsed stacks, the most frequent first."""
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+metrics = Metrics()
+profiler = Profiler()
@@ -0,0 +1,186 @@
+"""Settings and schema migrations of the SQLite database.
+
+The tables are created by tortoise with generate_schemas, which only adds tables that are missing. Changes to
+existing tables are made here with the sqlite3 module, before tortoise opens the database.
+"""
+import os
+import sqlite3
+from time import time
+from urllib.parse import urlencode
+
+from numpy import packbits, zeros
+
+DB_PATH = os.environ.get("DATABASE", "database/minesweeper.sql")
+
+# WAL lets readers go on while the write-behind flush of gameStore.py writes. With WAL, synchronous=NORMAL only
+# syncs at checkpoints, a crash can lose the last transactions but never corrupts the database.
+PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+
+MINESWEEPER_TABLE = """CREATE TABLE "db_minesweeper" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "code" SMALLINT NOT NULL UNIQUE,
+    "n_cols" SMALLINT NOT NULL,
+    "n_rows" SMALLINT NOT NULL,
+    "solvable" INT NOT NULL,
+    "n_mines" SMALLINT NOT NULL
+)"""
+
+SPOT_TABLE = """CREATE TABLE "db_spot" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "code" SMALLINT NOT NULL,
+    "col" SMALLINT NOT NULL,
+    "row" SMALLINT NOT NULL,
+    "opened" INT NOT NULL,
+    "mine" INT NOT NULL,
+    "n_mines" SMALLINT NOT NULL,
+    "flagged" INT NOT NULL,
+    CONSTRAINT "uid_db_spot_code_7a86f7" UNIQUE ("code", "col", "row")
+)"""
+
+SNAPSHOT_TABLE = """CREATE TABLE "db_snapshot" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "code" SMALLINT NOT NULL UNIQUE,
+    "seq" INT NOT NULL,
+    "mines" BLOB NOT NULL,
+    "opened" BLOB NOT NULL,
+    "flagged" BLOB NOT NULL
+)"""
+
+EVENT_TABLE = """CREATE TABLE "db_event" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "game_id" INT NOT NULL,
+    "seq" INT NOT NULL,
+    "kind" SMALLINT NOT NULL,
+    "col" SMALLINT NOT NULL,
+    "row" SMALLINT NOT NULL,
+    CONSTRAINT "uid_db_event_game_id_ab979c" UNIQUE ("game_id", "seq")
+)"""
+
+
+def db_url(path: str = DB_PATH) -> str:
+    """Returns the tortoise url of the database with PRAGMAS, which tortoise runs on every new connection."""
+    return f"sqlite://{path}?{urlencode(PRAGMAS)}"
+
+
+def column_type(db: sqlite3.Connection, table: str, column: str):
+    for _, name, type_, *_ in db.execute(f'PRAGMA table_info("{table}")'):
+        if name == column:
+            return type_
+    return None
+
+
+def integer_keys(db: sqlite3.Connection):
+    """Moves db_minesweeper and db_spot from UUID to integer primary keys and adds the unique index on
+    (code, col, row) to db_spot. Spots that are in the table twice are only kept once."""
+    for table, create, columns in (
+            ("db_minesweeper", MINESWEEPER_TABLE, '"code", "n_cols", "n_rows", "solvable", "n_mines"'),
+            ("db_spot", SPOT_TABLE, '"code", "col", "row", "opened", "mine", "n_mines", "flagged"')):
+        if column_type(db, table, "id") in (None, "INTEGER"):
+            continue
+        db.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_uuid"')
+        db.execute(create)
+        db.execute(f'INSERT OR IGNORE INTO "{table}" ({columns}) SELECT {columns} FROM "{table}_uuid" ORDER BY rowid')
+        db.execute(f'DROP TABLE "{table}_uuid"')
+
+
+def last_active(db: sqlite3.Connection):
+    """Adds db_minesweeper.last_active, existing boards count as active now."""
+    if column_type(db, "db_minesweeper", "id") is None or column_type(db, "db_minesweeper", "last_active"):
+        return
+    db.execute(f'ALTER TABLE "db_minesweeper" ADD COLUMN "last_active" INT NOT NULL DEFAULT {int(time())}')
+    db.execute('CREATE INDEX "idx_db_mineswee_last_ac_dc4296" ON "db_minesweeper" ("last_active")')
+
+
+def event_log(db: sqlite3.Connection):
+    """Turns the db_spot rows of every board into its first snapshot in db_snapshot and drops db_spot. The events
+    of the games start after that snapshot, db_event is left to generate_schemas. See board_snapshots for where the
+    snapshots went next."""
+    if column_type(db, "db_spot", "id") is None:
+        return
+    if column_type(db, "db_snapshot", "id") is None:
+        db.execute(SNAPSHOT_TABLE)
+    sizes = {code: (n_cols, n_rows) for code, n_cols, n_rows in
+             db.execute('SELECT "code", "n_cols", "n_rows" FROM "db_minesweeper"')}
+    boards = {}
+    for code, col, row, mine, opened, flagged in db.execute(
+            'SELECT "code", "col", "row", "mine", "opened", "flagged" FROM "db_spot"'):
+        if code not in sizes:
+            continue
+        n_cols, n_rows = sizes[code]
+        if code not in boards:
+            boards[code] = zeros((3, n_rows * n_cols), dtype=bool)
+        boards[code][:, col * n_cols + row] = mine, opened, flagged
+    db.executemany('INSERT OR IGNORE INTO "db_snapshot" ("code", "seq", "mines", "opened", "flagged") '
+                   'VALUES (?, 0, ?, ?, ?)',
+                   [(code, *(packbits(bits).tobytes() for bits in board)) for code, board in boards.items()])
+    db.execute('DROP TABLE "db_spot"')
+
+
+BOARD_COLUMNS = {
+    "seed": "BIGINT",
+    "start_col": "SMALLINT",
+    "start_row": "SMALLINT",
+    "flip": "SMALLINT NOT NULL DEFAULT 0",
+    "mines": "BLOB",
+    "seq": "INT NOT NULL DEFAULT 0",
+    "opened": "BLOB",
+    "flagged": "BLOB"
+}
+
+
+def board_snapshots(db: sqlite3.Connection):
+    """Adds the seed and the snapshot of a game to db_minesweeper and moves the snapshots of db_snapshot there. The
+    boards that were migrated keep their mines, they have no seed."""
+    if column_type(db, "db_minesweeper", "id") is None:
+        return
+    for column, type_ in BOARD_COLUMNS.items():
+        if column_type(db, "db_minesweeper", column) is None:
+            db.execute(f'ALTER TABLE "db_minesweeper" ADD COLUMN "{column}" {type_}')
+    if column_type(db, "db_snapshot", "id") is None:
+        return
+    db.execute('UPDATE "db_minesweeper" SET ("mines", "seq", "opened", "flagged") = '
+               '(SELECT "mines", "seq", "opened", "flagged" FROM "db_snapshot" '
+               'WHERE "db_snapshot"."code" = "db_minesweeper"."code") '
+               'WHERE "code" IN (SELECT "code" FROM "db_snapshot")')
+    db.execute('DROP TABLE "db_snapshot"')
+
+
+def event_game_ids(db: sqlite3.Connection):
+    """Keys db_event by the id of the db_minesweeper row instead of the code, which a later game can reuse. Events of
+    codes without a board are left behind by deleted games and dropped."""
+    if column_type(db, "db_event", "code") is None:
+        return
+    db.execute('ALTER TABLE "db_event" RENAME TO "db_event_code"')
+    db.execute(EVENT_TABLE)
+    db.execute('INSERT OR IGNORE INTO "db_event" ("game_id", "seq", "kind", "col", "row") '
+               'SELECT "db_minesweeper"."id", "db_event_code"."seq", "kind", "db_event_code"."col", '
+               '"db_event_code"."row" FROM "db_event_code" '
+               'JOIN "db_minesweeper" ON "db_minesweeper"."code" = "db_event_code"."code" '
+               'ORDER BY "db_event_code"."id"')
+    db.execute('DROP TABLE "db_event_code"')
+
+
+MIGRATIONS = [integer_keys, last_active, event_log, board_snapshots, event_game_ids]
+
+
+def migrate(path: str = DB_PATH):
+    """Brings an existing database up to date, each migration in its own transaction. New databases are left to
+    generate_schemas.
+
+    Args:
+        path (str): The path of the SQLite file
+    """
+    if not os.path.exists(path):
+        return
+    db = sqlite3.connect(path, isolation_level=None)
+    try:
+        for migration in MIGRATIONS:
+            db.execute("BEGIN")
+            try:
+                migration(db)
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+    finally:
+        db.close()
@@ -0,0 +1,149 @@
+"""The compact wire format of the game websocket.
+
+Clients that connect with ?protocol=compact get the board as packed arrays instead of one dictionary per spot
+(see Game.spot), and every later change as flat indices. The flat index of a spot is col * n_cols + row, the order
+the spots are sent in with the json protocol.
+
+ - board: {"n_cols", "n_rows", "mines", "numbers", "opened", "flagged"}, where mines, opened and flagged are bitmaps
+   (numpy.packbits, most significant bit first) and numbers holds two spots per byte, the first in the high nibble.
+   All four are base64 encoded.
+ - {"opened": [index, ...]} for opened spots, {"flagged": [index]} and {"unflagged": [index]} for flags.
+ - {"status": "lost" | "won"} when the game is over.
+Messages with changes also carry the counters safe_left, flags and mines_left of the game, and its version: game_id,
+which tells apart the boards a code had, and version, the number of actions applied to the board so far.
+The changes of one batch of intents (see gameActor.py) come as a single message with several of these keys.
+
+A player that reconnects with ?game_id=...&version=... of the last message it got only gets the changes since then,
+as one message with opened, flagged and unflagged, or as the usual messages with the json protocol. The whole board is
+sent if the game does not remember that many changes any more (see Game.history) or was restarted.
+
+Boards with more than TILED_SPOTS spots are tiled, only the compact protocol can play them. Instead of the board the
+players get {"tile": TILE} next to the size and subscribe to the tiles of their viewport with
+{"intent": "viewport", "col", "row", "n_cols", "n_rows"}, a rectangle of the board. For every tile they did not have
+yet they get the tile board {"tile", "col", "row", "n_cols", "n_rows", "mines", "numbers", "opened", "flagged"}, the
+board format above for the spots from (col, row) on. Changes come as one message per tile with the tile and the
+opened, flagged and unflagged flat indices of the board in that tile, only for the tiles in the viewport, followed by
+a message with the rest: counters, version and status. Once the first move placed the mines, every subscribed tile is
+sent again.
+
+Spectators (/ws/watch/{code}) always get the compact protocol, the changes merged into one message per update, see
+spectatorFeed.py.
+
+{"intent": "hint"} is answered in both protocols with {"hint", "game_id", "version"}, the hint of hints.py with flat
+indices: spots and probabilities, the mine probability of every closed spot next to an opened number, safe and mines,
+the spots among them that are decided, and other, the probability of every other closed spot.
+"""
+from base64 import b64decode, b64encode
+
+from numpy import asarray, frombuffer, packbits, split, unpackbits, ndarray, unique, zeros
+
+from ..minesweeper import Game
+
+PROTOCOLS = ("json", "compact")
+# boards with more spots than this are only sent tile by tile
+TILED_SPOTS = 64 * 64
+# the most tiles a viewport can hold
+MAX_VIEWPORT_TILES = 64
+CHANGES = ("opened", "flagged", "unflagged")
+
+
+def tiled(n_cols: int, n_rows: int) -> bool:
+    return n_cols * n_rows > TILED_SPOTS
+
+
+def pack_bits(mask: ndarray) -> str:
+    return b64encode(packbits(mask.ravel()).tobytes()).decode("ascii")
+
+
+def unpack_bits(data: str, n_cols: int, n_rows: int) -> ndarray:
+    bits = unpackbits(frombuffer(b64decode(data), dtype="uint8"), count=n_cols * n_rows)
+    return bits.astype(bool).reshape(n_rows, n_cols)
+
+
+def pack_numbers(numbers: ndarray) -> str:
+    flat = zeros(numbers.size + numbers.size % 2, dtype="uint8")
+    flat[:numbers.size] = numbers.ravel()
+    return b64encode((flat[0::2] << 4 | flat[1::2]).tobytes()).decode("ascii")
+
+
+def unpack_numbers(data: str, n_cols: int, n_rows: int) -> ndarray:
+    packed = frombuffer(b64decode(data), dtype="uint8")
+    flat = zeros(packed.size * 2, dtype="uint8")
+    flat[0::2], flat[1::2] = packed >> 4, packed & 15
+    return flat[:n_cols * n_rows].reshape(n_rows, n_cols)
+
+
+def pack_board(game: Game) -> dict:
+    """Packs the whole state of a game.
+
+    Args:
+        game (Game): The game to pack
+
+    Returns:
+        dict: The board as described in the module docstring
+    """
+    return pack_arrays(game.mines, game.n_mines, game.opened, game.flagged)
+
+
+def pack_arrays(mines: ndarray, numbers: ndarray, opened: ndarray, flagged: ndarray) -> dict:
+    n_rows, n_cols = mines.shape
+    return {
+        "n_cols": n_cols,
+        "n_rows": n_rows,
+        "mines": pack_bits(mines),
+        "numbers": pack_numbers(numbers),
+        "opened": pack_bits(opened),
+        "flagged": pack_bits(flagged)
+    }
+
+
+def pack_tile(game: Game, tile: int) -> dict:
+    """Packs the state of one tile of a game like pack_board, see the module docstring."""
+    c0, c1, r0, r1 = game.tile_bounds(tile)
+    window = (slice(c0, c1), slice(r0, r1))
+    board = pack_arrays(game.mines[window], game.n_mines[window], game.opened[window], game.flagged[window])
+    return {"tile": tile, "col": c0, "row": r0, **board}
+
+
+def split_tiles(game: Game, message: dict) -> tuple:
+    """Splits a compact message into one message per tile with the changes in it and the rest of the message.
+
+    Args:
+        game (Game): The game of the message
+        message (dict): A compact message with changes, as lists or arrays of flat indices
+
+    Returns:
+        Tuple[dict, Dict[int, dict]]: The message without the changes and the changes by tile
+    """
+    tiles = {}
+    for key in CHANGES:
+        indices = message.get(key)
+        if indices is None or len(indices) == 0:
+            continue
+        indices = asarray(indices)
+        # sorts the indices by tile once and cuts them where the tile changes, instead of one scan per tile
+        tile_of = game.tile_of(indices)
+        order = tile_of.argsort(kind="stable")
+        keys, starts = unique(tile_of[order], return_index=True)
+        for tile, part in zip(keys.tolist(), split(indices[order], starts[1:])):
+            tiles.setdefault(tile, {"tile": tile})[key] = part.tolist()
+    return {key: value for key, value in message.items() if key not in CHANGES}, tiles
+
+
+def unpack_board(board: dict) -> dict:
+    """Unpacks a board made by pack_board into arrays indexed [col, row].
+
+    Args:
+        board (dict): The packed board
+
+    Returns:
+        dict: mines, numbers, opened and flagged as numpy arrays
+    """
+    n_cols, n_rows = board["n_cols"], board["n_rows"]
+    return {
+        "mines": unpack_bits(board["mines"], n_cols, n_rows),
+        "numbers": unpack_numbers(board["numbers"], n_cols, n_rows),
+        "opened": unpack_bits(board["opened"], n_cols, n_rows),
+        "flagged": unpack_bits(board["flagged"], n_cols, n_rows)
+    }
+
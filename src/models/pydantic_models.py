@@ -3,3 +3,13 @@ from pydantic import BaseModel
 
 class join_pyd(BaseModel):
     code: int
+
+
+class new_field_pyd(BaseModel):
+    code: int
+    n_cols: int
+    n_rows: int
+    solvable: bool
+    n_mines: int
+    start_col: int
+    start_row: int
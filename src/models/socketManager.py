@@ -1,29 +1,293 @@
-from typing import List
+import asyncio
+import json
+import os
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
 from fastapi import WebSocket
 from traceback import print_exc
 
+from .eventBus import NODE, EventBus
+from .metrics import metrics
+from .spectatorFeed import SpectatorFeed
+
+# the messages a connection can fall behind, and what happens to a connection that falls behind further
+MAX_QUEUE = int(os.environ.get("MAX_QUEUE", 256))
+SLOW_CLIENTS = os.environ.get("SLOW_CLIENTS", "disconnect")
+
+
+def serialize(message: dict) -> str:
+    """Serializes a message the same way WebSocket.send_json does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class RemoteConnection(NamedTuple):
+    """A connection of the game on another node of the event bus, intents of it are answered over the bus."""
+    node: str
+    conn: str
+
+
+def connection_id(websocket: WebSocket) -> str:
+    return str(id(websocket))
+
 
 class WebsocketManager:
-    def __init__(self) -> None:
+    """Holds the websocket connections of one game and sends messages to them.
+
+    Every message is serialized once and put into a bounded queue per connection, which a separate task per
+    connection sends from. So a slow client only delays its own messages. A connection whose queue is full is handled
+    by slow_policy: "disconnect" closes it, "drop" leaves out the message for that connection.
+
+    With an event bus the manager also publishes its broadcasts to the managers of the same game on other nodes and
+    delivers theirs, see eventBus.py. Intents that other nodes forward to the owner of the game are passed to on_intent.
+
+    Connections to a tiled board subscribe to the tiles of their viewport, see protocol.py. They get the messages of
+    a broadcast that are split by tile only for those tiles, each serialized once for all connections that have it.
+
+    Spectators are connections that only watch, they are not in active_connections and get the broadcasts merged at
+    a limited rate by the SpectatorFeed of the game instead.
+    """
+
+    def __init__(self, max_queue: int = MAX_QUEUE, slow_policy: str = SLOW_CLIENTS, code: int = None,
+                 bus: Optional[EventBus] = None, node: str = NODE) -> None:
+        self.code = code
+        self.bus = bus
+        self.node = node
+        self.on_intent: Optional[Callable] = None
+        self._subscription: Optional[asyncio.Future] = None
+        self.connections: Dict[str, WebSocket] = {}
         self.active_connections: List[WebSocket] = []
+        # the connections that asked for the compact protocol, see protocol.py
+        self.compact_connections: Set[WebSocket] = set()
+        # the tiles every connection to a tiled board subscribed to
+        self.viewports: Dict[WebSocket, Set[int]] = {}
+        self.feed = SpectatorFeed(self._send_all)
+        self.max_queue = max_queue
+        self.slow_policy = slow_policy
+        self.queues: Dict[WebSocket, asyncio.Queue] = {}
+        self.senders: Dict[WebSocket, asyncio.Task] = {}
+        self.dropped = 0
+        self.slow_disconnects = 0
+
+    @property
+    def spectators(self) -> Set[WebSocket]:
+        return self.feed.spectators
+
+    async def connect(self, websocket: WebSocket, compact: bool = False, spectator: bool = False,
+                      joining: bool = False):
+        """Accepts a connection of the game.
 
-    async def connect(self, websocket: WebSocket):
+        Args:
+            websocket (WebSocket): The connection
+            compact (bool): True for the compact protocol, see protocol.py
+            spectator (bool): True for a connection that only watches, see SpectatorFeed
+            joining (bool): True for a spectator whose board comes from another node
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
+        await self.subscribe()
+        if spectator:
+            self.feed.connect(websocket, joining)
+        else:
+            self.active_connections.append(websocket)
+        self.connections[connection_id(websocket)] = websocket
+        if compact:
+            self.compact_connections.add(websocket)
+        self.queues[websocket] = asyncio.Queue(self.max_queue)
+        self.senders[websocket] = asyncio.create_task(self._send_from_queue(websocket))
 
     def disconnect(self, websocket: WebSocket):
-        try:
+        if websocket not in self.queues:
+            return
+        self.compact_connections.discard(websocket)
+        self.viewports.pop(websocket, None)
+        if websocket in self.feed.spectators:
+            self.feed.disconnect(websocket)
+        else:
             self.active_connections.remove(websocket)
-        except Exception as e:
-            print("Exception occured at line 15 in socketManager.py")
-            print(e)
-            print_exc()
+        del self.connections[connection_id(websocket)]
+        del self.queues[websocket]
+        sender = self.senders.pop(websocket)
+        if sender is not asyncio.current_task():
+            sender.cancel()
 
-    async def broadcast(self, message: dict = {}):
-        for socket in self.active_connections:
+    async def _send_from_queue(self, websocket: WebSocket):
+        queue = self.queues[websocket]
+        while True:
+            text = await queue.get()
             try:
-                await socket.send_json(message)
+                await websocket.send_text(text)
             except Exception as e:
-                print("Exception occured at line 22 in socketManager.py")
+                print("Exception occured while sending to a websocket in socketManager.py")
                 print(e)
                 print_exc()
+                self.disconnect(websocket)
+                return
+
+    def _enqueue(self, websocket: WebSocket, text: str):
+        if websocket not in self.queues:
+            return
+        try:
+            self.queues[websocket].put_nowait(text)
+        except asyncio.QueueFull:
+            # spectators only get changes, one that misses some has to reconnect
+            if self.slow_policy == "drop" and websocket not in self.feed.spectators:
+                self.dropped += 1
+                return
+            self.slow_disconnects += 1
+            self.disconnect(websocket)
+            asyncio.create_task(self._close(websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, message: dict):
+        """Sends a message to a single connection, in order with the broadcasts it receives.
+
+        Args:
+            websocket (WebSocket | RemoteConnection): The connection, on this node or another one
+            message (dict): The message
+        """
+        if isinstance(websocket, RemoteConnection):
+            self.bus.publish(self.code, self.node, {"type": "direct", "to": websocket.node, "conn": websocket.conn,
+                                                    "text": serialize(message)})
+        else:
+            self._enqueue(websocket, serialize(message))
+
+    def _send_all(self, websockets: Set[WebSocket], messages: List[dict]):
+        texts = [serialize(message) for message in messages]
+        for websocket in websockets:
+            for text in texts:
+                self._enqueue(websocket, text)
+
+    def set_viewport(self, websocket: WebSocket, tiles: List[int]) -> List[int]:
+        """Subscribes a connection to the tiles of its viewport, instead of the ones it had before.
+
+        Args:
+            websocket (WebSocket): The connection
+            tiles (List[int]): The tiles of the viewport
+
+        Returns:
+            List[int]: The tiles the connection did not have before
+        """
+        before = self.viewports.get(websocket, set())
+        self.viewports[websocket] = set(tiles)
+        return [tile for tile in tiles if tile not in before]
+
+    async def subscribe(self):
+        """Subscribes to the events of the game on the bus, once."""
+        if self.bus is None:
+            return
+        if self._subscription is None:
+            self._subscription = asyncio.ensure_future(self.bus.subscribe(self.code, self.node, self.receive))
+        await self._subscription
+
+    async def unsubscribe(self):
+        if self.bus is not None and self._subscription is not None:
+            self._subscription = None
+            await self.bus.unsubscribe(self.code, self.node)
+
+    @property
+    def wants_json(self) -> bool:
+        """True if a broadcast may go to a connection in the json protocol: one of this node, or any connection
+        if other nodes share the game."""
+        if self.bus is not None and self.bus.shared(self.code):
+            return True
+        return any(socket not in self.compact_connections for socket in self.active_connections)
+
+    @property
+    def is_owner(self) -> bool:
+        """True if the game is played on this node, always True without a bus."""
+        return self.bus is None or self.bus.owner(self.code) == self.node
+
+    def forward(self, websocket: WebSocket, name: str, data: dict):
+        """Sends an intent of a connection of this node to the owner of the game.
+
+        Args:
+            websocket (WebSocket): The connection the intent came from
+            name (str): The name of the player
+            data (dict): The intent
+        """
+        self.bus.publish(self.code, self.node, {"type": "intent", "origin": self.node,
+                                                "conn": connection_id(websocket), "name": name, "data": data})
+
+    def receive(self, event: dict):
+        """Handles an event that another node published on the bus."""
+        if event["type"] == "broadcast":
+            tiles = {int(tile): text for tile, text in event.get("tiles", {}).items()}
+            self._deliver(event["json"], event["compact"], tiles=tiles, rest=event.get("rest"))
+        elif event["type"] == "direct" and event["to"] == self.node:
+            websocket = self.connections.get(event["conn"])
+            if websocket is not None:
+                self._enqueue(websocket, event["text"])
+                self.feed.joined(websocket)
+        elif event["type"] == "intent" and self.is_owner and self.on_intent is not None:
+            self.on_intent(RemoteConnection(event["origin"], event["conn"]), event["name"], event["data"])
+
+    async def broadcast(self, message: dict = {}, compact: dict = None):
+        """Sends a message to every connection of the game without waiting for any of them.
+
+        Args:
+            message (dict): The message in the json protocol
+            compact (dict, optional): The same message in the compact protocol, if it differs from message
+        """
+        await self.broadcast_many([message], compact)
+
+    async def broadcast_many(self, messages: List[dict], compact: dict = None, tiles: Dict[int, dict] = None,
+                             rest: dict = None):
+        """Sends several messages to every connection of the game, for changes that the compact protocol combines
+        into a single message.
+
+        Args:
+            messages (List[dict]): The messages in the json protocol, sent in order
+            compact (dict, optional): The combined message in the compact protocol, None to send messages instead
+            tiles (Dict[int, dict], optional): The compact message split by tile, for the connections with a viewport
+            rest (dict, optional): What is left of the compact message without the tiles, sent after them. Connections
+                with a viewport get compact like the others if there is no rest
+        """
+        start = perf_counter()
+        if self.bus is not None and self.bus.shared(self.code):
+            texts = [serialize(message) for message in messages]
+            compact_text = serialize(compact) if compact is not None else None
+            tile_texts = {tile: serialize(message) for tile, message in (tiles or {}).items()}
+            rest_text = serialize(rest) if rest is not None else None
+            self.bus.publish(self.code, self.node, {"type": "broadcast", "json": texts, "compact": compact_text,
+                                                    "tiles": tile_texts, "rest": rest_text})
+            self._deliver(texts, compact_text, tiles=tile_texts, rest=rest_text)
+        else:
+            self._deliver(messages, compact, serialized=False, tiles=tiles, rest=rest)
+        metrics.broadcasts.observe(perf_counter() - start)
+        metrics.queue_depth.observe(max((queue.qsize() for queue in self.queues.values()), default=0))
+        # lets the senders run before the caller goes on
+        await asyncio.sleep(0)
+
+    def _deliver(self, messages: list, compact=None, serialized: bool = True, tiles: dict = None, rest=None):
+        """Puts messages into the queues of the connections of this node, serializing them once if they are not
+        serialized yet. The spectators get compact later, see SpectatorFeed."""
+        if compact is not None and self.feed.spectators:
+            self.feed.add(json.loads(compact) if serialized else compact)
+        texts = messages if serialized else None
+        compact_text = compact if serialized else None
+        tile_texts = tiles if serialized else {}
+        rest_text = rest if serialized else None
+        for socket in list(self.active_connections):
+            viewport = self.viewports.get(socket)
+            if viewport is not None and rest is not None:
+                for tile in viewport.intersection(tiles or ()):
+                    if tile not in tile_texts:
+                        tile_texts[tile] = serialize(tiles[tile])
+                    self._enqueue(socket, tile_texts[tile])
+                if rest_text is None:
+                    rest_text = serialize(rest)
+                self._enqueue(socket, rest_text)
+            elif compact is not None and socket in self.compact_connections:
+                if compact_text is None:
+                    compact_text = serialize(compact)
+                self._enqueue(socket, compact_text)
+            else:
+                if texts is None:
+                    texts = [serialize(message) for message in messages]
+                for text in texts:
+                    self._enqueue(socket, text)
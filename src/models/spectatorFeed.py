@@ -0,0 +1,115 @@
+import asyncio
+import os
+from traceback import print_exc
+from typing import Callable, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from .protocol import CHANGES
+
+# how many updates per second spectators get at most
+SPECTATOR_RATE = float(os.environ.get("SPECTATOR_RATE", 2))
+
+
+class SpectatorFeed:
+    """Sends the changes of one game to its spectators, connections that watch the game but never send intents.
+
+    The compact messages of the broadcasts are not sent to spectators one by one but merged into the pending update:
+    every spot opened meanwhile, the last state of every flag that changed and the latest counters, version and
+    status. A task sends it rate times per second at most, serialized once for all spectators, so a game with
+    hundreds of spectators costs its players a merge per broadcast. A board that came with a broadcast, as with the
+    first move, replaces everything pending and is sent before the changes after it.
+
+    A spectator that joined on a node which does not own the game waits for its board, see joining, and only gets
+    updates after it.
+    """
+
+    def __init__(self, send: Callable[[Set[WebSocket], List[dict]], None], rate: float = SPECTATOR_RATE) -> None:
+        # sends messages to connections, serializing them once
+        self.send = send
+        self.interval = 1 / rate
+        self.spectators: Set[WebSocket] = set()
+        # the spectators that did not get their board yet
+        self.joining: Set[WebSocket] = set()
+        self.board: Optional[dict] = None
+        self.opened: List[int] = []
+        self.flags: Dict[int, bool] = {}
+        self.rest: dict = {}
+        self.updates = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def connect(self, websocket: WebSocket, joining: bool = False):
+        """Adds a spectator.
+
+        Args:
+            websocket (WebSocket): The connection
+            joining (bool): True if the board comes later from another node, the spectator gets no updates until then
+        """
+        self.spectators.add(websocket)
+        if joining:
+            self.joining.add(websocket)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._tick_forever())
+
+    def disconnect(self, websocket: WebSocket):
+        self.spectators.discard(websocket)
+        self.joining.discard(websocket)
+        if not self.spectators:
+            self.close()
+
+    def joined(self, websocket: WebSocket):
+        """Marks that a spectator got its board."""
+        self.joining.discard(websocket)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.board, self.opened, self.flags, self.rest = None, [], {}, {}
+
+    def add(self, message: dict):
+        """Merges a broadcast in the compact protocol into the pending update."""
+        if not self.spectators:
+            return
+        if "board" in message:
+            self.board, self.opened, self.flags, self.rest = message, [], {}, {}
+            return
+        self.opened += message.get("opened", [])
+        for i in message.get("flagged", []):
+            self.flags[i] = True
+        for i in message.get("unflagged", []):
+            self.flags[i] = False
+        self.rest.update({key: value for key, value in message.items() if key not in CHANGES})
+
+    def take(self) -> List[dict]:
+        """Returns the pending messages and starts a new update."""
+        messages = [] if self.board is None else [self.board]
+        if self.opened or self.flags or self.rest:
+            update = {"opened": self.opened}
+            flagged = [i for i, flag in self.flags.items() if flag]
+            unflagged = [i for i, flag in self.flags.items() if not flag]
+            if flagged:
+                update["flagged"] = flagged
+            if unflagged:
+                update["unflagged"] = unflagged
+            messages.append({**update, **self.rest})
+        self.board, self.opened, self.flags, self.rest = None, [], {}, {}
+        return messages
+
+    async def _tick_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                print("Exception occured while sending to spectators in spectatorFeed.py")
+                print(e)
+                print_exc()
+
+    def tick(self):
+        """Sends the pending update to every spectator that has its board."""
+        messages = self.take()
+        if not messages:
+            return
+        self.send(self.spectators - self.joining, messages)
+        self.updates += 1
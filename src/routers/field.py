@@ -1,38 +1,104 @@
-from fastapi import APIRouter
-from numpy import ravel
-from typing import List
-
-from ..minesweeper import Minesweeper
-from ..models.db import db_minesweeper, db_spot, minesweeperIn_pydantic, spot_pydantic, minesweeper_pydantic
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from tortoise.exceptions import DoesNotExist
+
+from ..minesweeper import Game
+from ..minesweeper.hints import hint
+from ..models.db import db_minesweeper
+from ..models.pydantic_models import new_field_pyd
+from ..models.gameStore import store
+from ..models.boardPool import boards
+from ..models.lifecycle import lifecycle, settings_error
+from ..models.metrics import metrics
+from ..models.protocol import tiled
+from .websockets import get_manager
 
 router = APIRouter(prefix="/field",
                    tags=["Minesweeper field Operations"])
 
 
+async def owned_game(code: int) -> Optional[Game]:
+    """Returns the running game of a code if this node plays it. With several nodes only the owner of a game may
+    load it, a copy on another node would split its state, see eventBus.py.
+
+    Args:
+        code (int): The Code for the game
+
+    Raises:
+        HTTPException: 409 if another node plays the game
+
+    Returns:
+        Game | None: The in-memory game, None before the first move
+    """
+    manager = get_manager(code)
+    await manager.subscribe()
+    if not manager.is_owner:
+        raise HTTPException(status_code=409, detail=f"Game {code} is played on another node, use its websocket")
+    return await store.get(code)
+
+
+async def get_game(code: int, col: int, row: int) -> Game:
+    """Returns the running game of a code and makes sure the spot at col and row is part of its board.
+
+    Args:
+        code (int): The Code for the game
+        col (int): The column of the spot
+        row (int): The row of the spot
+
+    Raises:
+        DoesNotExist: If there is no board for the code or the spot is outside of it
+        HTTPException: 409 if another node plays the game, see owned_game
+
+    Returns:
+        Game: The in-memory game
+    """
+    game = await owned_game(code)
+    if game is None or not game.in_bounds(col, row):
+        raise DoesNotExist(f"The spot {col}-{row} of game {code} does not exist")
+    return game
+
+
 @router.post("/new/")
-async def new_field(msIn: minesweeperIn_pydantic):
+async def new_field(msIn: new_field_pyd):
+    """Makes a new game with its mines placed around a start spot right away, instead of on the first move.
+
+    Args:
+        msIn (new_field_pyd): The settings of the game, like for the create route, and the start spot
+
+    Returns:
+        dict: The settings, with the number of mines placed and whether the board is solvable
+    """
     msIn_dict = msIn.dict()
-    ms = Minesweeper(
-        msIn_dict["n_cols"],
-        msIn_dict["n_rows"],
-        msIn_dict["start_col"],
-        msIn_dict["start_row"]
-    )
-    ms.place_mines(msIn_dict["n_mines"])
-    msIn_dict.update({"n_mines": ms.n_mines})
-    db_ms_obj = await db_minesweeper.create(**msIn_dict)
-    # TODO see if opened and flagged values are needed, probably not bc. of default values in the db model
-    default_values = {"opened": False,
-                      "code": msIn_dict["code"], "flagged": False}
-    for spot in ravel(ms.field):
-        db_sp_obj = await db_spot.create(**{**spot.get_db_attribs(), **default_values})
-    return msIn_dict
+    with metrics.intent("create"):
+        error = settings_error(msIn_dict)
+        if error is not None:
+            return error
+        # the columns of a board run along n_rows and its rows along n_cols, like the arrays of Game
+        if not (0 <= msIn_dict["start_col"] < msIn_dict["n_rows"] and
+                0 <= msIn_dict["start_row"] < msIn_dict["n_cols"]):
+            return {"error": "The start spot is not on the board"}
+        if not await lifecycle.admit():
+            return {"error": "Too many games are running, try again later"}
+        ms = await boards.make_board(
+            msIn_dict["n_cols"],
+            msIn_dict["n_rows"],
+            msIn_dict["start_col"],
+            msIn_dict["start_row"],
+            msIn_dict["n_mines"],
+            msIn_dict["solvable"]
+        )
+        msIn_dict.update({"n_mines": ms.n_mines, "solvable": bool(ms.solvable)})
+        db_ms_obj = await db_minesweeper.create(**{key: msIn_dict[key] for key in
+                                                   ("code", "n_cols", "n_rows", "solvable", "n_mines")})
+        store.create(msIn_dict["code"], ms, db_ms_obj.id)
+        return msIn_dict
 
 
 @router.get("/{code}-{col}-{row}")
 async def get_spot(code: int, col: int, row: int):
-    return await spot_pydantic.from_queryset_single(
-        db_spot.get(code=code, col=col, row=row))
+    game = await get_game(code, col, row)
+    return game.spot(col, row)
 
 
 @router.get("/open/{code}-{col}-{row}")
@@ -43,88 +109,39 @@ async def open(code: int, col: int, row: int, double_click: bool = False):
         code (int): The Code for the game the square belongs to
         col (int): The column the spot has in the game determined by code
         row (int): The row the spot has in the game determined by code
-        double_click (bool): Double click to open additional fields
+        double_click (bool): Double click on an opened number to open its neighbors, if all its mines are flagged
     """
-    OPENED = []
-
-    async def update_opened(code: int, col: int, row: int):
-        await db_spot.filter(code=code, col=col, row=row).update(opened=True)
-        spot = await spot_pydantic.from_queryset_single(db_spot.get(
-            code=code, col=col, row=row))
-        spot = spot.dict()
-        return spot
-
-    async def open_zeros(spot: dict, code: int, size: tuple):
-        """Recursive function that open's all the zero's neighbors and their neighbors if they are zero.
-
-        Args:
-            spot (dict): The dictionary of a spot_pydantic model
-            code (int): The game the spot belongs to
-
-        Returns:
-            list[dict]: A list of all the spots that are opened
-        """
-        col, row = spot["col"], spot["row"]
-        n_cols, n_rows = size
-
-        if spot["n_mines"] != 0:
-            spot = await update_opened(code=code, col=col, row=row)
-
-            OPENED.append(spot)
+    with metrics.intent("chord" if double_click else "open"):
+        game = await get_game(code, col, row)
 
+        if double_click:
+            opened = game.chord(col, row)
         else:
-            neighbors = [
-                (col-1, row-1), (col, row-1), (col+1, row-1),
-                (col-1, row),                 (col+1, row),
-                (col-1, row+1), (col, row+1), (col+1, row+1)
-            ]
-
-            if spot["opened"] == False and spot["flagged"] == False:
-                spot = await update_opened(code, col, row)
-
-                OPENED.append(spot)
-                for nb in neighbors:
-                    if 0 <= nb[0] < n_rows and 0 <= nb[1] < n_cols:
-                        nb = await spot_pydantic.from_queryset_single(db_spot.get(code=code, col=nb[0], row=nb[1]))
-                        nb = nb.dict()
-                        if nb["opened"] == False and nb["flagged"] == False:
-                            await open_zeros(nb, code, size)
-
-    spot = await spot_pydantic.from_queryset_single(
-        db_spot.get(code=code, col=col, row=row))
-    spot_dict = spot.dict()
-
-    if spot_dict["mine"] == True and spot_dict["flagged"] == False:
-        # TODO define better return value for frontend
-        return {"game_status": "lost"}
-
-    ms = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=code))
-    ms = ms.dict()
-    size = (ms["n_cols"], ms["n_rows"])
-
-    # TODO make sure to open only if it is a double click or the field is not yet opened
-    if not double_click:
-        await open_zeros(spot_dict, code, size)
-        spots = await spot_pydantic.from_queryset(
-            db_spot.filter(code=code, mine=False, opened=False))
-        spots = [spot.dict() for spot in spots]
-        if len(spots) == 0:
-            return {"status": "You Won!"}
-        return OPENED
+            opened = game.open(col, row)
+        store.changed(game)
+        return opened
 
 
 @router.put("/set-flag/{code}-{col}-{row}")
 async def set_Flag(code: int, col: int, row: int):
-    spot = await spot_pydantic.from_queryset_single(
-        db_spot.get(code=code, col=col, row=row))
-    spot = spot.dict()
-
-    if spot["opened"] == True:
-        # TODO define better return value for frontend
-        return {"status": "Spot is already opened"}
-    elif spot["flagged"] == True:
-        await db_spot.filter(code=code, col=col, row=row).update(flagged=False)
-        return {"remove": True, "col": spot["col"], "row": spot["row"]}
-    else:
-        await db_spot.filter(code=code, col=col, row=row).update(flagged=True)
-        return {"success": True, "col": spot["col"], "row": spot["row"]}
+    with metrics.intent("flag"):
+        game = await get_game(code, col, row)
+        status = game.flag(col, row)
+        store.changed(game)
+        return status
+
+
+@router.get("/hint/{code}")
+async def get_hint(code: int):
+    """Get request that returns the mine probabilities of the closed spots of a running game, see hints.py.
+
+    Args:
+        code (int): The Code for the game
+    """
+    with metrics.intent("hint"):
+        game = await owned_game(code)
+        if game is None:
+            raise DoesNotExist(f"Game {code} has no board yet")
+        if tiled(game.n_cols, game.n_rows):
+            return {"error": "Boards of this size have no hints"}
+        return {"hint": hint(game), "game_id": game.game_id, "version": game.seq}
@@ -2,6 +2,9 @@ from fastapi import APIRouter
 
 from ..models.db import minesweeperIn_pydantic, db_minesweeper
 from ..models.pydantic_models import join_pyd
+from ..models.boardPool import boards
+from ..models.lifecycle import create_game, lifecycle
+from ..models.metrics import metrics
 
 router = APIRouter(prefix="", tags=["General Options"])
 
@@ -31,20 +34,15 @@ async def create_new_game(msIn: minesweeperIn_pydantic):
     Returns:
         dict[str, str]: either error with specific information or succes with "Game successfully created"
     """
-    msIn = msIn.dict()
-
-    if msIn["n_cols"] <= 5:
-        return {"error": "Number of colums is too small"}
-    elif msIn["n_cols"] > 60:
-        return {"error": "Number of columns must be at or below 60"}
-    elif msIn["n_rows"] <= 5:
-        return {"error": "Number of rows is too small"}
-    elif msIn["n_rows"] > 60:
-        return {"error": "Number of rows must be at or below 60"}
-    elif msIn["n_mines"] < 1:
-        return {"error": "Number of mines too small"}
-    elif msIn["n_mines"] >= msIn["n_rows"]*msIn["n_cols"] - 9:
-        return {"error": "Number of mines too big"}
-    else:
-        await db_minesweeper.create(**msIn)
-        return {"success": "Game successfully created"}
+    with metrics.intent("create"):
+        return await create_game(msIn.dict())
+
+
+@router.get("/stats")
+async def stats():
+    """Returns gauges of the running games and connections on this process and the stats of the board pool.
+
+    Returns:
+        dict[str, dict[str, int]]: "games" with the gauges of lifecycle.py, "boards" with the board pool stats
+    """
+    return {"games": lifecycle.gauges(), "boards": boards.stats()}
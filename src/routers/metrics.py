@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..models.boardPool import boards
+from ..models.lifecycle import lifecycle
+from ..models.metrics import metrics, profiler
+
+router = APIRouter(prefix="", tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Returns the metrics of this process in the Prometheus text format, see models/metrics.py."""
+    gauges = {**lifecycle.gauges(), **{f"pool_{name}": value for name, value in boards.stats().items()}}
+    return metrics.render(gauges)
+
+
+@router.post("/metrics/profiler/start")
+async def start_profiler(interval: float = 0.005):
+    """Starts the sampling profiler.
+
+    Args:
+        interval (float): The seconds between two samples
+    """
+    profiler.start(interval)
+    return {"profiling": True}
+
+
+@router.post("/metrics/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler():
+    """Stops the sampling profiler and returns the sampled stacks in the collapsed flame graph format."""
+    return profiler.stop()
@@ -1,110 +1,180 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from numpy import ravel
-from typing import Dict
+from typing import Dict, Optional
 
-from ..models.db import db_minesweeper, minesweeper_pydantic, db_spot, spot_pydantic, msInWs_pydantic
+from ..models.db import db_minesweeper, minesweeper_pydantic, msInWs_pydantic
 from ..models.socketManager import WebsocketManager
-from .field import open, set_Flag
-from ..minesweeper import Minesweeper
+from ..models.eventBus import bus
+from ..models.gameActor import GameActor, board_message, resync_messages
+from ..models.gameStore import store
+from ..models.lifecycle import lifecycle
+from ..models.metrics import action
+from ..models.protocol import MAX_VIEWPORT_TILES, PROTOCOLS, tiled
+from ..minesweeper.game import tiles_in
 
 router = APIRouter(prefix="/ws", tags=["Websocket"])
 
-managers: Dict[str, WebsocketManager] = {}
+managers: Dict[str, WebsocketManager] = lifecycle.managers
+actors: Dict[str, GameActor] = lifecycle.actors
+
+
+def get_actor(code: int, manager: WebsocketManager) -> GameActor:
+    """Returns the actor that applies the intents of a game on this node, made on the first intent."""
+    lifecycle.touch(code)
+    actor = actors.get(str(code))
+    if actor is None:
+        actor = actors[str(code)] = GameActor(code, manager)
+    return actor
+
+
+def viewport_intent(manager: WebsocketManager, websocket: WebSocket, ms: dict, data: dict) -> Optional[dict]:
+    """Subscribes a connection to the tiles of its viewport and returns the intent that sends it the tiles it did
+    not have yet, None if there are none."""
+    if not tiled(ms["n_cols"], ms["n_rows"]):
+        manager.send(websocket, {"error": "Only tiled boards have viewports"})
+        return None
+    tiles = tiles_in(ms["n_cols"], ms["n_rows"], int(data["col"]), int(data["row"]), int(data["n_cols"]),
+                     int(data["n_rows"]))
+    if len(tiles) > MAX_VIEWPORT_TILES:
+        manager.send(websocket, {"error": f"A viewport can hold at most {MAX_VIEWPORT_TILES} tiles"})
+        return None
+    new = manager.set_viewport(websocket, tiles)
+    return {"intent": "tiles", "tiles": new} if new else None
+
+
+def get_manager(code: int) -> WebsocketManager:
+    """Returns the manager of the connections to a game on this node, made on the first connection."""
+    lifecycle.touch(code)
+    manager = managers.get(str(code))
+    if manager is None:
+        manager = managers[str(code)] = WebsocketManager(code=code, bus=bus)
+        manager.on_intent = lambda ws, name, data: get_actor(code, manager).submit(ws, name, data)
+    return manager
 
 
 @router.websocket("/game/{code}")
-async def ws_open(websocket: WebSocket, code: int):
+async def ws_open(websocket: WebSocket, code: int, protocol: str = "json", game_id: Optional[int] = None,
+                  version: Optional[int] = None):
     """The Websocket that is used for the entire game, to allow broadcasting one players actions to the other participants.
 
     Args:
         websocket (WebSocket): The Websocket used for the connection
         code (int): The Code that uniquely identifies a single game
+        protocol (str): "json" to get every spot as a dictionary, "compact" for packed boards and flat indices, see
+            protocol.py
+        game_id (int): The game_id of the last message a reconnecting player got
+        version (int): The version of the last message a reconnecting player got. If the game still has the changes
+            since then, only those are sent instead of the whole board, see gameActor.resync_messages
     """
     NAME: str = ""
+    compact = protocol == "compact"
+    # the queries of connecting are counted as joining, see metrics.py
+    action.set("join")
 
-    if str(code) not in managers.keys():
-        managers.update({str(code): WebsocketManager()})
-    await managers[str(code)].connect(websocket)
-
-    manager: WebsocketManager = managers[str(code)]
+    if protocol not in PROTOCOLS:
+        await websocket.accept()
+        await websocket.send_json({"error": f"Unknown protocol, use one of {', '.join(PROTOCOLS)}"})
+        return None
 
     field_exists = await db_minesweeper.exists(code=code)
-    spot_exists = await db_spot.exists(code=code, col=0, row=0)
+    if field_exists != True:
+        await websocket.accept()
+        await websocket.send_json({"error": "The Game you requested does not exist"})
+        return None
 
-    if spot_exists == True:
-        ms = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=code))
-        ms = ms.dict()
-        field = await spot_pydantic.from_queryset(db_spot.filter(code=code))
+    ms = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=code))
+    ms = ms.dict()
+    if tiled(ms["n_cols"], ms["n_rows"]) and not compact:
+        await websocket.accept()
+        await websocket.send_json({"error": "Boards of this size can only be played with the compact protocol"})
+        return None
 
-        field = [spot.dict() for spot in field]
-        await websocket.send_json({"field": field, "n_cols": ms["n_cols"], "n_rows": ms["n_rows"], "n_mines": ms["n_mines"]})
+    manager = get_manager(code)
+    await manager.subscribe()
 
-    elif field_exists == True:
-        ms = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=code))
-        ms = ms.dict()
-        await websocket.send_json({"n_cols": ms["n_cols"], "n_rows": ms["n_rows"], "n_mines": ms["n_mines"]})
+    if not manager.is_owner:
+        # the game is played on another node, which sends the board
+        await manager.connect(websocket, compact)
+        manager.forward(websocket, NAME, {"intent": "join", "compact": compact, "game_id": game_id, "version": version})
     else:
-        await websocket.send_json({"error": "The Game you requested does not exist"})
-        return None
+        # loads the board into memory, if there is one already
+        await store.get(code)
+        await manager.connect(websocket, compact)
+        # nothing is awaited between connecting and queueing the first messages, so no broadcast can get in between
+        game = store.games.get(code)
+        messages = resync_messages(game, game_id, version, compact)
+        for message in messages or [board_message(game, ms["n_cols"], ms["n_rows"], ms["n_mines"], compact)]:
+            manager.send(websocket, message)
 
     try:
         while True:
             data = await websocket.receive_json()
 
-            if data["intent"] == "open":
-                data["col"] = int(data["col"])
-                data["row"] = int(data["row"])
-
-                exists = await db_spot.exists(code=code, col=data["col"], row=data["row"])
-                if exists != True:
-                    ms_dict = await minesweeper_pydantic.from_queryset_single(db_minesweeper.get(code=code))
-                    ms_dict = ms_dict.dict()
-                    ms = Minesweeper(
-                        ms_dict["n_cols"],
-                        ms_dict["n_rows"],
-                        data["col"],
-                        data["row"]
-                    )
-                    ms.place_mines(ms_dict["n_mines"])
-                    default_values = {"opened": False,
-                                      "code": ms_dict["code"], "flagged": False}
-                    for spot in ravel(ms.field):
-                        db_sp_obj = await db_spot.create(**{**spot.get_db_attribs(), **default_values})
-
-                    field = await spot_pydantic.from_queryset(db_spot.filter(code=code))
-                    field = [spot.dict() for spot in field]
-                    await manager.broadcast({"field": field})
-
-                opened = await open(code, int(data["col"]), int(data["row"]))
-                if type(opened) == list:
-                    await manager.broadcast({"opened": opened})
-                else:
-                    if "game_status" in opened.keys():
-                        await manager.broadcast({"opened": opened, "message": f"{NAME} threw the game"})
-                    else:
-                        await manager.broadcast({"opened": opened})
-                    await db_spot.filter(code=code).delete()
-                    await db_minesweeper.filter(code=code).delete()
-
-            elif data["intent"] == "flag":
-                exists = await db_spot.exists(code=code, col=int(data["col"]), row=int(data["row"]))
-
-                if exists != True:
-                    await websocket.send_json({"error": "Can't set a flag on the first Move"})
+            if data["intent"] == "name":
+                NAME = data["name"]
+                continue
+            if data["intent"] == "tiles":
+                # only made by viewport_intent
+                continue
+            if data["intent"] == "viewport":
+                data = viewport_intent(manager, websocket, ms, data)
+                if data is None:
                     continue
+            if manager.is_owner:
+                get_actor(code, manager).submit(websocket, NAME, data)
+            else:
+                lifecycle.touch(code)
+                manager.forward(websocket, NAME, data)
+    except WebSocketDisconnect:
+        # TODO send message to other clients that sb disconnected
+        pass
+    finally:
+        manager.disconnect(websocket)
+        lifecycle.touch(code)
 
-                status = await set_Flag(code, int(data["col"]), int(data["row"]))
-
-                await manager.broadcast({"flagged": status})
-            elif data["intent"] == "restart":
-                await db_minesweeper.create(code=code,
-                                            n_cols=data["n_cols"],
-                                            n_rows=data["n_rows"],
-                                            solvable=False,
-                                            n_mines=data["n_mines"]
-                                            )
-            elif data["intent"] == "name":
-                NAME = data["name"]
+
+@router.websocket("/watch/{code}")
+async def ws_watch(websocket: WebSocket, code: int, game_id: Optional[int] = None, version: Optional[int] = None):
+    """The Websocket of a spectator, who watches a game in the compact protocol without playing. After the board the
+    changes come merged at most SPECTATOR_RATE times per second, see SpectatorFeed. Anything the spectator sends is
+    answered with an error.
+
+    Args:
+        websocket (WebSocket): The Websocket used for the connection
+        code (int): The Code that uniquely identifies a single game
+        game_id (int): The game_id of the last message a reconnecting spectator got
+        version (int): The version of the last message a reconnecting spectator got, see ws_open
+    """
+    action.set("join")
+    ms = await db_minesweeper.get_or_none(code=code)
+    if ms is None:
+        await websocket.accept()
+        await websocket.send_json({"error": "The Game you requested does not exist"})
+        return None
+    if tiled(ms.n_cols, ms.n_rows):
+        await websocket.accept()
+        await websocket.send_json({"error": "Boards of this size can not be watched"})
+        return None
+
+    manager = get_manager(code)
+    await manager.subscribe()
+
+    if not manager.is_owner:
+        await manager.connect(websocket, True, spectator=True, joining=True)
+        manager.forward(websocket, "", {"intent": "join", "compact": True, "game_id": game_id, "version": version})
+    else:
+        await store.get(code)
+        await manager.connect(websocket, True, spectator=True)
+        game = store.games.get(code)
+        messages = resync_messages(game, game_id, version, True)
+        for message in messages or [board_message(game, ms.n_cols, ms.n_rows, ms.n_mines, True)]:
+            manager.send(websocket, message)
+
+    try:
+        while True:
+            await websocket.receive_text()
+            manager.send(websocket, {"error": "Spectators can not play"})
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
-        # TODO send message to other clients that sb disconnected
+        lifecycle.touch(code)
@@ -0,0 +1,58 @@
+import asyncio
+
+from src.models.eventBus import Broker, SocketBus
+
+CODE = 7
+
+
+async def wait_for(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def connected_buses():
+    """Starts a broker on a free port and subscribes two nodes to CODE, returns the server and the received events."""
+    server = await Broker().start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    first, second = SocketBus([("127.0.0.1", port)]), SocketBus([("127.0.0.1", port)])
+    received = []
+    await first.subscribe(CODE, "first", lambda event: None)
+    await second.subscribe(CODE, "second", received.append)
+    return server, first, second, received
+
+
+def test_events_bigger_than_the_stream_limit_are_delivered():
+    async def run():
+        server, first, second, received = await connected_buses()
+        big = {"type": "broadcast", "json": ["x" * 300_000], "compact": None}
+        small = {"type": "broadcast", "json": ["y" * 1_000], "compact": None}
+        first.publish(CODE, "first", big)
+        first.publish(CODE, "first", small)
+        await wait_for(lambda: len(received) == 2)
+        assert received == [big, small]
+        await first.close()
+        await second.close()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_lost_connections_are_opened_and_subscribed_again():
+    async def run():
+        server, first, second, received = await connected_buses()
+        reader_task = second.readers[0]
+        second.owners.clear()
+        second.connections[0][1].close()
+        # the broker announces the owner again once the codes are subscribed again
+        await wait_for(lambda: second.readers[0] is not reader_task)
+        await wait_for(lambda: second.owner(CODE) == "first")
+        first.publish(CODE, "first", {"type": "broadcast", "json": None, "compact": "after"})
+        await wait_for(lambda: len(received) == 1)
+        assert received[0]["compact"] == "after"
+        await first.close()
+        await second.close()
+        server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,118 @@
+import asyncio
+
+from numpy import flatnonzero
+from tortoise import Tortoise
+
+from src.models.boardPool import boards
+from src.models.gameActor import GameActor, resync_messages
+from src.models.gameStore import store
+from src.models.lifecycle import create_game
+
+CODE = 31
+
+
+class Manager:
+    """Records what the actor sends instead of sending it."""
+    wants_json = True
+
+    def __init__(self) -> None:
+        self.sent, self.broadcasts = [], []
+
+    def send(self, websocket, message: dict):
+        self.sent.append((websocket, message))
+
+    async def broadcast(self, message: dict, compact: dict = None):
+        self.broadcasts.append(([message], compact))
+
+    async def broadcast_many(self, messages: list, compact: dict = None, tiles: dict = None, rest: dict = None):
+        self.broadcasts.append((messages, compact))
+
+
+def run(test, monkeypatch):
+    """Runs a test coroutine with an actor of a new 12x10 game on an in-memory database."""
+    async def is_solvable(ms) -> bool:
+        return False
+
+    monkeypatch.setattr(boards, "is_solvable", is_solvable)
+
+    async def with_database():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["src.models.db"]})
+        await Tortoise.generate_schemas()
+        await create_game({"code": CODE, "n_cols": 12, "n_rows": 10, "n_mines": 15, "solvable": False})
+        manager = Manager()
+        try:
+            await test(GameActor(CODE, manager), manager)
+        finally:
+            await store.delete(CODE)
+            await Tortoise.close_connections()
+    asyncio.run(with_database())
+
+
+def closed_safe(game) -> list:
+    return [divmod(i, game.n_cols) for i in flatnonzero(~game.opened.ravel() & ~game.mines.ravel()).tolist()]
+
+
+def mines(game) -> list:
+    """The flat indices of the mines, they stay closed whatever is opened."""
+    return flatnonzero(game.mines.ravel()).tolist()
+
+
+def test_the_changes_of_a_batch_go_out_together(monkeypatch):
+    async def test(actor: GameActor, manager: Manager):
+        await actor.apply([("a", "Ann", {"intent": "open", "col": 4, "row": 5})])
+        game = store.games[CODE]
+        col, row = closed_safe(game)[0]
+        mine = mines(game)[0]
+        before = set(flatnonzero(game.opened.ravel()).tolist())
+        await actor.apply([("a", "Ann", {"intent": "flag", "col": mine // game.n_cols, "row": mine % game.n_cols}),
+                           ("b", "Bob", {"intent": "open", "col": col, "row": row})])
+        messages, compact = manager.broadcasts[-1]
+        opened = set(flatnonzero(game.opened.ravel()).tolist()) - before
+        assert set(compact["opened"]) == opened
+        assert compact["flagged"] == [mine]
+        assert (compact["version"], compact["safe_left"], compact["flags"]) == (game.seq, game.safe_left, 1)
+        assert {spot["col"] * game.n_cols + spot["row"] for spot in messages[-1]["opened"]} == opened
+        assert messages[0]["flagged"] == {"success": True, "col": mine // game.n_cols, "row": mine % game.n_cols}
+    run(test, monkeypatch)
+
+
+def test_a_reconnecting_player_gets_the_changes_since_its_version(monkeypatch):
+    async def test(actor: GameActor, manager: Manager):
+        await actor.apply([("a", "Ann", {"intent": "open", "col": 4, "row": 5})])
+        game = store.games[CODE]
+        seq, before = game.seq, set(flatnonzero(game.opened.ravel()).tolist())
+        col, row = closed_safe(game)[0]
+        kept, removed = [divmod(mine, game.n_cols) for mine in mines(game)[:2]]
+        await actor.apply([("a", "Ann", {"intent": "flag", "col": kept[0], "row": kept[1]}),
+                           ("a", "Ann", {"intent": "flag", "col": removed[0], "row": removed[1]}),
+                           ("a", "Ann", {"intent": "flag", "col": removed[0], "row": removed[1]}),
+                           ("b", "Bob", {"intent": "open", "col": col, "row": row})])
+        opened = set(flatnonzero(game.opened.ravel()).tolist()) - before
+
+        [compact] = resync_messages(game, game.game_id, seq, True)
+        assert set(compact["opened"]) == opened
+        # the flag that was set and removed again is left out
+        assert compact["flagged"] == [kept[0] * game.n_cols + kept[1]] and "unflagged" not in compact
+        assert compact["version"] == game.seq
+        messages = resync_messages(game, game.game_id, seq, False)
+        assert {spot["col"] * game.n_cols + spot["row"] for spot in messages[0]["opened"]} == opened
+        assert messages[1]["flagged"] == {"success": True, "col": kept[0], "row": kept[1]}
+
+        assert resync_messages(game, game.game_id + 1, seq, True) is None
+        assert resync_messages(game, game.game_id, -1, True) is None
+    run(test, monkeypatch)
+
+
+def test_a_failing_intent_does_not_hold_back_the_others(monkeypatch):
+    async def test(actor: GameActor, manager: Manager):
+        await actor.apply([("a", "Ann", {"intent": "open", "col": 4, "row": 5})])
+        game = store.games[CODE]
+        col, row = closed_safe(game)[0]
+        n_broadcasts = len(manager.broadcasts)
+        await actor.apply([("a", "Ann", {"intent": "restart", "n_cols": 12, "n_rows": 10, "n_mines": 15}),
+                           ("b", "Bob", {"intent": "open", "col": "x", "row": 0}),
+                           ("b", "Bob", {"intent": "open", "col": col, "row": row})])
+        assert len(manager.broadcasts) == n_broadcasts + 1
+        assert game.opened[col, row]
+        assert [websocket for websocket, message in manager.sent if "error" in message] == ["a", "b"]
+    run(test, monkeypatch)
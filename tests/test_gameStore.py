@@ -0,0 +1,148 @@
+import asyncio
+import sqlite3
+
+from numpy import array_equal, flatnonzero
+from tortoise import Tortoise
+
+from src.minesweeper import Game, Minesweeper
+from src.models.db import db_event, db_minesweeper
+from src.models.gameStore import GameStore
+from src.models.migrations import migrate
+
+CODE = 21
+
+
+def run(test):
+    """Runs a test coroutine against a new in-memory database."""
+    async def with_database():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["src.models.db"]})
+        await Tortoise.generate_schemas()
+        try:
+            await test()
+        finally:
+            await Tortoise.close_connections()
+    asyncio.run(with_database())
+
+
+async def new_game(store: GameStore, seed: int = 3) -> Game:
+    """Makes the row and the first move of a 12x10 game, like GameActor.first_move."""
+    row = await db_minesweeper.create(code=CODE, n_cols=12, n_rows=10, n_mines=15, solvable=False)
+    ms = Minesweeper.from_seed(12, 10, 4, 5, 15, seed)
+    ms.solvable = False
+    game = store.create(CODE, ms, row.id)
+    await store._inserts[CODE]
+    game.open_spots(4, 5)
+    return game
+
+
+def play(game: Game, n_flags: int):
+    """Toggles flags on the first closed spots, one event each."""
+    for i in flatnonzero(~game.opened.ravel())[:n_flags].tolist():
+        game.flag(*divmod(i, game.n_cols))
+
+
+def assert_same(loaded: Game, game: Game):
+    assert array_equal(loaded.mines, game.mines)
+    assert array_equal(loaded.opened, game.opened)
+    assert array_equal(loaded.flagged, game.flagged)
+    assert (loaded.game_id, loaded.seq, loaded.safe_left, loaded.flags) == \
+           (game.game_id, game.seq, game.safe_left, game.flags)
+
+
+def test_a_game_is_replayed_from_the_log_after_a_crash():
+    async def test():
+        store = GameStore(snapshot_every=100)
+        game = await new_game(store)
+        play(game, 5)
+        await store.flush()
+        row = await db_minesweeper.get(code=CODE)
+        assert row.seq == 0
+        # the process died, a new one loads the game
+        assert_same(await GameStore().get(CODE), game)
+    run(test)
+
+
+def test_the_snapshot_is_written_every_snapshot_every_events():
+    async def test():
+        store = GameStore(snapshot_every=4)
+        game = await new_game(store)
+        play(game, 3)
+        await store.flush()
+        assert (await db_minesweeper.get(code=CODE)).seq == 4
+        play(game, 2)
+        await store.flush()
+        assert (await db_minesweeper.get(code=CODE)).seq == 4
+        assert await db_event.filter(game_id=game.game_id).count() == 6
+        assert_same(await GameStore().get(CODE), game)
+    run(test)
+
+
+def test_a_log_that_does_not_match_is_replaced_by_a_snapshot():
+    async def test():
+        store = GameStore(snapshot_every=100)
+        game = await new_game(store)
+        await db_event.create(game_id=game.game_id, seq=2, kind=0, col=0, row=0)
+        play(game, 2)
+        await store.flush()
+        assert (await db_minesweeper.get(code=CODE)).seq == game.seq
+        assert_same(await GameStore().get(CODE), game)
+    run(test)
+
+
+def test_a_reused_code_does_not_replay_the_events_of_the_game_before():
+    async def test():
+        store = GameStore(snapshot_every=100)
+        old = await new_game(store)
+        play(old, 6)
+        await store.flush()
+        await store.delete(CODE)
+        assert await db_event.filter(game_id=old.game_id).count() == 0
+        game = await new_game(store, seed=4)
+        play(game, 1)
+        await store.flush()
+        assert game.game_id != old.game_id
+        assert_same(await GameStore().get(CODE), game)
+    run(test)
+
+
+def test_a_baseline_database_is_migrated(tmp_path):
+    path = str(tmp_path / "minesweeper.sql")
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE "db_minesweeper" ("id" CHAR(36) NOT NULL PRIMARY KEY, "code" SMALLINT NOT NULL UNIQUE, '
+               '"n_cols" SMALLINT NOT NULL, "n_rows" SMALLINT NOT NULL, "solvable" INT NOT NULL, '
+               '"n_mines" SMALLINT NOT NULL)')
+    db.execute('CREATE TABLE "db_spot" ("id" CHAR(36) NOT NULL PRIMARY KEY, "code" SMALLINT NOT NULL, '
+               '"col" SMALLINT NOT NULL, "row" SMALLINT NOT NULL, "opened" INT NOT NULL, "mine" INT NOT NULL, '
+               '"n_mines" SMALLINT NOT NULL, "flagged" INT NOT NULL)')
+    board = Minesweeper.from_seed(8, 6, 2, 3, 7, 5)
+    game = Game(CODE, board.mines, board.neighbor_mines)
+    game.open_spots(2, 3)
+    game.flag(*divmod(int(flatnonzero(board.mines.ravel())[0]), 8))
+    db.execute('INSERT INTO "db_minesweeper" VALUES (?, ?, 8, 6, 0, 7)', ("uuid-board", CODE))
+    db.executemany('INSERT INTO "db_spot" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+        (f"uuid-{col}-{row}", CODE, col, row, int(game.opened[col, row]), int(game.mines[col, row]),
+         int(game.n_mines[col, row]), int(game.flagged[col, row]))
+        for col in range(6) for row in range(8)])
+    db.commit()
+    db.close()
+
+    migrate(path)
+    # migrating twice changes nothing
+    migrate(path)
+
+    async def load():
+        await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["src.models.db"]})
+        await Tortoise.generate_schemas(safe=True)
+        try:
+            loaded = await GameStore().get(CODE)
+            row = await db_minesweeper.get(code=CODE)
+            assert isinstance(row.id, int) and row.seed is None
+        finally:
+            await Tortoise.close_connections()
+        return loaded
+
+    loaded = asyncio.run(load())
+    assert array_equal(loaded.mines, game.mines)
+    assert array_equal(loaded.opened, game.opened)
+    assert array_equal(loaded.flagged, game.flagged)
+    assert loaded.safe_left == game.safe_left
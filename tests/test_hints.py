@@ -0,0 +1,64 @@
+from itertools import combinations
+
+from numpy import flatnonzero
+from numpy.random import default_rng
+
+from src.minesweeper import Game, Minesweeper
+from src.minesweeper.geometry import geometry
+from src.minesweeper.hints import HintEngine
+
+
+def brute_force(game: Game) -> dict:
+    """The mine probability of every closed spot, from every placement of all mines that fits the opened numbers."""
+    closed = flatnonzero(~game.opened.ravel()).tolist()
+    numbers = [(i, geometry(game.n_cols, game.n_rows).neighbors_of(i).tolist())
+               for i in flatnonzero(game.opened.ravel()).tolist()]
+    counts, total = dict.fromkeys(closed, 0), 0
+    for placement in combinations(closed, game.total_mines):
+        placed = set(placement)
+        if all(sum(j in placed for j in nbs) == game.n_mines.ravel()[i] for i, nbs in numbers):
+            total += 1
+            for spot in placement:
+                counts[spot] += 1
+    return {spot: count / total for spot, count in counts.items()}
+
+
+def games(n: int):
+    """Yields small games after their first move and after a second safe move."""
+    rng = default_rng(5)
+    for _ in range(n):
+        ms = Minesweeper(6, 5, int(rng.integers(5)), int(rng.integers(6)), int(rng.integers(2**32)))
+        ms.place_mines(int(rng.integers(3, 7)))
+        game = Game.from_minesweeper(1, ms)
+        game.open_spots(*ms.start_pos)
+        yield game, rng
+
+
+def test_hints_match_the_probabilities_of_every_placement():
+    for game, _ in games(30):
+        if game.won():
+            continue
+        hint = HintEngine(game).hint()
+        expected = brute_force(game)
+        assert all(expected[spot] == 0 for spot in hint["safe"])
+        assert all(expected[spot] == 1 for spot in hint["mines"])
+        for spot, p in zip(hint["spots"], hint["probabilities"]):
+            assert abs(p - expected.pop(spot)) <= 0.0015
+        # the closed spots next to no opened number
+        for p in expected.values():
+            assert abs(hint["other"] - p) <= 0.0015
+
+
+def test_an_updated_engine_gives_the_hint_of_a_new_one():
+    for game, rng in games(30):
+        engine = HintEngine(game)
+        engine.hint()
+        while not game.won():
+            safe = flatnonzero(~game.opened.ravel() & ~game.mines.ravel())
+            game.open_spots(*divmod(int(rng.choice(safe)), game.n_cols))
+            updated, fresh = engine.hint(), HintEngine(game).hint()
+            # the components may come in another order
+            assert dict(zip(updated["spots"], updated["probabilities"])) == \
+                   dict(zip(fresh["spots"], fresh["probabilities"]))
+            assert [updated[key] for key in ("safe", "mines", "other")] == \
+                   [fresh[key] for key in ("safe", "mines", "other")]
@@ -0,0 +1,53 @@
+import asyncio
+
+from src.models.eventBus import LocalBus
+from src.models.gameStore import store
+from src.models.lifecycle import GameLifecycle
+from src.models.socketManager import WebsocketManager
+
+CODE = 11
+
+
+def make_manager(lifecycle: GameLifecycle, bus: LocalBus) -> WebsocketManager:
+    manager = lifecycle.managers[str(CODE)] = WebsocketManager(code=CODE, bus=bus, node="node")
+    return manager
+
+
+def test_a_manager_that_subscribed_during_eviction_keeps_the_game(monkeypatch):
+    async def run():
+        bus, lifecycle = LocalBus(), GameLifecycle()
+        old = make_manager(lifecycle, bus)
+        await old.subscribe()
+        joined = []
+
+        async def evict(code: int) -> bool:
+            # somebody joins while the game is written
+            joined.append(make_manager(lifecycle, bus))
+            await joined[0].subscribe()
+            return True
+
+        monkeypatch.setattr(store, "evict", evict)
+        await lifecycle.evict(CODE)
+        assert joined[0].is_owner
+        assert bus.owner(CODE) == "node"
+        assert lifecycle.managers[str(CODE)] is joined[0]
+
+    asyncio.run(run())
+
+
+def test_a_game_that_could_not_be_written_stays_owned(monkeypatch):
+    async def run():
+        bus, lifecycle = LocalBus(), GameLifecycle()
+        manager = make_manager(lifecycle, bus)
+        await manager.subscribe()
+
+        async def evict(code: int) -> bool:
+            return False
+
+        monkeypatch.setattr(store, "evict", evict)
+        await lifecycle.evict(CODE)
+        assert manager.is_owner
+        assert lifecycle.managers[str(CODE)] is manager
+        assert lifecycle.evicted == 0
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+from src.models.gameActor import intent_name
+from src.models.metrics import Histogram
+
+
+def test_unknown_intents_share_one_label():
+    assert intent_name({"intent": "open", "double_click": True}) == "chord"
+    assert intent_name({"intent": "flag"}) == "flag"
+    assert intent_name({"intent": 'x"} 1\nfake_metric 1'}) == "unknown"
+    assert intent_name({}) == "unknown"
+
+
+def test_label_values_are_escaped():
+    histogram = Histogram("h", "A histogram.", "intent", buckets=(1,))
+    histogram.observe(0.5, 'a"b\\c\nd')
+    lines = histogram.render()
+    assert len(lines) == 6
+    assert lines[2] == 'h_bucket{intent="a\\"b\\\\c\\nd",le="1"} 1'
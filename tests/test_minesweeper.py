@@ -0,0 +1,110 @@
+from itertools import combinations
+
+from numpy import array, flatnonzero
+from numpy.random import default_rng
+
+from src.minesweeper import Game, Minesweeper
+from src.minesweeper.geometry import count_neighbors, geometry
+
+
+def test_seeds_give_the_same_mines_on_every_numpy_version():
+    # stored games are rebuilt from their seed, so these boards must never change
+    ms = Minesweeper.from_seed(9, 9, 4, 4, 10, 12345)
+    assert flatnonzero(ms.mines).tolist() == [13, 20, 21, 27, 28, 51, 53, 56, 71, 77]
+    ms = Minesweeper.from_seed(30, 16, 8, 15, 99, 2**62 + 7)
+    assert flatnonzero(ms.mines).tolist()[:12] == [1, 3, 6, 10, 13, 15, 16, 19, 20, 22, 25, 30]
+    assert ms.mines.sum() == 99
+
+
+def test_no_mines_around_the_start_spot():
+    ms = Minesweeper.from_seed(9, 9, 0, 8, 70, 1)
+    assert not ms.mines[0:2, 7:9].any()
+    assert ms.neighbor_mines[0, 8] == 0
+
+
+def reference_fill(game, seeds):
+    """Opens seeds and every spot connected to them over zeros, one spot after the other."""
+    opened, queue = set(), list(seeds)
+    while queue:
+        i = queue.pop()
+        if i in opened or game.opened.ravel()[i] or game.flagged.ravel()[i]:
+            continue
+        opened.add(i)
+        if game.n_mines.ravel()[i] == 0 and not game.mines.ravel()[i]:
+            queue.extend(geometry(game.n_cols, game.n_rows).neighbors_of(i).tolist())
+    return sorted(opened)
+
+
+def random_game(rng, max_side: int) -> Game:
+    n_rows, n_cols = rng.integers(6, max_side, 2)
+    mines = rng.random((n_rows, n_cols)) < rng.uniform(0.01, 0.2)
+    opened = (rng.random((n_rows, n_cols)) < 0.05) & ~mines
+    flagged = (rng.random((n_rows, n_cols)) < 0.02) & ~opened
+    return Game(1, mines, count_neighbors(mines), opened, flagged)
+
+
+def test_reveal_opens_what_a_plain_flood_fill_opens():
+    rng = default_rng(7)
+    # up to 100x100, so boards with and without geometry tables and rings of both sizes are filled
+    for _ in range(200):
+        game = random_game(rng, 100)
+        safe = flatnonzero(~game.mines.ravel())
+        seeds = rng.choice(safe, size=min(len(safe), int(rng.integers(1, 4))), replace=False)
+        expected = reference_fill(game, seeds.tolist())
+        safe_left = game.safe_left
+        opened = game.reveal(seeds)
+        assert opened.tolist() == expected
+        assert game.opened.ravel()[expected].all()
+        assert game.safe_left == safe_left - len(expected)
+
+
+def test_chording_opens_the_neighbors_of_a_satisfied_number():
+    rng = default_rng(8)
+    chorded = 0
+    for _ in range(100):
+        game = random_game(rng, 40)
+        game.flagged[:] = False
+        numbers = flatnonzero(game.opened.ravel() & (game.n_mines.ravel() > 0))
+        for i in numbers.tolist():
+            neighbors = geometry(game.n_cols, game.n_rows).neighbors_of(i)
+            game.flagged.ravel()[neighbors[game.mines.ravel()[neighbors]]] = True
+            closed = [j for j in neighbors.tolist() if not game.opened.ravel()[j] and not game.flagged.ravel()[j]]
+            expected = reference_fill(game, closed)
+            status, opened = game.chord_spots(*divmod(i, game.n_cols))
+            assert opened.tolist() == expected
+            assert status in ("playing", "won")
+            chorded += len(expected) > 0
+    assert chorded > 0
+
+
+def logic_solvable(ms: Minesweeper) -> bool:
+    """Plays a board by enumerating every placement of all mines on the closed spots and opening the spots that are
+    safe in all of them, the strongest logic there is."""
+    game = Game(1, ms.mines, ms.neighbor_mines)
+    game.flood_fill(*ms.start_pos)
+    while not game.won():
+        closed = flatnonzero(~game.opened.ravel()).tolist()
+        numbers = [(i, geometry(ms.n_cols, ms.n_rows).neighbors_of(i).tolist())
+                   for i in flatnonzero(game.opened.ravel()).tolist()]
+        safe = set(closed)
+        for placement in combinations(closed, game.total_mines):
+            placed = set(placement)
+            if all(sum(j in placed for j in nbs) == game.n_mines.ravel()[i] for i, nbs in numbers):
+                safe -= placed
+        if not safe:
+            return False
+        game.reveal(array(sorted(safe)))
+    return True
+
+
+def test_the_solver_only_calls_boards_solvable_that_logic_solves():
+    rng = default_rng(9)
+    solvable = 0
+    for _ in range(40):
+        ms = Minesweeper(5, 5, int(rng.integers(5)), int(rng.integers(5)), int(rng.integers(2**32)))
+        ms.place_mines(4)
+        # the solver raises ValueError if it ever opens a mine
+        if ms.test_solver():
+            solvable += 1
+            assert logic_solvable(ms)
+    assert solvable > 0
@@ -0,0 +1,17 @@
+from numpy import arange, zeros
+
+from src.minesweeper import Game
+from src.models.protocol import split_tiles
+
+
+def test_split_tiles_groups_the_changes_of_every_tile():
+    game = Game(1, zeros((70, 100), dtype=bool), zeros((70, 100), dtype="int8"))
+    opened = arange(0, 7000, 7)
+    rest, tiles = split_tiles(game, {"opened": opened, "unflagged": [6999], "safe_left": 3})
+    assert rest == {"safe_left": 3}
+    tile_of = game.tile_of(opened)
+    assert sorted(tile for tile, message in tiles.items() if "opened" in message) == sorted(set(tile_of.tolist()))
+    for tile, message in tiles.items():
+        if "opened" in message:
+            assert message["opened"] == opened[tile_of == tile].tolist()
+    assert tiles[game.tile_of(6999)]["unflagged"] == [6999]